@@ -1,22 +1,128 @@
 #include <Python.h>
 #include <string>
+#include <vector>
 #include <unordered_map>
 #include "../ChineseOfficialMahjongHelper/Classes/mahjong-algorithm/fan_calculator.h"
+#include "../ChineseOfficialMahjongHelper/Classes/mahjong-algorithm/shanten.h"
 
 using namespace std;
 
 static unordered_map<string, mahjong::tile_t> str2tile;
+// Integer tile codes 0..33: W1..W9, T1..T9, B1..B9, F1..F4, J1..J3
+static mahjong::tile_t int2tile[34];
+static int tile2int[256];
 
 static void MahjongInit() {
 	for(int i = 1; i <= 9; ++i) {
 		str2tile["W" + to_string(i)] = mahjong::make_tile(TILE_SUIT_CHARACTERS, i);
 		str2tile["B" + to_string(i)] = mahjong::make_tile(TILE_SUIT_DOTS, i);
 		str2tile["T" + to_string(i)] = mahjong::make_tile(TILE_SUIT_BAMBOO, i);
+		int2tile[i - 1] = mahjong::make_tile(TILE_SUIT_CHARACTERS, i);
+		int2tile[i + 8] = mahjong::make_tile(TILE_SUIT_BAMBOO, i);
+		int2tile[i + 17] = mahjong::make_tile(TILE_SUIT_DOTS, i);
 	}
-	for(int i = 1; i <= 4; ++i)
+	for(int i = 1; i <= 4; ++i) {
 		str2tile["F" + to_string(i)] = mahjong::make_tile(TILE_SUIT_HONORS, i);
-	for(int i = 1; i <= 3; ++i)
+		int2tile[i + 26] = mahjong::make_tile(TILE_SUIT_HONORS, i);
+	}
+	for(int i = 1; i <= 3; ++i) {
 		str2tile["J" + to_string(i)] = mahjong::make_tile(TILE_SUIT_HONORS, i + 4);
+		int2tile[i + 30] = mahjong::make_tile(TILE_SUIT_HONORS, i + 4);
+	}
+	for(int i = 0; i < 256; ++i) tile2int[i] = -1;
+	for(int i = 0; i < 34; ++i) tile2int[int2tile[i]] = i;
+}
+
+// Parse a tile given either as a string code or an integer code 0..33
+static mahjong::tile_t ParseTile(PyObject *obj) {
+	if(PyUnicode_Check(obj)) {
+		const char *tile = PyUnicode_AsUTF8(obj);
+		if(!tile || str2tile.find(tile) == str2tile.end()) throw "ERROE_WRONG_TILE_CODE";
+		return str2tile[tile];
+	}
+	long code = PyLong_AsLong(obj);
+	if(code == -1 && PyErr_Occurred()) {
+		PyErr_Clear();
+		throw "Tiles must be strs or ints!";
+	}
+	if(code < 0 || code >= 34) throw "ERROE_WRONG_TILE_CODE";
+	return int2tile[code];
+}
+
+static long ParseInt(PyObject *obj) {
+	long value = PyLong_AsLong(obj);
+	if(value == -1 && PyErr_Occurred()) {
+		PyErr_Clear();
+		throw "Record fields must be ints!";
+	}
+	return value;
+}
+
+// Parse a pack type given either as "CHI"/"PENG"/"GANG" or as PACK_TYPE_CHOW/PUNG/KONG (1/2/3)
+static int ParsePackType(PyObject *obj) {
+	if(PyUnicode_Check(obj)) {
+		const char *type = PyUnicode_AsUTF8(obj);
+		if(!type) throw "ERROE_WRONG_PACK_CODE";
+		if(!strcmp(type, "PENG")) return PACK_TYPE_PUNG;
+		if(!strcmp(type, "GANG")) return PACK_TYPE_KONG;
+		if(!strcmp(type, "CHI")) return PACK_TYPE_CHOW;
+		throw "ERROE_WRONG_PACK_CODE";
+	}
+	long type = ParseInt(obj);
+	if(type != PACK_TYPE_CHOW && type != PACK_TYPE_PUNG && type != PACK_TYPE_KONG) throw "ERROE_WRONG_PACK_CODE";
+	return type;
+}
+
+// Owns a new reference and releases it when going out of scope, so errors can be thrown freely
+struct PyRef {
+	PyObject *obj;
+	PyRef(PyObject *obj, const char *msg) : obj(obj) {
+		if(!obj) {
+			PyErr_Clear();
+			throw msg;
+		}
+	}
+	~PyRef() { Py_DECREF(obj); }
+};
+
+// Parse one record (pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind)
+// Returns false for more than 4 packs or 13 hand tiles, the record is then not parsed any further
+static bool ParseRecord(PyObject *record, mahjong::calculate_param_t &calculate_param) {
+	PyRef fields(PySequence_Fast(record, ""), "Each record must be a sequence!");
+	if(PySequence_Fast_GET_SIZE(fields.obj) != 10) throw "Each record must have 10 fields!";
+	PyObject **field = PySequence_Fast_ITEMS(fields.obj);
+	// Parse pack sequence
+	PyRef packs(PySequence_Fast(field[0], ""), "Record field `pack` must be a sequence!");
+	Py_ssize_t packSize = PySequence_Fast_GET_SIZE(packs.obj);
+	if(packSize > 4) return false;
+	calculate_param.hand_tiles.pack_count = packSize;
+	for(Py_ssize_t i = 0; i < packSize; ++i) {
+		PyRef pack(PySequence_Fast(PySequence_Fast_GET_ITEM(packs.obj, i), ""), "Each pack must be a sequence!");
+		if(PySequence_Fast_GET_SIZE(pack.obj) != 3) throw "Each pack must be of form (packType, tile, offer)!";
+		int packCode = ParsePackType(PySequence_Fast_GET_ITEM(pack.obj, 0));
+		mahjong::tile_t tile = ParseTile(PySequence_Fast_GET_ITEM(pack.obj, 1));
+		long offer = ParseInt(PySequence_Fast_GET_ITEM(pack.obj, 2));
+		if(offer < 0 || offer >= 4) throw "ERROE_WRONG_OFFER_CODE";
+		calculate_param.hand_tiles.fixed_packs[i] = mahjong::make_pack(offer, packCode, tile);
+	}
+	// Parse hand sequence
+	PyRef hands(PySequence_Fast(field[1], ""), "Record field `hand` must be a sequence!");
+	Py_ssize_t handSize = PySequence_Fast_GET_SIZE(hands.obj);
+	if(handSize > 13) return false;
+	calculate_param.hand_tiles.tile_count = handSize;
+	for(Py_ssize_t i = 0; i < handSize; ++i)
+		calculate_param.hand_tiles.standing_tiles[i] = ParseTile(PySequence_Fast_GET_ITEM(hands.obj, i));
+	// Other params
+	calculate_param.win_tile = ParseTile(field[2]);
+	calculate_param.flower_count = ParseInt(field[3]);
+	calculate_param.win_flag =
+		(ParseInt(field[4]) ? WIN_FLAG_SELF_DRAWN : 0) |
+		(ParseInt(field[5]) ? WIN_FLAG_4TH_TILE : 0) |
+		(ParseInt(field[6]) ? WIN_FLAG_ABOUT_KONG : 0) |
+		(ParseInt(field[7]) ? WIN_FLAG_WALL_LAST : 0);
+	calculate_param.seat_wind = (mahjong::wind_t)ParseInt(field[8]);
+	calculate_param.prevalent_wind = (mahjong::wind_t)ParseInt(field[9]);
+	return true;
 }
 
 static const char *doc = "Calculate Mahjong Fans.\n"
@@ -97,7 +203,10 @@ static PyObject *MahjongFanCalculator(PyObject *self, PyObject *args, PyObject *
 		calculate_param.prevalent_wind = (mahjong::wind_t)prevalentWind;
 		// Prepare results
 		mahjong::fan_table_t fan_table = {};
-		int re = mahjong::calculate_fan(&calculate_param, &fan_table);
+		int re;
+		Py_BEGIN_ALLOW_THREADS
+		re = mahjong::calculate_fan(&calculate_param, &fan_table);
+		Py_END_ALLOW_THREADS
 		switch(re) {
 			case -1: throw "ERROR_WRONG_TILES_COUNT";
 			case -2: throw "ERROR_TILE_COUNT_GREATER_THAN_4";
@@ -122,8 +231,240 @@ static PyObject *MahjongFanCalculator(PyObject *self, PyObject *args, PyObject *
 	}
 }
 
+static const char *batchDoc = "Calculate total fans of many hands at once.\n"
+"Parameters:\n"
+"\trecords - A sequence of records, each of which is a sequence of form\n"
+"\t\t(pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind)\n"
+"\t\twith the same meaning as the parameters of MahjongFanCalculator.\n"
+"\t\tTiles can be given as strs or as ints 0..33 in order W1..W9, T1..T9, B1..B9, F1..F4, J1..J3,\n"
+"\t\tpack types as \"CHI\"/\"PENG\"/\"GANG\" or as ints 1/2/3.\n"
+"Returns:\n"
+"\tA list with the total fan count of each record. Hands that cannot be scored get a negative value instead:\n"
+"\t-1 for wrong tile count, -2 for a tile used more than 4 times, -3 for not a win.\n"
+"Raises:"
+"\tTypeError - If any malformed record or invalid tile code is encountered.\n";
+
+static PyObject *MahjongFanCalculatorBatch(PyObject *self, PyObject *args) {
+	try {
+		PyObject *records = nullptr;
+		if(!PyArg_ParseTuple(args, "O", &records)) return nullptr;
+		vector<mahjong::calculate_param_t> params;
+		vector<int> fans;
+		{
+			PyRef items(PySequence_Fast(records, ""), "Param `records` must be a sequence!");
+			Py_ssize_t n = PySequence_Fast_GET_SIZE(items.obj);
+			params.resize(n);
+			fans.resize(n);
+			for(Py_ssize_t i = 0; i < n; ++i)
+				if(!ParseRecord(PySequence_Fast_GET_ITEM(items.obj, i), params[i])) fans[i] = -1; // wrong tile count
+		}
+		Py_ssize_t n = params.size();
+		// Calculate without holding the GIL, params are plain C++ data by now
+		Py_BEGIN_ALLOW_THREADS
+		for(Py_ssize_t i = 0; i < n; ++i) {
+			if(fans[i] < 0) continue;
+			mahjong::fan_table_t fan_table = {};
+			int re = mahjong::calculate_fan(&params[i], &fan_table);
+			if(re < 0) {
+				fans[i] = re;
+				continue;
+			}
+			int total = 0;
+			for(int j = 0; j < mahjong::FAN_TABLE_SIZE; j++)
+				total += mahjong::fan_value_table[j] * fan_table[j];
+			fans[i] = total;
+		}
+		Py_END_ALLOW_THREADS
+		PyObject *ans = PyList_New(n);
+		if(!ans) return nullptr;
+		for(Py_ssize_t i = 0; i < n; ++i)
+			PyList_SET_ITEM(ans, i, PyLong_FromLong(fans[i]));
+		return ans;
+	} catch (const char *msg) {
+		PyErr_SetString(PyExc_TypeError, msg);
+		return nullptr;
+	}
+}
+
+// Parse a sequence of standing tiles, at most 13 and no tile more than 4 times
+static void ParseHand(PyObject *obj, mahjong::hand_tiles_t &hand_tiles) {
+	PyRef hands(PySequence_Fast(obj, ""), "Param `hand` must be a sequence!");
+	Py_ssize_t handSize = PySequence_Fast_GET_SIZE(hands.obj);
+	if(handSize > 13) throw "ERROR_WRONG_TILES_COUNT";
+	hand_tiles.tile_count = handSize;
+	mahjong::tile_table_t cnt_table = {};
+	for(Py_ssize_t i = 0; i < handSize; ++i) {
+		mahjong::tile_t tile = ParseTile(PySequence_Fast_GET_ITEM(hands.obj, i));
+		if(++cnt_table[tile] > 4) throw "ERROR_TILE_COUNT_GREATER_THAN_4";
+		hand_tiles.standing_tiles[i] = tile;
+	}
+}
+
+// Useful table to a tuple of integer tile codes
+static PyObject *UsefulTiles(const mahjong::useful_table_t &useful_table) {
+	int l = 0;
+	for(int i = 0; i < 34; ++i)
+		if(useful_table[int2tile[i]]) ++l;
+	PyObject *ans = PyTuple_New(l);
+	if(!ans) return nullptr;
+	l = 0;
+	for(int i = 0; i < 34; ++i)
+		if(useful_table[int2tile[i]]) PyTuple_SET_ITEM(ans, l++, PyLong_FromLong(i));
+	return ans;
+}
+
+static const char *shantenDoc = "Calculate shanten of standing tiles for one winning form.\n"
+"Parameters:\n"
+"\thand - A sequence of at most 13 standing tiles, as strs or ints 0..33.\n"
+"Returns:\n"
+"\tA tuple of form (shanten, usefulTiles), where shanten is 0 when waiting\n"
+"\tand usefulTiles is a tuple of int tile codes that reduce the shanten.\n"
+"Raises:"
+"\tTypeError - If any invalid input is encountered.\n";
+
+typedef int (*shanten_func_t)(const mahjong::tile_t *, intptr_t, mahjong::useful_table_t *);
+
+static PyObject *Shanten(PyObject *args, shanten_func_t func) {
+	try {
+		PyObject *hand = nullptr;
+		if(!PyArg_ParseTuple(args, "O", &hand)) return nullptr;
+		mahjong::hand_tiles_t hand_tiles = {};
+		ParseHand(hand, hand_tiles);
+		mahjong::useful_table_t useful_table = {};
+		int shanten;
+		Py_BEGIN_ALLOW_THREADS
+		shanten = func(hand_tiles.standing_tiles, hand_tiles.tile_count, &useful_table);
+		Py_END_ALLOW_THREADS
+		PyObject *useful = UsefulTiles(useful_table);
+		if(!useful) return nullptr;
+		return Py_BuildValue("iN", shanten, useful);
+	} catch (const char *msg) {
+		PyErr_SetString(PyExc_TypeError, msg);
+		return nullptr;
+	}
+}
+
+static PyObject *BasicFormShanten(PyObject *self, PyObject *args) {
+	return Shanten(args, mahjong::basic_form_shanten);
+}
+
+static PyObject *SevenPairsShanten(PyObject *self, PyObject *args) {
+	return Shanten(args, mahjong::seven_pairs_shanten);
+}
+
+static PyObject *ThirteenOrphansShanten(PyObject *self, PyObject *args) {
+	return Shanten(args, mahjong::thirteen_orphans_shanten);
+}
+
+static PyObject *HonorsAndKnittedTilesShanten(PyObject *self, PyObject *args) {
+	return Shanten(args, mahjong::honors_and_knitted_tiles_shanten);
+}
+
+static PyObject *KnittedStraightShanten(PyObject *self, PyObject *args) {
+	return Shanten(args, mahjong::knitted_straight_shanten);
+}
+
+static const char *waitingDoc = "Calculate waiting tiles of standing tiles over all winning forms.\n"
+"Parameters:\n"
+"\thand - A sequence of at most 13 standing tiles, as strs or ints 0..33.\n"
+"Returns:\n"
+"\tA tuple of int tile codes that complete the hand, empty if not waiting.\n"
+"\tFans are not checked, so a waiting hand may still fail to reach 8 fans.\n"
+"Raises:"
+"\tTypeError - If any invalid input is encountered.\n";
+
+static PyObject *IsWaiting(PyObject *self, PyObject *args) {
+	try {
+		PyObject *hand = nullptr;
+		if(!PyArg_ParseTuple(args, "O", &hand)) return nullptr;
+		mahjong::hand_tiles_t hand_tiles = {};
+		ParseHand(hand, hand_tiles);
+		mahjong::useful_table_t useful_table = {};
+		bool waiting;
+		Py_BEGIN_ALLOW_THREADS
+		waiting = mahjong::is_waiting(hand_tiles, &useful_table);
+		Py_END_ALLOW_THREADS
+		if(!waiting) return PyTuple_New(0);
+		return UsefulTiles(useful_table);
+	} catch (const char *msg) {
+		PyErr_SetString(PyExc_TypeError, msg);
+		return nullptr;
+	}
+}
+
+static const char *enumDoc = "Enumerate shanten after each possible discard.\n"
+"Parameters:\n"
+"\thand - A sequence of at most 13 standing tiles, as strs or ints 0..33;\n"
+"\tservingTile - (Optional) the tile just drawn or claimed, default to be None to only evaluate hand;\n"
+"\tformFlag - (Optional) bitwise or of FORM_FLAG_* constants, default to be FORM_FLAG_ALL.\n"
+"Returns:\n"
+"\tA list of (discardTile, formFlag, shanten, usefulTiles), one per discard and winning form.\n"
+"\tdiscardTile is -1 when no servingTile is given. shanten is -1 if the hand is already a win.\n"
+"Raises:"
+"\tTypeError - If any invalid input is encountered.\n";
+
+struct EnumContext {
+	uint8_t form_flag;
+	vector<mahjong::enum_result_t> results;
+};
+
+static bool EnumCallback(void *context, const mahjong::enum_result_t *result) {
+	EnumContext *ctx = (EnumContext *)context;
+	// enum_discard_tile does not filter forms by itself
+	if(result->form_flag & ctx->form_flag) ctx->results.push_back(*result);
+	return true;
+}
+
+static PyObject *EnumDiscardTile(PyObject *self, PyObject *args, PyObject *kwargs) {
+	try {
+		static char *kwlist[] = {"hand", "servingTile", "formFlag", nullptr};
+		PyObject *hand = nullptr, *servingTile = Py_None;
+		int formFlag = FORM_FLAG_ALL;
+		if(!PyArg_ParseTupleAndKeywords(args, kwargs, "O|Oi", kwlist, &hand, &servingTile, &formFlag))
+			return nullptr;
+		mahjong::hand_tiles_t hand_tiles = {};
+		ParseHand(hand, hand_tiles);
+		mahjong::tile_t serving_tile = 0;
+		if(servingTile != Py_None) {
+			serving_tile = ParseTile(servingTile);
+			int cnt = 1;
+			for(intptr_t i = 0; i < hand_tiles.tile_count; ++i)
+				if(hand_tiles.standing_tiles[i] == serving_tile) ++cnt;
+			if(cnt > 4) throw "ERROR_TILE_COUNT_GREATER_THAN_4";
+		}
+		EnumContext context;
+		context.form_flag = formFlag;
+		Py_BEGIN_ALLOW_THREADS
+		mahjong::enum_discard_tile(&hand_tiles, serving_tile, formFlag, &context, EnumCallback);
+		Py_END_ALLOW_THREADS
+		PyObject *ans = PyList_New(context.results.size());
+		if(!ans) return nullptr;
+		for(size_t i = 0; i < context.results.size(); ++i) {
+			const mahjong::enum_result_t &result = context.results[i];
+			PyObject *useful = UsefulTiles(result.useful_table);
+			if(!useful) {
+				Py_DECREF(ans);
+				return nullptr;
+			}
+			PyList_SET_ITEM(ans, i, Py_BuildValue("iiiN", tile2int[result.discard_tile], result.form_flag, result.shanten, useful));
+		}
+		return ans;
+	} catch (const char *msg) {
+		PyErr_SetString(PyExc_TypeError, msg);
+		return nullptr;
+	}
+}
+
 static PyMethodDef methods[] = {
 	{"MahjongFanCalculator", (PyCFunction)(void(*)(void))MahjongFanCalculator, METH_VARARGS | METH_KEYWORDS, doc},
+	{"MahjongFanCalculatorBatch", (PyCFunction)MahjongFanCalculatorBatch, METH_VARARGS, batchDoc},
+	{"BasicFormShanten", (PyCFunction)BasicFormShanten, METH_VARARGS, shantenDoc},
+	{"SevenPairsShanten", (PyCFunction)SevenPairsShanten, METH_VARARGS, shantenDoc},
+	{"ThirteenOrphansShanten", (PyCFunction)ThirteenOrphansShanten, METH_VARARGS, shantenDoc},
+	{"HonorsAndKnittedTilesShanten", (PyCFunction)HonorsAndKnittedTilesShanten, METH_VARARGS, shantenDoc},
+	{"KnittedStraightShanten", (PyCFunction)KnittedStraightShanten, METH_VARARGS, shantenDoc},
+	{"IsWaiting", (PyCFunction)IsWaiting, METH_VARARGS, waitingDoc},
+	{"EnumDiscardTile", (PyCFunction)(void(*)(void))EnumDiscardTile, METH_VARARGS | METH_KEYWORDS, enumDoc},
 	{NULL, NULL, 0, NULL},
 };
 
@@ -137,5 +478,13 @@ static PyModuleDef module = {
 PyMODINIT_FUNC
 PyInit_MahjongGB(void) {
     MahjongInit();
-    return PyModule_Create(&module);
+    PyObject *m = PyModule_Create(&module);
+    if(!m) return nullptr;
+    PyModule_AddIntConstant(m, "FORM_FLAG_BASIC_FORM", FORM_FLAG_BASIC_FORM);
+    PyModule_AddIntConstant(m, "FORM_FLAG_SEVEN_PAIRS", FORM_FLAG_SEVEN_PAIRS);
+    PyModule_AddIntConstant(m, "FORM_FLAG_THIRTEEN_ORPHANS", FORM_FLAG_THIRTEEN_ORPHANS);
+    PyModule_AddIntConstant(m, "FORM_FLAG_HONORS_AND_KNITTED_TILES", FORM_FLAG_HONORS_AND_KNITTED_TILES);
+    PyModule_AddIntConstant(m, "FORM_FLAG_KNITTED_STRAIGHT", FORM_FLAG_KNITTED_STRAIGHT);
+    PyModule_AddIntConstant(m, "FORM_FLAG_ALL", FORM_FLAG_ALL);
+    return m;
 }
\ No newline at end of file
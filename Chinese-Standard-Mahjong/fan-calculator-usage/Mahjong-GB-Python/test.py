@@ -1,4 +1,4 @@
-from MahjongGB import MahjongFanCalculator
+from MahjongGB import MahjongFanCalculator, MahjongFanCalculatorBatch, BasicFormShanten, SevenPairsShanten, IsWaiting, EnumDiscardTile, FORM_FLAG_BASIC_FORM
 
 # Non-positional arguments
 print(MahjongFanCalculator((),("W1","W1","W1","W2","W2","W2","W3","W3","W3","W4","W4","W4","W5"),"W5",1,True,False,False,True,0,0))
@@ -46,4 +46,26 @@ try:
 except Exception as err:
     print(err)
 else:
-    print(ans)
\ No newline at end of file
+    print(ans)
+
+# Batch mode with integer tile codes, non-winning hands get negative values instead of exceptions
+print(MahjongFanCalculatorBatch((
+    ((), (0,0,0,1,1,1,2,2,2,3,3,3,4), 4, 1, True, False, False, True, 0, 0),
+    (((3,0,2),), (1,1,1,2,2,2,3,3,3,4), 4, 2, False, False, False, False, 0, 0),
+    ((("CHI","W1",0),), ("W2","W2","W2","W3","W3","W3","W4","W4","W4","W5"), "W7", 1, False, False, False, False, 0, 0),
+    ((), (0,0,0,1,1,1,2,2,2,3,3,3), 4, 1, True, False, False, True, 0, 0),
+    ((), (0,0,0,1,1,1,2,2,2,3,3,3,4,4), 4, 1, True, False, False, True, 0, 0),
+    (((1,1,0),(1,1,0),(1,1,0),(1,1,0),(1,1,0)), (4,), 4, 1, True, False, False, True, 0, 0)
+)))
+
+# Shanten and useful tiles, tiles are returned as ints
+print(BasicFormShanten(("W1","W1","W1","W2","W3","W4","W5","W6","W7","W8","W9","W9","W9")))
+print(SevenPairsShanten((0,0,1,1,2,2,3,3,4,4,5,5,27)))
+
+# Waiting tiles, empty if not waiting
+print(IsWaiting((0,0,1,1,2,2,3,3,4,4,5,5,27)))
+print(IsWaiting((0,2,4,6,8,9,11,13,15,17,27,29,31)))
+
+# Shanten after each discard with a drawn tile, basic form only
+for discardTile, formFlag, shanten, usefulTiles in EnumDiscardTile((0,1,2,9,10,11,18,19,20,27,27,28,29), 30, FORM_FLAG_BASIC_FORM):
+    print(discardTile, shanten, usefulTiles)
\ No newline at end of file
@@ -19,7 +19,8 @@ import sys
 if __name__ == '__main__':
     model = CNNModel()
     data_dir = 'model/model_2583.pt'
-    model.load_state_dict(torch.load(data_dir, map_location = torch.device('cpu'), weights_only=False))
+    checkpoint = torch.load(data_dir, map_location = torch.device('cpu'), weights_only=False)
+    model.load_state_dict(checkpoint.get('state_dict', checkpoint)) # full training checkpoint or bare state dict
     model.train(False)
     input() # 1
     while True:
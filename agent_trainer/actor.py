@@ -4,112 +4,114 @@ import torch
 
 from replay_buffer import ReplayBuffer
 from model_pool import ModelPoolClient
-from env import MahjongGBEnv
+from env import VectorMahjongGBEnv
 from feature import FeatureAgent
-from model import CNNModel
+from model import CNNModel, legal_actions
+from advantage import pad, unpad, gae
 
 class Actor(Process):
     
-    def __init__(self, config, replay_buffer):
+    def __init__(self, config, replay_buffer, inference_client = None):
         super(Actor, self).__init__()
         self.replay_buffer = replay_buffer
+        self.inference_client = inference_client # forward passes done by an InferenceServer if given
         self.config = config
         self.name = config.get('name', 'Actor-?')
+        self.actor_id = config.get('actor_id', 0) # replay buffer region written by this actor
         
     def run(self):
         torch.set_num_threads(1)
     
-        # connect to model pool
-        model_pool = ModelPoolClient(self.config['model_pool_name'])
-        
-        # create network model
-        model = CNNModel()
-        
-        # load initial model
-        version = model_pool.get_latest_model()
-        state_dict = model_pool.load_model(version)
-        model.load_state_dict(state_dict)
+        if self.inference_client is None:
+            # connect to model pool
+            model_pool = ModelPoolClient(self.config['model_pool_name'])
+            
+            # create network model
+            model = CNNModel()
+            
+            # load initial model
+            version = model_pool.get_latest_model()
+            while not model_pool.load_into(version, model):
+                version = model_pool.get_latest_model()
+            
+            model.train(False) # Batch Norm inference mode
+        model_id = None
         
-        # collect data
-        env = MahjongGBEnv(config = {'agent_clz': FeatureAgent})
-        policies = {player : model for player in env.agent_names} # all four players use the latest model
+        # collect data from several tables at once, all pending decisions share one forward pass
+        env = VectorMahjongGBEnv(config = {'agent_clz': FeatureAgent}, num_envs = self.config.get('envs_per_actor', 1))
+        new_episode = lambda: {agent_name: {
+            'state' : {
+                'observation': [],
+                'legal': []
+            },
+            'action' : [],
+            'log_prob' : [],
+            'value' : []
+        } for agent_name in env.agent_names}
+        episode_data = [new_episode() for i in range(env.num_envs)]
         
-        for episode in range(self.config['episodes_per_actor']):
-            # update model
-            latest = model_pool.get_latest_model()
-            if latest['id'] > version['id']:
-                state_dict = model_pool.load_model(latest)
-                model.load_state_dict(state_dict)
-                version = latest
+        obs = env.reset()
+        episode = 0
+        while episode < self.config['episodes_per_actor']:
+            # all players on all tables take action
+            if self.inference_client is not None:
+                actions, values, log_probs, model_id = self.inference_client.infer(obs)
+            else:
+                with torch.no_grad():
+                    logits, value = model({
+                        'observation': torch.from_numpy(obs['observation']),
+                        'legal': torch.from_numpy(obs['legal'])
+                    })
+                    action_dist = torch.distributions.Categorical(logits = logits)
+                    slots = action_dist.sample()
+                    log_probs = action_dist.log_prob(slots).numpy()
+                    actions = legal_actions(torch.from_numpy(obs['legal']), slots).numpy()
+                    values = value.squeeze(-1).numpy()
+                model_id = version['id']
+            for k, (i, agent_name) in enumerate(env.pending):
+                agent_data = episode_data[i][agent_name]
+                agent_data['state']['observation'].append(obs['observation'][k])
+                agent_data['state']['legal'].append(obs['legal'][k])
+                agent_data['action'].append(actions[k])
+                agent_data['log_prob'].append(log_probs[k])
+                agent_data['value'].append(values[k])
+            # interact with env
+            obs, rewards, dones = env.step(actions)
             
-            # run one episode and collect data
-            obs = env.reset()
-            episode_data = {agent_name: {
-                'state' : {
-                    'observation': [],
-                    'action_mask': []
-                },
-                'action' : [],
-                'reward' : [],
-                'value' : []
-            } for agent_name in env.agent_names}
-            done = False
-            while not done:
-                # each player take action
-                actions = {}
-                values = {}
-                for agent_name in obs:
-                    agent_data = episode_data[agent_name]
-                    state = obs[agent_name]
-                    agent_data['state']['observation'].append(state['observation'])
-                    agent_data['state']['action_mask'].append(state['action_mask'])
-                    state['observation'] = torch.tensor(state['observation'], dtype = torch.float).unsqueeze(0)
-                    state['action_mask'] = torch.tensor(state['action_mask'], dtype = torch.float).unsqueeze(0)
-                    model.train(False) # Batch Norm inference mode
-                    with torch.no_grad():
-                        logits, value = model(state)
-                        action_dist = torch.distributions.Categorical(logits = logits)
-                        action = action_dist.sample().item()
-                        value = value.item()
-                    actions[agent_name] = action
-                    values[agent_name] = value
-                    agent_data['action'].append(actions[agent_name])
-                    agent_data['value'].append(values[agent_name])
-                # interact with env
-                next_obs, rewards, done = env.step(actions)
-                for agent_name in rewards:
-                    episode_data[agent_name]['reward'].append(rewards[agent_name])
-                obs = next_obs
-            print(self.name, 'Episode', episode, 'Model', latest['id'], 'Reward', rewards)
+            finished = []
+            for i in np.flatnonzero(dones):
+                if episode == self.config['episodes_per_actor']: break
+                print(self.name, 'Episode', episode, 'Model', model_id, 'Reward', dict(zip(env.agent_names, rewards[i].tolist())))
+                episode += 1
+                for j, agent_name in enumerate(env.agent_names):
+                    if episode_data[i][agent_name]['action']:
+                        finished.append((episode_data[i][agent_name], rewards[i][j]))
+                episode_data[i] = new_episode()
             
-            # postprocessing episode data for each agent
-            for agent_name, agent_data in episode_data.items():
-                if len(agent_data['action']) < len(agent_data['reward']):
-                    agent_data['reward'].pop(0)
-                obs = np.stack(agent_data['state']['observation'])
-                mask = np.stack(agent_data['state']['action_mask'])
-                actions = np.array(agent_data['action'], dtype = np.int64)
-                rewards = np.array(agent_data['reward'], dtype = np.float32)
-                values = np.array(agent_data['value'], dtype = np.float32)
-                next_values = np.array(agent_data['value'][1:] + [0], dtype = np.float32)
-                
-                td_target = rewards + next_values * self.config['gamma']
-                td_delta = td_target - values
-                advs = []
-                adv = 0
-                for delta in td_delta[::-1]:
-                    adv = self.config['gamma'] * self.config['lambda'] * adv + delta
-                    advs.append(adv) # GAE
-                advs.reverse()
-                advantages = np.array(advs, dtype = np.float32)
+            if finished:
+                # postprocessing all seats of all finished tables at once, only the last action gets the final reward
+                value, lengths = pad([agent_data['value'] for agent_data, final in finished])
+                reward = np.zeros_like(value)
+                reward[np.arange(len(finished)), lengths - 1] = [final for agent_data, final in finished]
+                advantages, td_target = gae(reward, value, lengths, self.config['gamma'], self.config['lambda'])
                 
-                # send samples to replay_buffer (per agent)
+                # send samples to replay_buffer
                 self.replay_buffer.push({
                     'state': {
-                        'observation': obs,
-                        'action_mask': mask
+                        'observation': np.stack([o for agent_data, final in finished for o in agent_data['state']['observation']]),
+                        'legal': np.stack([m for agent_data, final in finished for m in agent_data['state']['legal']])
                     },
-                    'action': actions,
-                    'adv': advantages,
-                    'target': td_target
-                })
\ No newline at end of file
+                    'action': np.array([a for agent_data, final in finished for a in agent_data['action']], dtype = np.int64),
+                    'log_prob': np.array([p for agent_data, final in finished for p in agent_data['log_prob']], dtype = np.float32),
+                    'adv': unpad(advantages, lengths),
+                    'target': unpad(td_target, lengths)
+                }, self.actor_id)
+            
+            # update model
+            if self.inference_client is None and dones.any():
+                latest = model_pool.get_latest_model()
+                if latest['id'] > version['id']:
+                    # copied in place, retry with the newest model if the learner overwrote it meanwhile
+                    while not model_pool.load_into(latest, model):
+                        latest = model_pool.get_latest_model()
+                    version = latest
@@ -0,0 +1,48 @@
+import numpy as np
+
+'''
+GAE over many trajectories at once.
+
+Trajectories of different lengths are padded into (B, T) arrays. With delta_t = r_t + gamma * V_{t+1} - V_t,
+the advantage A_t = sum_k (gamma * lambda)^k delta_{t+k} is a discount filter over delta, computed as one
+product with an upper triangular (T, T) matrix of powers of gamma * lambda instead of a reversed Python loop.
+Padding has delta = 0, so it never leaks into real steps.
+'''
+
+def pad(sequences, dtype = np.float32):
+    # list of 1-d arrays -> ((B, T) array padded with 0, lengths)
+    lengths = np.array([len(seq) for seq in sequences], dtype = np.int64)
+    padded = np.zeros((len(sequences), max(lengths, default = 0)), dtype = dtype)
+    for i, seq in enumerate(sequences):
+        padded[i, : len(seq)] = seq
+    return padded, lengths
+
+def unpad(padded, lengths):
+    # (B, T) array -> concatenation of the first lengths[i] items of each row
+    return padded[np.arange(padded.shape[1]) < lengths[:, None]]
+
+def discount_matrix(T, discount):
+    # D[i, j] = discount ** (j - i) for j >= i, else 0
+    k = np.arange(T)
+    power = k[None, :] - k[:, None]
+    return np.where(power >= 0, float(discount) ** np.maximum(power, 0), 0).astype(np.float32)
+
+def gae(rewards, values, lengths, gamma, lam, bootstrap = None):
+    '''
+    rewards, values: (B, T) padded arrays, lengths: (B, )
+    bootstrap: (B, ) value of the state after the last step of each trajectory, for truncated
+        episodes; None (or 0) for episodes that terminated.
+    returns: (advantages, td_targets), both (B, T) with zeros in the padding
+    '''
+    B, T = rewards.shape
+    valid = np.arange(T) < lengths[:, None]
+    next_values = np.zeros((B, T), dtype = np.float32)
+    next_values[:, : -1] = values[:, 1 :]
+    if bootstrap is None:
+        bootstrap = np.zeros(B, dtype = np.float32)
+    last = np.maximum(lengths - 1, 0)
+    next_values[np.arange(B), last] = bootstrap
+    targets = np.where(valid, rewards + gamma * next_values, 0).astype(np.float32)
+    deltas = np.where(valid, targets - values, 0).astype(np.float32)
+    advantages = deltas @ discount_matrix(T, gamma * lam).T
+    return advantages, targets
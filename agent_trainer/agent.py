@@ -1,3 +1,86 @@
+# Tiles are encoded as ints 0..33 in this order
+TILE_LIST = [
+    *('W%d'%(i+1) for i in range(9)),
+    *('T%d'%(i+1) for i in range(9)),
+    *('B%d'%(i+1) for i in range(9)),
+    *('F%d'%(i+1) for i in range(4)),
+    *('J%d'%(i+1) for i in range(3))
+]
+OFFSET_TILE = {c : i for i, c in enumerate(TILE_LIST)}
+
+# Kinds of structured events and decisions, the integer equivalent of request/response strings
+WIND, DEAL, HUANG, DRAW, PLAYER_DRAW, PLAY, CHI, PENG, GANG, ANGANG, BUGANG, UNCHI, UNPENG, HU, INVALID, PASS = range(16)
+
+PLAYER_EVENTS = {
+    'Draw' : PLAYER_DRAW,
+    'Play' : PLAY,
+    'Chi' : CHI,
+    'Peng' : PENG,
+    'Gang' : GANG,
+    'AnGang' : ANGANG,
+    'BuGang' : BUGANG,
+    'UnChi' : UNCHI,
+    'UnPeng' : UNPENG,
+    'Hu' : HU,
+    'Invalid' : INVALID
+}
+PLAYER_EVENT_NAMES = {kind : name for name, kind in PLAYER_EVENTS.items()}
+
+'''
+Events are tuples (kind, player, arg), player being -1 for events without one.
+    Wind 0..3           (WIND, -1, wind)
+    Deal XX XX ...      (DEAL, -1, (tile, tile, ...))
+    Huang               (HUANG, -1, -1)
+    Draw XX             (DRAW, -1, tile)
+    Player N Draw       (PLAYER_DRAW, N, -1)
+    Player N Play XX    (PLAY, N, tile)
+    ...
+Player events without a tile carry -1 as arg.
+'''
+def request2event(request):
+    t = request.split()
+    if t[0] == 'Wind': return (WIND, -1, int(t[1]))
+    if t[0] == 'Deal': return (DEAL, -1, tuple(OFFSET_TILE[tile] for tile in t[1:]))
+    if t[0] == 'Huang': return (HUANG, -1, -1)
+    if t[0] == 'Draw': return (DRAW, -1, OFFSET_TILE[t[1]])
+    if t[0] != 'Player' or t[2] not in PLAYER_EVENTS:
+        raise NotImplementedError('Unknown request %s!' % request)
+    return (PLAYER_EVENTS[t[2]], int(t[1]), OFFSET_TILE[t[3]] if len(t) > 3 else -1)
+
+def event2request(event):
+    kind, player, arg = event
+    if kind == WIND: return 'Wind %d' % arg
+    if kind == DEAL: return ' '.join(['Deal', *(TILE_LIST[tile] for tile in arg)])
+    if kind == HUANG: return 'Huang'
+    if kind == DRAW: return 'Draw %s' % TILE_LIST[arg]
+    if arg < 0: return 'Player %d %s' % (player, PLAYER_EVENT_NAMES[kind])
+    return 'Player %d %s %s' % (player, PLAYER_EVENT_NAMES[kind], TILE_LIST[arg])
+
+'''
+Decisions are tuples (kind, tile), tile being -1 for decisions without one.
+    Pass        (PASS, -1)
+    Hu          (HU, -1)
+    Play XX     (PLAY, tile)
+    Chi XX      (CHI, middle tile)
+    Peng        (PENG, -1)
+    Gang        (GANG, -1)
+    Gang XX     (ANGANG, tile)
+    BuGang XX   (BUGANG, tile)
+'''
+def response2decision(response):
+    t = response.split()
+    tile = OFFSET_TILE[t[1]] if len(t) > 1 else -1
+    if t[0] == 'Gang' and tile >= 0: return (ANGANG, tile)
+    if t[0] == 'Pass': return (PASS, -1)
+    return (PLAYER_EVENTS[t[0]], tile)
+
+def decision2response(decision):
+    kind, tile = decision
+    if kind == PASS: return 'Pass'
+    if kind == ANGANG: return 'Gang %s' % TILE_LIST[tile]
+    if tile < 0: return PLAYER_EVENT_NAMES[kind]
+    return '%s %s' % (PLAYER_EVENT_NAMES[kind], TILE_LIST[tile])
+
 class MahjongGBAgent:
 
     observation_space = None
@@ -30,6 +113,10 @@ class MahjongGBAgent:
     def request2obs(self, request):
         pass
     
+    # Fast path taking a structured event, falls back to the request string
+    def event2obs(self, event):
+        return self.request2obs(event2request(event))
+    
     '''
     Hu
     Play XX
@@ -41,4 +128,8 @@ class MahjongGBAgent:
     Pass
     '''
     def action2response(self, action):
-        pass
\ No newline at end of file
+        pass
+    
+    # Fast path returning a decision tuple, falls back to the response string
+    def action2decision(self, action):
+        return response2decision(self.action2response(action))
@@ -0,0 +1,78 @@
+from queue import Queue
+import os
+import re
+import threading
+import torch
+
+def snapshot(obj):
+    # copy of a (nested) state dict with every tensor cloned to CPU, so training can go on while it is written
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy = True)
+    if isinstance(obj, dict):
+        return {key : snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+class CheckpointWriter:
+    
+    '''
+    Writes checkpoints on a background thread.
+    
+    save(step, state) snapshots state in memory and returns; the writer thread saves it to a temp file
+    and renames it to path_format % step, so a checkpoint on disk is always complete. Only the last
+    keep_last checkpoints matching path_format are kept (all if None). At most max_pending snapshots
+    wait for the disk, further saves block.
+    '''
+    
+    def __init__(self, path_format, keep_last = None, max_pending = 2):
+        self.path_format = path_format
+        self.keep_last = keep_last
+        directory = os.path.dirname(path_format)
+        if directory: os.makedirs(directory, exist_ok = True)
+        self.steps = self._existing()
+        self.queue = Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+    
+    def _existing(self):
+        directory = os.path.dirname(self.path_format) or '.'
+        pattern = re.compile(re.escape(os.path.basename(self.path_format)).replace('%d', r'(\d+)') + '$')
+        return sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(directory)) if m)
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: break
+            step, state = item
+            path = self.path_format % step
+            try:
+                torch.save(state, path + '.tmp')
+                os.replace(path + '.tmp', path)
+                if step in self.steps: self.steps.remove(step)
+                self.steps.append(step)
+                while self.keep_last and len(self.steps) > self.keep_last:
+                    os.remove(self.path_format % self.steps.pop(0))
+            except Exception as e:
+                self.error = e
+    
+    def save(self, step, state):
+        if self.error: raise self.error
+        self.queue.put((step, snapshot(state)))
+    
+    def latest(self):
+        # path of the newest checkpoint on disk, or None
+        steps = self._existing()
+        return self.path_format % steps[-1] if steps else None
+    
+    def load_latest(self, map_location = 'cpu'):
+        path = self.latest()
+        if path is None: return None
+        return torch.load(path, map_location = map_location, weights_only = False)
+    
+    def close(self):
+        # wait for pending writes
+        self.queue.put(None)
+        self.thread.join()
+        if self.error: raise self.error
@@ -1,13 +1,8 @@
-from agent import MahjongGBAgent
+from agent import *
+from fan import fan_cache
 
 import random
-from collections import defaultdict
-
-try:
-    from MahjongGB import MahjongFanCalculator
-except:
-    print('MahjongGB library required! Please visit https://github.com/ailab-pku/PyMahjongGB for more information.')
-    raise
+import numpy as np
 
 class Error(Exception):
     pass
@@ -38,26 +33,26 @@ class MahjongGBEnv():
         # Init prevalent wind
         self.prevalentWind = random.randint(0, 3) if prevalentWind < 0 else prevalentWind
         for agent in self.agents:
-            agent.request2obs('Wind %d' % self.prevalentWind)
+            agent.event2obs((WIND, -1, self.prevalentWind))
         # Prepare tile wall
         if tileWall:
-            self.tileWall = tileWall.split()
+            self.tileWall = [OFFSET_TILE[tile] for tile in tileWall.split()]
         else:
             self.tileWall = []
             for j in range(4):
-                for i in range(1, 10):
-                    self.tileWall.append('W' + str(i))
-                    self.tileWall.append('B' + str(i))
-                    self.tileWall.append('T' + str(i))
-                for i in range(1, 5):
-                    self.tileWall.append('F' + str(i))
-                for i in range(1, 4):
-                    self.tileWall.append('J' + str(i))
+                for i in range(9):
+                    self.tileWall.append(OFFSET_TILE['W1'] + i)
+                    self.tileWall.append(OFFSET_TILE['B1'] + i)
+                    self.tileWall.append(OFFSET_TILE['T1'] + i)
+                for i in range(4):
+                    self.tileWall.append(OFFSET_TILE['F1'] + i)
+                for i in range(3):
+                    self.tileWall.append(OFFSET_TILE['J1'] + i)
             random.shuffle(self.tileWall)
-        self.originalTileWall = ' '.join(self.tileWall)
+        self.originalTileWall = ' '.join(TILE_LIST[tile] for tile in self.tileWall)
         if self.duplicate:
             self.tileWall = [self.tileWall[i * 34 : (i + 1) * 34] for i in range(4)]
-        self.shownTiles = defaultdict(int)
+        self.shownTiles = [0] * 34
         # Deal cards
         self._deal()
         return self._obs()
@@ -66,57 +61,56 @@ class MahjongGBEnv():
         try:
             if self.state == 0:
                 # After Chi/Peng, prepare to Play
-                response = self.agents[self.curPlayer].action2response(action_dict[self.agent_names[self.curPlayer]]).split()
-                if response[0] == 'Play':
-                    self._discard(self.curPlayer, response[1])
+                kind, tile = self.agents[self.curPlayer].action2decision(action_dict[self.agent_names[self.curPlayer]])
+                if kind == PLAY:
+                    self._discard(self.curPlayer, tile)
                 else:
                     raise Error(self.curPlayer)
                 self.isAboutKong = False
             elif self.state == 1:
                 # After Draw, prepare to Hu/Play/Gang/BuGang
-                response = self.agents[self.curPlayer].action2response(action_dict[self.agent_names[self.curPlayer]]).split()
-                if response[0] == 'Hu':
+                kind, tile = self.agents[self.curPlayer].action2decision(action_dict[self.agent_names[self.curPlayer]])
+                if kind == HU:
                     self.shownTiles[self.curTile] += 1
                     self._checkMahjong(self.curPlayer, isSelfDrawn = True, isAboutKong = self.isAboutKong)
-                elif response[0] == 'Play':
-                    self.hands[self.curPlayer].append(self.curTile)
-                    self._discard(self.curPlayer, response[1])
-                elif response[0] == 'Gang' and not self.myWallLast and not self.wallLast:
-                    self._concealedKong(self.curPlayer, response[1])
-                elif response[0] == 'BuGang' and not self.myWallLast and not self.wallLast:
-                    self._promoteKong(self.curPlayer, response[1])
+                elif kind == PLAY:
+                    self.hands[self.curPlayer][self.curTile] += 1
+                    self._discard(self.curPlayer, tile)
+                elif kind == ANGANG and not self.myWallLast and not self.wallLast:
+                    self._concealedKong(self.curPlayer, tile)
+                elif kind == BUGANG and not self.myWallLast and not self.wallLast:
+                    self._promoteKong(self.curPlayer, tile)
                 else:
                     raise Error(self.curPlayer)
             elif self.state == 2:
                 # After Play, prepare to Chi/Peng/Gang/Hu/Pass
-                responses = {i : self.agents[i].action2response(action_dict[self.agent_names[i]]) for i in range(4) if i != self.curPlayer}
-                t = {i : responses[i].split() for i in responses}
+                t = {i : self.agents[i].action2decision(action_dict[self.agent_names[i]]) for i in range(4) if i != self.curPlayer}
                 # Priority: Hu > Peng/Gang > Chi
                 for j in range(1, 4):
                     i = (self.curPlayer + j) % 4
-                    if t[i][0] == 'Hu':
+                    if t[i][0] == HU:
                         self._checkMahjong(i)
                         break
                 else:
                     for j in range(1, 4):
                         i = (self.curPlayer + j) % 4
-                        if t[i][0] == 'Gang' and self._canDrawTile(i) and not self.wallLast:
+                        if t[i][0] == GANG and self._canDrawTile(i) and not self.wallLast:
                             self._kong(i, self.curTile)
                             break
-                        elif t[i][0] == 'Peng' and not self.wallLast:
+                        elif t[i][0] == PENG and not self.wallLast:
                             self._pung(i, self.curTile)
                             break
                     else:
                         i = (self.curPlayer + 1) % 4
-                        if t[i][0] == 'Chi' and not self.wallLast:
+                        if t[i][0] == CHI and not self.wallLast:
                             self._chow(i, t[i][1])
                         else:
                             for j in range(1, 4):
                                 i = (self.curPlayer + j) % 4
-                                if t[i][0] != 'Pass': raise Error(i)
+                                if t[i][0] != PASS: raise Error(i)
                             if self.wallLast:
                                 # A draw
-                                self.obs = {i : self.agents[i].request2obs('Huang') for i in range(4)}
+                                self.obs = {i : self.agents[i].event2obs((HUANG, -1, -1)) for i in range(4)}
                                 self.reward = [0, 0, 0, 0]
                                 self.done = True
                             else:
@@ -125,20 +119,20 @@ class MahjongGBEnv():
                                 self._draw(self.curPlayer)
             elif self.state == 3:
                 # After BuGang, prepare to Hu/Pass
-                responses = {i : self.agents[i].action2response(action_dict[self.agent_names[i]]) for i in range(4) if i != self.curPlayer}
+                responses = {i : self.agents[i].action2decision(action_dict[self.agent_names[i]])[0] for i in range(4) if i != self.curPlayer}
                 for j in range(1, 4):
                     i = (self.curPlayer + j) % 4
-                    if responses[i] == 'Hu':
+                    if responses[i] == HU:
                         self._checkMahjong(i, isAboutKong = True)
                         break
                 else:
                     for j in range(1, 4):
                         i = (self.curPlayer + j) % 4
-                        if responses[i] != 'Pass': raise Error(i)
+                        if responses[i] != PASS: raise Error(i)
                     self._draw(self.curPlayer)
         except Error as e:
             player = e.args[0]
-            self.obs = {i : self.agents[i].request2obs('Player %d Invalid' % player) for i in range(4)}
+            self.obs = {i : self.agents[i].event2obs((INVALID, player, -1)) for i in range(4)}
             self.reward = [10] * 4
             self.reward[player] = -30
             self.done = True
@@ -172,9 +166,13 @@ class MahjongGBEnv():
             while len(hand) < 13:
                 tile = self._drawTile(i)
                 hand.append(tile)
-            self.hands.append(hand)
+            # hands are kept as tile counts
+            counts = [0] * 34
+            for tile in hand:
+                counts[tile] += 1
+            self.hands.append(counts)
             self.packs.append([])
-            self.agents[i].request2obs(' '.join(['Deal', *hand]))
+            self.agents[i].event2obs((DEAL, -1, tuple(hand)))
         self.curPlayer = 0
         self.drawAboutKong = False
         self._draw(self.curPlayer)
@@ -189,23 +187,24 @@ class MahjongGBEnv():
         self.curTile = tile
         for i in range(4):
             if i != player:
-                self.agents[i].request2obs('Player %d Draw' % player)
-        self.obs = {player : self.agents[player].request2obs('Draw %s' % tile)}
+                self.agents[i].event2obs((PLAYER_DRAW, player, -1))
+        self.obs = {player : self.agents[player].event2obs((DRAW, -1, tile))}
     
     def _discard(self, player, tile):
-        if tile not in self.hands[player]: raise Error(player)
-        self.hands[player].remove(tile)
+        if not self.hands[player][tile]: raise Error(player)
+        self.hands[player][tile] -= 1
         self.shownTiles[tile] += 1
         self.wallLast = not self._canDrawTile((player + 1) % 4)
         self.curTile = tile
         self.state = 2
-        self.agents[player].request2obs('Player %d Play %s' % (player, tile))
-        self.obs = {i : self.agents[i].request2obs('Player %d Play %s' % (player, tile)) for i in range(4) if i != player}
+        event = (PLAY, player, tile)
+        self.agents[player].event2obs(event)
+        self.obs = {i : self.agents[i].event2obs(event) for i in range(4) if i != player}
     
     def _kong(self, player, tile):
-        self.hands[player].append(self.curTile)
-        if self.hands[player].count(tile) < 4: raise Error(player)
-        for i in range(4): self.hands[player].remove(tile)
+        self.hands[player][self.curTile] += 1
+        if self.hands[player][tile] < 4: raise Error(player)
+        self.hands[player][tile] -= 4
         # offer: 0 for self, 123 for up/oppo/down
         self.packs[player].append(('GANG', tile, (player + 4 - self.curPlayer) % 4))
         self.shownTiles[tile] = 4
@@ -213,13 +212,13 @@ class MahjongGBEnv():
         self.drawAboutKong = True
         self.isAboutKong = False
         for agent in self.agents:
-            agent.request2obs('Player %d Gang' % player)
+            agent.event2obs((GANG, player, -1))
         self._draw(player)
     
     def _pung(self, player, tile):
-        self.hands[player].append(self.curTile)
-        if self.hands[player].count(tile) < 3: raise Error(player)
-        for i in range(3): self.hands[player].remove(tile)
+        self.hands[player][self.curTile] += 1
+        if self.hands[player][tile] < 3: raise Error(player)
+        self.hands[player][tile] -= 3
         # offer: 0 for self, 123 for up/oppo/down
         self.packs[player].append(('PENG', tile, (player + 4 - self.curPlayer) % 4))
         self.shownTiles[tile] += 2
@@ -227,32 +226,31 @@ class MahjongGBEnv():
         self.curPlayer = player
         for i in range(4):
             if i != player:
-                self.agents[i].request2obs('Player %d Peng' % player)
-        self.obs = {player : self.agents[player].request2obs('Player %d Peng' % player)}
+                self.agents[i].event2obs((PENG, player, -1))
+        self.obs = {player : self.agents[player].event2obs((PENG, player, -1))}
     
     def _chow(self, player, tile):
-        self.hands[player].append(self.curTile)
+        self.hands[player][self.curTile] += 1
         self.shownTiles[self.curTile] -= 1
-        color = tile[0]
-        num = int(tile[1])
+        if tile >= OFFSET_TILE['F1'] or not 0 < tile % 9 < 8: raise Error(player)
         for i in range(-1, 2):
-            t = color + str(num + i)
-            if t not in self.hands[player]: raise Error(player)
-            self.hands[player].remove(t)
+            t = tile + i
+            if not self.hands[player][t]: raise Error(player)
+            self.hands[player][t] -= 1
             self.shownTiles[t] += 1
         # offer: 123 for which tile is offered
-        self.packs[player].append(('CHI', tile, int(self.curTile[1]) - num + 2))
+        self.packs[player].append(('CHI', tile, self.curTile - tile + 2))
         self.state = 0
         self.curPlayer = player
         for i in range(4):
             if i != player:
-                self.agents[i].request2obs('Player %d Chi %s' % (player, tile))
-        self.obs = {player : self.agents[player].request2obs('Player %d Chi %s' % (player, tile))}
+                self.agents[i].event2obs((CHI, player, tile))
+        self.obs = {player : self.agents[player].event2obs((CHI, player, tile))}
     
     def _concealedKong(self, player, tile):
-        self.hands[player].append(self.curTile)
-        if self.hands[player].count(tile) < 4: raise Error(player)
-        for i in range(4): self.hands[player].remove(tile)
+        self.hands[player][self.curTile] += 1
+        if self.hands[player][tile] < 4: raise Error(player)
+        self.hands[player][tile] -= 4
         # offer: 0 for self, 123 for up/oppo/down
         self.packs[player].append(('GANG', tile, (player + 4 - self.curPlayer) % 4))
         self.shownTiles[tile] = 4
@@ -261,18 +259,18 @@ class MahjongGBEnv():
         self.isAboutKong = False
         for i in range(4):
             if i != player:
-                self.agents[i].request2obs('Player %d AnGang' % player)
-        self.agents[player].request2obs('Player %d AnGang %s' % (player, tile))
+                self.agents[i].event2obs((ANGANG, player, -1))
+        self.agents[player].event2obs((ANGANG, player, tile))
         self._draw(player)
     
     def _promoteKong(self, player, tile):
-        self.hands[player].append(self.curTile)
+        self.hands[player][self.curTile] += 1
         idx = -1
         for i in range(len(self.packs[player])):
             if self.packs[player][i][0] == 'PENG' and self.packs[player][i][1] == tile:
                 idx = i
         if idx < 0: raise Error(player)
-        self.hands[player].remove(tile)
+        self.hands[player][tile] -= 1
         offer = self.packs[player][idx][2]
         self.packs[player][idx] = ('GANG', tile, offer)
         self.shownTiles[tile] = 4
@@ -281,36 +279,81 @@ class MahjongGBEnv():
         self.curTile = tile
         self.drawAboutKong = True
         self.isAboutKong = False
-        self.agents[player].request2obs('Player %d BuGang %s' % (player, tile))
-        self.obs = {i : self.agents[i].request2obs('Player %d BuGang %s' % (player, tile)) for i in range(4) if i != player}
+        event = (BUGANG, player, tile)
+        self.agents[player].event2obs(event)
+        self.obs = {i : self.agents[i].event2obs(event) for i in range(4) if i != player}
     
     def _checkMahjong(self, player, isSelfDrawn = False, isAboutKong = False):
-        try:
-            fans = MahjongFanCalculator(
-                pack = tuple(self.packs[player]),
-                hand = tuple(self.hands[player]),
-                winTile = self.curTile,
-                flowerCount = 0,
-                isSelfDrawn = isSelfDrawn,
-                is4thTile = (self.shownTiles[self.curTile] + isSelfDrawn) == 4,
-                isAboutKong = isAboutKong,
-                isWallLast = self.wallLast,
-                seatWind = player,
-                prevalentWind = self.prevalentWind,
-                verbose = True
-            )
-            fanCnt = 0
-            for fanPoint, cnt, fanName, fanNameEn in fans:
-                fanCnt += fanPoint * cnt
-            if fanCnt < 8: raise Error('Not Enough Fans')
-            self.obs = {i : self.agents[i].request2obs('Player %d Hu' % player) for i in range(4)}
-            if isSelfDrawn:
-                self.reward = [-(8 + fanCnt)] * 4
-                self.reward[player] = (8 + fanCnt) * 3
-            else:
-                self.reward = [-8] * 4
-                self.reward[player] = 8 * 3 + fanCnt
-                self.reward[self.curPlayer] -= fanCnt
-            self.done = True
-        except Exception as e:
-            raise Error(player)
\ No newline at end of file
+        fanCnt = fan_cache.fan_count(
+            pack = self.packs[player],
+            hand = self.hands[player],
+            winTile = self.curTile,
+            flowerCount = 0,
+            isSelfDrawn = isSelfDrawn,
+            is4thTile = (self.shownTiles[self.curTile] + isSelfDrawn) == 4,
+            isAboutKong = isAboutKong,
+            isWallLast = self.wallLast,
+            seatWind = player,
+            prevalentWind = self.prevalentWind
+        )
+        if fanCnt < 8: raise Error(player)
+        self.obs = {i : self.agents[i].event2obs((HU, player, -1)) for i in range(4)}
+        if isSelfDrawn:
+            self.reward = [-(8 + fanCnt)] * 4
+            self.reward[player] = (8 + fanCnt) * 3
+        else:
+            self.reward = [-8] * 4
+            self.reward[player] = 8 * 3 + fanCnt
+            self.reward[self.curPlayer] -= fanCnt
+        self.done = True
+
+class VectorMahjongGBEnv():
+    
+    '''
+    Run several MahjongGBEnv tables side by side.
+    
+    Decisions pending on all tables are flattened into one batch: reset() and step() return
+    stacked observation/legal arrays, and self.pending[k] = (table, agent_name) tells which
+    table and seat row k belongs to. step() takes one action per row, in the same order.
+    Finished tables are reset automatically, so the batch always covers every table.
+    '''
+    
+    def __init__(self, config, num_envs):
+        self.num_envs = num_envs
+        self.envs = [MahjongGBEnv(config) for i in range(num_envs)]
+        self.agent_names = MahjongGBEnv.agent_names
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+    
+    def reset(self):
+        self.obs = [env.reset() for env in self.envs]
+        return self._stack()
+    
+    def step(self, actions):
+        '''
+        actions: one action per row of the last returned batch
+        returns: (obs, rewards, dones)
+            obs - stacked observation/legal of the new pending decisions
+            rewards - float32 array of shape (num_envs, 4), final rewards of the tables finished in this step
+            dones - bool array of shape (num_envs,), tables finished (and reset) in this step
+        '''
+        action_dicts = [{} for i in range(self.num_envs)]
+        for (i, agent_name), action in zip(self.pending, actions):
+            action_dicts[i][agent_name] = int(action)
+        rewards = np.zeros((self.num_envs, 4), dtype = np.float32)
+        dones = np.zeros(self.num_envs, dtype = bool)
+        for i, env in enumerate(self.envs):
+            obs, reward, done = env.step(action_dicts[i])
+            if done:
+                rewards[i] = [reward[agent_name] for agent_name in self.agent_names]
+                dones[i] = True
+                obs = env.reset()
+            self.obs[i] = obs
+        return self._stack(), rewards, dones
+    
+    def _stack(self):
+        self.pending = [(i, agent_name) for i, obs in enumerate(self.obs) for agent_name in obs]
+        return {
+            'observation': np.stack([self.obs[i][agent_name]['observation'] for i, agent_name in self.pending]),
+            'legal': np.stack([self.obs[i][agent_name]['legal'] for i, agent_name in self.pending])
+        }
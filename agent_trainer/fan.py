@@ -0,0 +1,101 @@
+from agent import TILE_LIST
+from collections import OrderedDict
+
+try:
+    from MahjongGB import MahjongFanCalculator
+except:
+    print('MahjongGB library required! Please visit https://github.com/ailab-pku/PyMahjongGB for more information.')
+    raise
+
+'''
+Records are tuples (pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind)
+with integer tiles. MahjongFanCalculatorBatch returns the total fan count of each record,
+or a negative value for hands that are not a win.
+'''
+ERROR_CODES = {
+    'ERROR_WRONG_TILES_COUNT' : -1,
+    'ERROR_TILE_COUNT_GREATER_THAN_4' : -2,
+    'ERROR_NOT_WIN' : -3
+}
+
+try:
+    from MahjongGB import MahjongFanCalculatorBatch
+except ImportError:
+    # Builds without the batch API (e.g. the one on Botzone) only score one hand per call and raise on non-wins
+    def MahjongFanCalculatorBatch(records):
+        fans = []
+        for pack, hand, winTile, *flags in records:
+            try:
+                result = MahjongFanCalculator(
+                    tuple((packType, TILE_LIST[tile], offer) for packType, tile, offer in pack),
+                    tuple(TILE_LIST[tile] for tile in hand),
+                    TILE_LIST[winTile],
+                    *flags
+                )
+                fans.append(sum(fanCount for fanCount, fanName in result))
+            except TypeError as e:
+                if str(e) not in ERROR_CODES: raise
+                fans.append(ERROR_CODES[str(e)])
+        return fans
+
+def fan_count(pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind):
+    # pack: ((packType, tile, offer), ...), hand: 34 tile counts; returns negative for non-winning hands
+    hand = [tile for tile in range(34) for i in range(hand[tile])]
+    return MahjongFanCalculatorBatch(((pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind), ))[0]
+
+try:
+    from MahjongGB import IsWaiting
+except ImportError:
+    # Without shanten bindings every tile has to be tried by the fan calculator
+    def IsWaiting(hand):
+        return tuple(range(34))
+
+def waiting_tiles(hand):
+    # hand: 34 tile counts of standing tiles; returns the set of tiles completing any winning form
+    return set(IsWaiting([tile for tile in range(34) for i in range(hand[tile])]))
+
+def fan_count_batch(records, executor = None, chunkSize = 256):
+    # Score records with integer tiles, splitting them over a thread pool if given; MahjongGB releases the GIL while scoring
+    if executor is None or len(records) <= chunkSize:
+        return MahjongFanCalculatorBatch(records)
+    chunks = [records[i : i + chunkSize] for i in range(0, len(records), chunkSize)]
+    return [fanCnt for fans in executor.map(MahjongFanCalculatorBatch, chunks) for fanCnt in fans]
+
+class FanCache():
+    
+    '''
+    Bounded LRU cache of fan counts. Fan scoring is pure, so the count only depends on
+    (packs, hand multiset, winTile, flags), which recur a lot across self-play games.
+    Keys use hand counts as bytes and sorted packs, so equal states share an entry.
+    '''
+    
+    def __init__(self, capacity = 65536):
+        self.capacity = capacity
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def fan_count(self, pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind):
+        # same arguments as fan_count
+        key = (tuple(sorted(pack)), bytes(hand), winTile, flowerCount, bool(isSelfDrawn), bool(is4thTile), bool(isAboutKong), bool(isWallLast), seatWind, prevalentWind)
+        fanCnt = self.cache.get(key)
+        if fanCnt is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return fanCnt
+        self.misses += 1
+        fanCnt = fan_count(pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind)
+        self.cache[key] = fanCnt
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last = False)
+        return fanCnt
+    
+    def info(self):
+        return {'hits' : self.hits, 'misses' : self.misses, 'size' : len(self.cache), 'capacity' : self.capacity}
+    
+    def clear(self):
+        self.cache.clear()
+        self.hits = self.misses = 0
+
+# shared by all agents and envs in a process
+fan_cache = FanCache()
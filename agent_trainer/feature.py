@@ -1,24 +1,22 @@
-from agent import MahjongGBAgent
-from collections import defaultdict
+from agent import *
+from fan import fan_cache, waiting_tiles
 import numpy as np
 
-try:
-    from MahjongGB import MahjongFanCalculator
-except:
-    print('MahjongGB library required! Please visit https://github.com/ailab-pku/PyMahjongGB for more information.')
-    raise
-
 class FeatureAgent(MahjongGBAgent):
     
     '''
-    observation: 6*4*9
+    observation: 6*4*9 int8
         (men+quan+hand4)*4*9
-    action_mask: 235
+    action_mask: 235 bool
         pass1+hu1+discard34+chi63(3*7*3)+peng34+gang34+angang34+bugang34
+    legal: MAX_LEGAL int16
+        sorted indices of legal actions, padded with -1
     '''
     
     OBS_SIZE = 6
     ACT_SIZE = 235
+    # at most 14 discards + hu + 3 angang + 4 bugang are legal at once
+    MAX_LEGAL = 32
     
     OFFSET_OBS = {
         'SEAT_WIND' : 0,
@@ -35,24 +33,21 @@ class FeatureAgent(MahjongGBAgent):
         'AnGang' : 167,
         'BuGang' : 201
     }
-    TILE_LIST = [
-        *('W%d'%(i+1) for i in range(9)),
-        *('T%d'%(i+1) for i in range(9)),
-        *('B%d'%(i+1) for i in range(9)),
-        *('F%d'%(i+1) for i in range(4)),
-        *('J%d'%(i+1) for i in range(3))
-    ]
-    OFFSET_TILE = {c : i for i, c in enumerate(TILE_LIST)}
+    TILE_LIST = TILE_LIST
+    OFFSET_TILE = OFFSET_TILE
+    # HAND_PLANES[k][c] is set when a tile held c times fills the k-th hand plane
+    HAND_PLANES = np.array([[int(k < c) for c in range(5)] for k in range(4)], dtype = np.int8)
     
     def __init__(self, seatWind):
         self.seatWind = seatWind
         self.packs = [[] for i in range(4)]
         self.history = [[] for i in range(4)]
         self.tileWall = [21] * 4
-        self.shownTiles = defaultdict(int)
+        self.shownTiles = [0] * 34
         self.wallLast = False
         self.isAboutKong = False
-        self.obs = np.zeros((self.OBS_SIZE, 36))
+        self.waitingHand = None
+        self.obs = np.zeros((self.OBS_SIZE, 36), dtype = np.int8)
         self.obs[self.OFFSET_OBS['SEAT_WIND']][self.OFFSET_TILE['F%d' % (self.seatWind + 1)]] = 1
     
     '''
@@ -77,57 +72,63 @@ class FeatureAgent(MahjongGBAgent):
     Player N(me) Chi XX
     '''
     def request2obs(self, request):
-        t = request.split()
-        if t[0] == 'Wind':
-            self.prevalentWind = int(t[1])
+        return self.event2obs(request2event(request))
+    
+    def event2obs(self, event):
+        kind, player, arg = event
+        if kind == WIND:
+            self.prevalentWind = arg
             self.obs[self.OFFSET_OBS['PREVALENT_WIND']][self.OFFSET_TILE['F%d' % (self.prevalentWind + 1)]] = 1
             return
-        if t[0] == 'Deal':
-            self.hand = t[1:]
+        if kind == DEAL:
+            self.hand = [0] * 34
+            for tile in arg:
+                self.hand[tile] += 1
             self._hand_embedding_update()
             return
-        if t[0] == 'Huang':
+        if kind == HUANG:
             self.valid = []
             return self._obs()
-        if t[0] == 'Draw':
+        if kind == DRAW:
             # Available: Hu, Play, AnGang, BuGang
             self.tileWall[0] -= 1
             self.wallLast = self.tileWall[1] == 0
-            tile = t[1]
+            tile = arg
             self.valid = []
             if self._check_mahjong(tile, isSelfDrawn = True, isAboutKong = self.isAboutKong):
                 self.valid.append(self.OFFSET_ACT['Hu'])
             self.isAboutKong = False
-            self.hand.append(tile)
+            self.hand[tile] += 1
             self._hand_embedding_update()
-            for tile in set(self.hand):
-                self.valid.append(self.OFFSET_ACT['Play'] + self.OFFSET_TILE[tile])
-                if self.hand.count(tile) == 4 and not self.wallLast and self.tileWall[0] > 0:
-                    self.valid.append(self.OFFSET_ACT['AnGang'] + self.OFFSET_TILE[tile])
+            for tile in range(34):
+                if not self.hand[tile]: continue
+                self.valid.append(self.OFFSET_ACT['Play'] + tile)
+                if self.hand[tile] == 4 and not self.wallLast and self.tileWall[0] > 0:
+                    self.valid.append(self.OFFSET_ACT['AnGang'] + tile)
             if not self.wallLast and self.tileWall[0] > 0:
                 for packType, tile, offer in self.packs[0]:
-                    if packType == 'PENG' and tile in self.hand:
-                        self.valid.append(self.OFFSET_ACT['BuGang'] + self.OFFSET_TILE[tile])
+                    if packType == 'PENG' and self.hand[tile]:
+                        self.valid.append(self.OFFSET_ACT['BuGang'] + tile)
             return self._obs()
         # Player N Invalid/Hu/Draw/Play/Chi/Peng/Gang/AnGang/BuGang XX
-        p = (int(t[1]) + 4 - self.seatWind) % 4
-        if t[2] == 'Draw':
+        p = (player + 4 - self.seatWind) % 4
+        if kind == PLAYER_DRAW:
             self.tileWall[p] -= 1
             self.wallLast = self.tileWall[(p + 1) % 4] == 0
             return
-        if t[2] == 'Invalid':
+        if kind == INVALID:
             self.valid = []
             return self._obs()
-        if t[2] == 'Hu':
+        if kind == HU:
             self.valid = []
             return self._obs()
-        if t[2] == 'Play':
+        if kind == PLAY:
             self.tileFrom = p
-            self.curTile = t[3]
+            self.curTile = arg
             self.shownTiles[self.curTile] += 1
             self.history[p].append(self.curTile)
             if p == 0:
-                self.hand.remove(self.curTile)
+                self.hand[self.curTile] -= 1
                 self._hand_embedding_update()
                 return
             else:
@@ -136,109 +137,104 @@ class FeatureAgent(MahjongGBAgent):
                 if self._check_mahjong(self.curTile):
                     self.valid.append(self.OFFSET_ACT['Hu'])
                 if not self.wallLast:
-                    if self.hand.count(self.curTile) >= 2:
-                        self.valid.append(self.OFFSET_ACT['Peng'] + self.OFFSET_TILE[self.curTile])
-                        if self.hand.count(self.curTile) == 3 and self.tileWall[0]:
-                            self.valid.append(self.OFFSET_ACT['Gang'] + self.OFFSET_TILE[self.curTile])
-                    color = self.curTile[0]
-                    if p == 3 and color in 'WTB':
-                        num = int(self.curTile[1])
-                        tmp = []
-                        for i in range(-2, 3): tmp.append(color + str(num + i))
-                        if tmp[0] in self.hand and tmp[1] in self.hand:
-                            self.valid.append(self.OFFSET_ACT['Chi'] + 'WTB'.index(color) * 21 + (num - 3) * 3 + 2)
-                        if tmp[1] in self.hand and tmp[3] in self.hand:
-                            self.valid.append(self.OFFSET_ACT['Chi'] + 'WTB'.index(color) * 21 + (num - 2) * 3 + 1)
-                        if tmp[3] in self.hand and tmp[4] in self.hand:
-                            self.valid.append(self.OFFSET_ACT['Chi'] + 'WTB'.index(color) * 21 + (num - 1) * 3)
+                    if self.hand[self.curTile] >= 2:
+                        self.valid.append(self.OFFSET_ACT['Peng'] + self.curTile)
+                        if self.hand[self.curTile] == 3 and self.tileWall[0]:
+                            self.valid.append(self.OFFSET_ACT['Gang'] + self.curTile)
+                    color = self.curTile // 9
+                    if p == 3 and color < 3:
+                        num = self.curTile % 9
+                        hand = self.hand
+                        tile = self.curTile
+                        if num >= 2 and hand[tile - 2] and hand[tile - 1]:
+                            self.valid.append(self.OFFSET_ACT['Chi'] + color * 21 + (num - 2) * 3 + 2)
+                        if 1 <= num <= 7 and hand[tile - 1] and hand[tile + 1]:
+                            self.valid.append(self.OFFSET_ACT['Chi'] + color * 21 + (num - 1) * 3 + 1)
+                        if num <= 6 and hand[tile + 1] and hand[tile + 2]:
+                            self.valid.append(self.OFFSET_ACT['Chi'] + color * 21 + num * 3)
                 self.valid.append(self.OFFSET_ACT['Pass'])
                 return self._obs()
-        if t[2] == 'Chi':
-            tile = t[3]
-            color = tile[0]
-            num = int(tile[1])
-            self.packs[p].append(('CHI', tile, int(self.curTile[1]) - num + 2))
+        if kind == CHI:
+            tile = arg
+            self.packs[p].append(('CHI', tile, self.curTile - tile + 2))
             self.shownTiles[self.curTile] -= 1
             for i in range(-1, 2):
-                self.shownTiles[color + str(num + i)] += 1
+                self.shownTiles[tile + i] += 1
             self.wallLast = self.tileWall[(p + 1) % 4] == 0
             if p == 0:
                 # Available: Play
                 self.valid = []
-                self.hand.append(self.curTile)
+                self.hand[self.curTile] += 1
                 for i in range(-1, 2):
-                    self.hand.remove(color + str(num + i))
+                    self.hand[tile + i] -= 1
                 self._hand_embedding_update()
-                for tile in set(self.hand):
-                    self.valid.append(self.OFFSET_ACT['Play'] + self.OFFSET_TILE[tile])
+                for tile in range(34):
+                    if self.hand[tile]:
+                        self.valid.append(self.OFFSET_ACT['Play'] + tile)
                 return self._obs()
             else:
                 return
-        if t[2] == 'UnChi':
-            tile = t[3]
-            color = tile[0]
-            num = int(tile[1])
+        if kind == UNCHI:
+            tile = arg
             self.packs[p].pop()
             self.shownTiles[self.curTile] += 1
             for i in range(-1, 2):
-                self.shownTiles[color + str(num + i)] -= 1
+                self.shownTiles[tile + i] -= 1
             if p == 0:
                 for i in range(-1, 2):
-                    self.hand.append(color + str(num + i))
-                self.hand.remove(self.curTile)
+                    self.hand[tile + i] += 1
+                self.hand[self.curTile] -= 1
                 self._hand_embedding_update()
             return
-        if t[2] == 'Peng':
+        if kind == PENG:
             self.packs[p].append(('PENG', self.curTile, (4 + p - self.tileFrom) % 4))
             self.shownTiles[self.curTile] += 2
             self.wallLast = self.tileWall[(p + 1) % 4] == 0
             if p == 0:
                 # Available: Play
                 self.valid = []
-                for i in range(2):
-                    self.hand.remove(self.curTile)
+                self.hand[self.curTile] -= 2
                 self._hand_embedding_update()
-                for tile in set(self.hand):
-                    self.valid.append(self.OFFSET_ACT['Play'] + self.OFFSET_TILE[tile])
+                for tile in range(34):
+                    if self.hand[tile]:
+                        self.valid.append(self.OFFSET_ACT['Play'] + tile)
                 return self._obs()
             else:
                 return
-        if t[2] == 'UnPeng':
+        if kind == UNPENG:
             self.packs[p].pop()
             self.shownTiles[self.curTile] -= 2
             if p == 0:
-                for i in range(2):
-                    self.hand.append(self.curTile)
+                self.hand[self.curTile] += 2
                 self._hand_embedding_update()
             return
-        if t[2] == 'Gang':
+        if kind == GANG:
             self.packs[p].append(('GANG', self.curTile, (4 + p - self.tileFrom) % 4))
             self.shownTiles[self.curTile] += 3
             if p == 0:
-                for i in range(3):
-                    self.hand.remove(self.curTile)
+                self.hand[self.curTile] -= 3
                 self._hand_embedding_update()
                 self.isAboutKong = True
             return
-        if t[2] == 'AnGang':
-            tile = 'CONCEALED' if p else t[3]
+        if kind == ANGANG:
+            # concealed kongs of others are packed with tile -1
+            tile = arg if p == 0 else -1
             self.packs[p].append(('GANG', tile, 0))
             if p == 0:
                 self.isAboutKong = True
-                for i in range(4):
-                    self.hand.remove(tile)
+                self.hand[tile] -= 4
             else:
                 self.isAboutKong = False
             return
-        if t[2] == 'BuGang':
-            tile = t[3]
+        if kind == BUGANG:
+            tile = arg
             for i in range(len(self.packs[p])):
                 if tile == self.packs[p][i][1]:
                     self.packs[p][i] = ('GANG', tile, self.packs[p][i][2])
                     break
             self.shownTiles[tile] += 1
             if p == 0:
-                self.hand.remove(tile)
+                self.hand[tile] -= 1
                 self._hand_embedding_update()
                 self.isAboutKong = True
                 return
@@ -249,7 +245,7 @@ class FeatureAgent(MahjongGBAgent):
                     self.valid.append(self.OFFSET_ACT['Hu'])
                 self.valid.append(self.OFFSET_ACT['Pass'])
                 return self._obs()
-        raise NotImplementedError('Unknown request %s!' % request)
+        raise NotImplementedError('Unknown event %s!' % (event, ))
     
     '''
     Pass
@@ -262,22 +258,25 @@ class FeatureAgent(MahjongGBAgent):
     BuGang XX
     '''
     def action2response(self, action):
+        return decision2response(self.action2decision(action))
+    
+    def action2decision(self, action):
         if action < self.OFFSET_ACT['Hu']:
-            return 'Pass'
+            return (PASS, -1)
         if action < self.OFFSET_ACT['Play']:
-            return 'Hu'
+            return (HU, -1)
         if action < self.OFFSET_ACT['Chi']:
-            return 'Play ' + self.TILE_LIST[action - self.OFFSET_ACT['Play']]
+            return (PLAY, action - self.OFFSET_ACT['Play'])
         if action < self.OFFSET_ACT['Peng']:
             t = (action - self.OFFSET_ACT['Chi']) // 3
-            return 'Chi ' + 'WTB'[t // 7] + str(t % 7 + 2)
+            return (CHI, t // 7 * 9 + t % 7 + 1)
         if action < self.OFFSET_ACT['Gang']:
-            return 'Peng'
+            return (PENG, -1)
         if action < self.OFFSET_ACT['AnGang']:
-            return 'Gang'
+            return (GANG, -1)
         if action < self.OFFSET_ACT['BuGang']:
-            return 'Gang ' + self.TILE_LIST[action - self.OFFSET_ACT['AnGang']]
-        return 'BuGang ' + self.TILE_LIST[action - self.OFFSET_ACT['BuGang']]
+            return (ANGANG, action - self.OFFSET_ACT['AnGang'])
+        return (BUGANG, action - self.OFFSET_ACT['BuGang'])
     
     '''
     Pass
@@ -302,41 +301,37 @@ class FeatureAgent(MahjongGBAgent):
         return self.OFFSET_ACT['Pass']
     
     def _obs(self):
-        mask = np.zeros(self.ACT_SIZE)
-        for a in self.valid:
-            mask[a] = 1
+        mask = np.zeros(self.ACT_SIZE, dtype = bool)
+        mask[self.valid] = True
+        valid = np.flatnonzero(mask)
+        legal = np.full(self.MAX_LEGAL, -1, dtype = np.int16)
+        legal[: len(valid)] = valid
         return {
             'observation': self.obs.reshape((self.OBS_SIZE, 4, 9)).copy(),
-            'action_mask': mask
+            'action_mask': mask,
+            'legal': legal
         }
     
     def _hand_embedding_update(self):
-        self.obs[self.OFFSET_OBS['HAND'] : ] = 0
-        d = defaultdict(int)
-        for tile in self.hand:
-            d[tile] += 1
-        for tile in d:
-            self.obs[self.OFFSET_OBS['HAND'] : self.OFFSET_OBS['HAND'] + d[tile], self.OFFSET_TILE[tile]] = 1
+        self.obs[self.OFFSET_OBS['HAND'] : self.OFFSET_OBS['HAND'] + 4, : 34] = self.HAND_PLANES[:, self.hand]
     
     def _check_mahjong(self, winTile, isSelfDrawn = False, isAboutKong = False):
-        try:
-            fans = MahjongFanCalculator(
-                pack = tuple(self.packs[0]),
-                hand = tuple(self.hand),
-                winTile = winTile,
-                flowerCount = 0,
-                isSelfDrawn = isSelfDrawn,
-                is4thTile = (self.shownTiles[winTile] + isSelfDrawn) == 4,
-                isAboutKong = isAboutKong,
-                isWallLast = self.wallLast,
-                seatWind = self.seatWind,
-                prevalentWind = self.prevalentWind,
-                verbose = True
-            )
-            fanCnt = 0
-            for fanPoint, cnt, fanName, fanNameEn in fans:
-                fanCnt += fanPoint * cnt
-            if fanCnt < 8: raise Exception('Not Enough Fans')
-        except:
-            return False
-        return True
\ No newline at end of file
+        # only hands waiting on winTile need the fan calculator
+        hand = tuple(self.hand)
+        if hand != self.waitingHand:
+            self.waitingHand = hand
+            self.waiting = waiting_tiles(self.hand)
+        if winTile not in self.waiting: return False
+        fanCnt = fan_cache.fan_count(
+            pack = self.packs[0],
+            hand = self.hand,
+            winTile = winTile,
+            flowerCount = 0,
+            isSelfDrawn = isSelfDrawn,
+            is4thTile = (self.shownTiles[winTile] + isSelfDrawn) == 4,
+            isAboutKong = isAboutKong,
+            isWallLast = self.wallLast,
+            seatWind = self.seatWind,
+            prevalentWind = self.prevalentWind
+        )
+        return fanCnt >= 8
\ No newline at end of file
@@ -0,0 +1,136 @@
+from multiprocessing import Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+import time
+import numpy as np
+import torch
+
+from model_pool import ModelPoolClient
+from feature import FeatureAgent
+from model import CNNModel, legal_actions
+
+class InferenceServer(Process):
+    
+    '''
+    One process running the model for many actors.
+    
+    Each actor owns a slot of rows in shared memory: it writes its observation/legal batch
+    there and sends (actor_id, rows) to the request queue. The server collects requests until
+    inference_max_batch rows are pending or the first one waited inference_max_latency seconds,
+    runs one forward pass, writes sampled actions and values back into the slots and answers each
+    actor on its own response queue with the model id used. Weights are reloaded from the model
+    pool whenever a newer model is published.
+    '''
+    
+    def __init__(self, config):
+        super(InferenceServer, self).__init__()
+        self.config = config
+        self.num_actors = config['num_actors']
+        self.slot_size = config.get('inference_slot_size', 4 * config.get('envs_per_actor', 1))
+        self.shapes = {
+            'observation': ((self.num_actors, self.slot_size, FeatureAgent.OBS_SIZE, 4, 9), np.int8),
+            'legal': ((self.num_actors, self.slot_size, FeatureAgent.MAX_LEGAL), np.int16),
+            'action': ((self.num_actors, self.slot_size), np.int64),
+            'value': ((self.num_actors, self.slot_size), np.float32),
+            'log_prob': ((self.num_actors, self.slot_size), np.float32)
+        }
+        self.memory = {key : SharedMemory(create = True, size = int(np.prod(shape)) * np.dtype(dtype).itemsize) for key, (shape, dtype) in self.shapes.items()}
+        self.request_queue = Queue()
+        self.response_queues = [Queue() for i in range(self.num_actors)]
+    
+    def client(self, actor_id):
+        return InferenceClient(self, actor_id)
+    
+    def run(self):
+        torch.set_num_threads(self.config.get('inference_threads', 1))
+        max_batch = self.config.get('inference_max_batch', 1024)
+        max_latency = self.config.get('inference_max_latency', 0.005)
+        arrays = {key : np.ndarray(shape, dtype = dtype, buffer = self.memory[key].buf) for key, (shape, dtype) in self.shapes.items()}
+        
+        # connect to model pool
+        model_pool = ModelPoolClient(self.config['model_pool_name'])
+        
+        # create network model
+        model = CNNModel()
+        version = model_pool.get_latest_model()
+        while not model_pool.load_into(version, model):
+            version = model_pool.get_latest_model()
+        model.train(False) # Batch Norm inference mode
+        
+        while True:
+            # dynamic batching: wait for the first request, then gather more until full or deadline
+            requests = [self.request_queue.get()]
+            rows = requests[0][1]
+            deadline = time.time() + max_latency
+            while rows < max_batch:
+                timeout = deadline - time.time()
+                if timeout <= 0: break
+                try:
+                    request = self.request_queue.get(timeout = timeout)
+                except Empty:
+                    break
+                requests.append(request)
+                rows += request[1]
+            
+            # hot-swap weights
+            latest = model_pool.get_latest_model()
+            if latest['id'] > version['id']:
+                while not model_pool.load_into(latest, model):
+                    latest = model_pool.get_latest_model()
+                version = latest
+            
+            legal = torch.from_numpy(np.concatenate([arrays['legal'][i, : n] for i, n in requests]))
+            with torch.no_grad():
+                logits, value = model({
+                    'observation': torch.from_numpy(np.concatenate([arrays['observation'][i, : n] for i, n in requests])),
+                    'legal': legal
+                })
+                action_dist = torch.distributions.Categorical(logits = logits)
+                slots = action_dist.sample()
+                log_probs = action_dist.log_prob(slots).numpy()
+                actions = legal_actions(legal, slots).numpy()
+                values = value.squeeze(-1).numpy()
+            k = 0
+            for i, n in requests:
+                arrays['action'][i, : n] = actions[k : k + n]
+                arrays['value'][i, : n] = values[k : k + n]
+                arrays['log_prob'][i, : n] = log_probs[k : k + n]
+                k += n
+                self.response_queues[i].put(version['id'])
+    
+    def close(self):
+        # called by the creating process after all users exit
+        for memory in self.memory.values():
+            memory.close()
+            memory.unlink()
+
+class InferenceClient:
+    
+    '''
+    Created in the main process by InferenceServer.client() and handed to an actor.
+    Only shared memory handles and queues are pickled, slot views are attached on first use.
+    '''
+    
+    def __init__(self, server, actor_id):
+        self.actor_id = actor_id
+        self.slot_size = server.slot_size
+        self.shapes = server.shapes
+        self.memory = server.memory
+        self.request_queue = server.request_queue
+        self.response_queue = server.response_queues[actor_id]
+        self.arrays = None
+    
+    def infer(self, obs):
+        '''
+        obs: stacked observation/legal of at most slot_size rows
+        returns: (actions, values, log_probs, model id)
+        '''
+        if self.arrays is None:
+            self.arrays = {key : np.ndarray(shape, dtype = dtype, buffer = self.memory[key].buf)[self.actor_id] for key, (shape, dtype) in self.shapes.items()}
+        n = len(obs['legal'])
+        assert n <= self.slot_size, 'Inference slot too small, raise inference_slot_size!'
+        self.arrays['observation'][: n] = obs['observation']
+        self.arrays['legal'][: n] = obs['legal']
+        self.request_queue.put((self.actor_id, n))
+        model_id = self.response_queue.get()
+        return self.arrays['action'][: n].copy(), self.arrays['value'][: n].copy(), self.arrays['log_prob'][: n].copy(), model_id
@@ -6,7 +6,9 @@ from torch.nn import functional as F
 
 from replay_buffer import ReplayBuffer
 from model_pool import ModelPoolServer
-from model import CNNModel
+from model import CNNModel, legal_slots
+from prefetch import BatchPrefetcher
+from checkpoint import CheckpointWriter
 
 class Learner(Process):
     
@@ -21,66 +23,81 @@ class Learner(Process):
         
         # initialize model params
         device = torch.device(self.config['device'])
-        model = CNNModel()
-        
-        # send to model pool
-        model_pool.push(model.state_dict()) # push cpu-only tensor to model_pool
-        model = model.to(device)
+        model = CNNModel().to(device)
         
         # training
         optimizer = torch.optim.Adam(model.parameters(), lr = self.config['lr'])
         
+        # checkpoints are written in the background, resume from the newest one if asked
+        ckpt_writer = CheckpointWriter(self.config['ckpt_save_path'] + 'model_%d.pt', self.config.get('ckpt_keep'))
+        iterations = 0
+        checkpoint = ckpt_writer.load_latest() if self.config.get('ckpt_resume') else None
+        if checkpoint is not None:
+            model.load_state_dict(checkpoint['state_dict'])
+            optimizer.load_state_dict(checkpoint['optimizer'])
+            iterations = checkpoint['epoch'] + 1
+        
+        # send to model pool
+        model_pool.push(model.state_dict())
+        
         # wait for initial samples
         while self.replay_buffer.size() < self.config['min_sample']:
             time.sleep(0.1)
         
+        # next rollout chunks are sampled and packed in the background
+        prefetcher = BatchPrefetcher(self.replay_buffer, self.config['rollout_size'], device)
+        
         cur_time = time.time()
-        iterations = 0
         while True:
-            # sample batch
-            batch = self.replay_buffer.sample(self.config['batch_size'])
-            obs = torch.tensor(batch['state']['observation']).to(device)
-            mask = torch.tensor(batch['state']['action_mask']).to(device)
-            states = {
-                'observation': obs,
-                'action_mask': mask
-            }
-            actions = torch.tensor(batch['action']).unsqueeze(-1).to(device)
-            advs = torch.tensor(batch['adv']).to(device)
-            targets = torch.tensor(batch['target']).to(device)
+            # sample a rollout chunk, then run shuffled minibatch epochs over it
+            batch = prefetcher.next()
+            obs = batch['state']['observation']
+            legal = batch['state']['legal']
+            actions = batch['action']
+            advs = batch['adv']
+            targets = batch['target']
+            old_log_probs = batch['log_prob'] # from the actor's policy
             
             print('Iteration %d, replay buffer in %d out %d' % (iterations, self.replay_buffer.stats['sample_in'], self.replay_buffer.stats['sample_out']))
             
             # calculate PPO loss
             model.train(True) # Batch Norm training mode
-            old_logits, _ = model(states)
-            old_probs = F.softmax(old_logits, dim = 1).gather(1, actions)
-            old_log_probs = torch.log(old_probs + 1e-8).detach()
-            for _ in range(self.config['epochs']):
-                logits, values = model(states)
-                action_dist = torch.distributions.Categorical(logits = logits)
-                probs = F.softmax(logits, dim = 1).gather(1, actions)
-                log_probs = torch.log(probs + 1e-8)
-                ratio = torch.exp(log_probs - old_log_probs)
-                surr1 = ratio * advs
-                surr2 = torch.clamp(ratio, 1 - self.config['clip'], 1 + self.config['clip']) * advs
-                policy_loss = -torch.mean(torch.min(surr1, surr2))
-                value_loss = torch.mean(F.mse_loss(values.squeeze(-1), targets))
-                entropy_loss = -torch.mean(action_dist.entropy())
-                loss = policy_loss + self.config['value_coeff'] * value_loss + self.config['entropy_coeff'] * entropy_loss
-                optimizer.zero_grad()
-                loss.backward()
+            size = len(actions)
+            minibatch_size = self.config['minibatch_size']
+            accum_steps = self.config['grad_accum_steps']
+            steps = 0
+            optimizer.zero_grad()
+            for _ in range(self.config['ppo_epochs']):
+                for index in torch.randperm(size, device = device).split(minibatch_size):
+                    logits, values = model({
+                        'observation': obs[index],
+                        'legal': legal[index]
+                    })
+                    # logits only cover legal actions, so the taken action is looked up by its slot
+                    action_dist = torch.distributions.Categorical(logits = logits)
+                    log_probs = action_dist.log_prob(legal_slots(legal[index], actions[index]))
+                    ratio = torch.exp(log_probs - old_log_probs[index])
+                    surr1 = ratio * advs[index]
+                    surr2 = torch.clamp(ratio, 1 - self.config['clip'], 1 + self.config['clip']) * advs[index]
+                    policy_loss = -torch.mean(torch.min(surr1, surr2))
+                    value_loss = torch.mean(F.mse_loss(values.squeeze(-1), targets[index]))
+                    entropy_loss = -torch.mean(action_dist.entropy())
+                    loss = policy_loss + self.config['value_coeff'] * value_loss + self.config['entropy_coeff'] * entropy_loss
+                    (loss / accum_steps).backward()
+                    steps += 1
+                    if steps % accum_steps == 0:
+                        optimizer.step()
+                        optimizer.zero_grad()
+            if steps % accum_steps:
                 optimizer.step()
+                optimizer.zero_grad()
 
-            # push new model
-            model = model.to('cpu')
-            model_pool.push(model.state_dict()) # push cpu-only tensor to model_pool
-            model = model.to(device)
+            # push new model, copied from device straight into the pool
+            model_pool.push(model.state_dict())
             
             # save checkpoints
             t = time.time()
             if t - cur_time > self.config['ckpt_save_interval']:
-                path = self.config['ckpt_save_path'] + 'model_%d.pt' % iterations
-                torch.save(model.state_dict(), path)
+                ckpt_writer.save(iterations, {'epoch': iterations, 'state_dict': model.state_dict(), 'optimizer': optimizer.state_dict()})
                 cur_time = t
             iterations += 1
\ No newline at end of file
@@ -30,11 +30,28 @@ class CNNModel(nn.Module):
                 nn.init.kaiming_normal_(m.weight)
 
     def forward(self, input_dict):
+        '''
+        With input_dict["legal"] (legal action indices padded with -1), logits are only gathered for
+        the legal actions: (B, MAX_LEGAL) with padding at -1e38, map sampled slots back with legal_actions.
+        With input_dict["action_mask"], logits of all 235 actions are returned, illegal ones at -1e38.
+        '''
         obs = input_dict["observation"].float()
         hidden = self._tower(obs)
         logits = self._logits(hidden)
+        value = self._value_branch(hidden)
+        if "legal" in input_dict:
+            legal = input_dict["legal"].long()
+            legal_logits = logits.gather(1, legal.clamp(min = 0))
+            return legal_logits.masked_fill(legal < 0, -1e38), value
         mask = input_dict["action_mask"].float()
         inf_mask = torch.clamp(torch.log(mask), -1e38, 1e38)
         masked_logits = logits + inf_mask
-        value = self._value_branch(hidden)
-        return masked_logits, value
\ No newline at end of file
+        return masked_logits, value
+
+def legal_actions(legal, slots):
+    # slots sampled from legal logits -> action indices
+    return legal.long().gather(1, slots.unsqueeze(1)).squeeze(1)
+
+def legal_slots(legal, actions):
+    # action indices -> their slots in legal
+    return (legal.long() == actions.unsqueeze(1)).int().argmax(1)
\ No newline at end of file
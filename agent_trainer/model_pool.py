@@ -2,6 +2,29 @@ from multiprocessing.shared_memory import SharedMemory, ShareableList
 import _pickle as cPickle
 import time
 import threading
+import numpy as np
+import torch
+
+'''
+Parameters of all models in the pool live in one shared memory block:
+    8 bytes header length + pickled layout + capacity segments, one model per segment.
+The layout fixes the offset, shape and dtype of every tensor in a segment, so pushing is an
+in-place copy into the next segment and loading is a copy out of torch.frombuffer views, without pickling.
+'''
+
+def _layout(state_dict):
+    tensors = []
+    offset = 0
+    for key, tensor in state_dict.items():
+        offset = (offset + 7) // 8 * 8
+        tensors.append((key, tuple(tensor.shape), tensor.dtype, offset, tensor.numel()))
+        offset += tensor.numel() * tensor.element_size()
+    return {'tensors': tensors, 'segment': (offset + 63) // 64 * 64}
+
+def _views(memory, layout, slot):
+    base = layout['data'] + slot * layout['segment']
+    return {key : torch.frombuffer(memory.buf, dtype = dtype, count = numel, offset = base + offset).view(shape) if numel else torch.empty(shape, dtype = dtype)
+        for key, shape, dtype, offset, numel in layout['tensors']}
 
 class ModelPoolServer:
     
@@ -12,32 +35,34 @@ class ModelPoolServer:
         # shared_model_list: N metadata {id, _addr} + n
         metadata_size = 1024
         self.shared_model_list = ShareableList([' ' * metadata_size] * capacity + [self.n], name = name)
-        
+        self.memory = None
+    
+    def _allocate(self, state_dict):
+        # fixed layout taken from the first pushed model
+        self.layout = _layout(state_dict)
+        header = cPickle.dumps(self.layout)
+        self.layout['data'] = (8 + len(header) + 63) // 64 * 64
+        self.memory = SharedMemory(create = True, size = self.layout['data'] + self.capacity * self.layout['segment'])
+        self.memory.buf[: 8] = np.int64(len(header)).tobytes()
+        self.memory.buf[8 : 8 + len(header)] = header
+        self.views = [_views(self.memory, self.layout, slot) for slot in range(self.capacity)]
+    
     def push(self, state_dict, metadata = {}):
+        if self.memory is None:
+            self._allocate(state_dict)
         n = self.n % self.capacity
-        if self.model_list[n]:
-            # FIFO: release shared memory of older model
-            try:
-                if self.model_list[n] and 'memory' in self.model_list[n]:
-                    self.model_list[n]['memory'].unlink()
-            except FileNotFoundError:
-                pass  # 已经被删除了
-            except Exception as e:
-                print(f"Warning: Failed to unlink shared memory: {e}")
-
-        data = cPickle.dumps(state_dict) # model parameters serialized to bytes
-        memory = SharedMemory(create = True, size = len(data))
-        memory.buf[:] = data[:]
-        # print('Created model', self.n, 'in shared memory', memory.name)
+        # overwrite the oldest segment in place, tensors may be on any device
+        with torch.no_grad():
+            for key, view in self.views[n].items():
+                view.copy_(state_dict[key])
         
         metadata = metadata.copy()
-        metadata['_addr'] = memory.name
+        metadata['_addr'] = self.memory.name
         metadata['id'] = self.n
         self.model_list[n] = metadata
         self.shared_model_list[n] = cPickle.dumps(metadata)
         self.n += 1
         self.shared_model_list[-1] = self.n
-        metadata['memory'] = memory
 
 class ModelPoolClient:
     
@@ -53,6 +78,7 @@ class ModelPoolClient:
         self.capacity = len(self.shared_model_list) - 1
         self.model_list = [None] * self.capacity
         self.n = 0
+        self.memory = None
         self._update_model_list()
     
     def _update_model_list(self):
@@ -64,6 +90,14 @@ class ModelPoolClient:
                     self.model_list[i % self.capacity] = cPickle.loads(self.shared_model_list[i % self.capacity])
                 self.n = n
     
+    def _attach(self, metadata):
+        if self.memory is None:
+            self.memory = SharedMemory(name = metadata['_addr'])
+            size = int(np.frombuffer(self.memory.buf, dtype = np.int64, count = 1)[0])
+            self.layout = cPickle.loads(self.memory.buf[8 : 8 + size])
+            self.layout['data'] = (8 + size + 63) // 64 * 64
+            self.views = [_views(self.memory, self.layout, slot) for slot in range(self.capacity)]
+    
     def get_model_list(self):
         self._update_model_list()
         model_list = []
@@ -78,11 +112,28 @@ class ModelPoolClient:
             time.sleep(0.1)
             self._update_model_list()
         return self.model_list[(self.n + self.capacity - 1) % self.capacity]
-        
+    
+    def load_into(self, metadata, model):
+        '''
+        Copy parameters of the model in metadata into model in place.
+        Returns False if the segment was (or may have been) overwritten by a newer push meanwhile.
+        '''
+        self._update_model_list()
+        n = metadata['id']
+        if n < self.n - self.capacity: return False
+        self._attach(metadata)
+        state_dict = model.state_dict()
+        with torch.no_grad():
+            for key, view in self.views[n % self.capacity].items():
+                state_dict[key].copy_(view)
+        # the server starts overwriting this segment only once id + capacity models were pushed before
+        return self.shared_model_list[-1] < n + self.capacity
+    
     def load_model(self, metadata):
         self._update_model_list()
         n = metadata['id']
         if n < self.n - self.capacity: return None
-        memory = SharedMemory(name = metadata['_addr'])
-        state_dict = cPickle.loads(memory.buf)
-        return state_dict
\ No newline at end of file
+        self._attach(metadata)
+        state_dict = {key : view.clone() for key, view in self.views[n % self.capacity].items()}
+        if self.shared_model_list[-1] >= n + self.capacity: return None
+        return state_dict
@@ -0,0 +1,49 @@
+from queue import Queue
+import threading
+import torch
+
+def _map(fn, data):
+    if type(data) == dict:
+        return {key : _map(fn, value) for key, value in data.items()}
+    return fn(data)
+
+class BatchPrefetcher:
+    
+    '''
+    Samples and packs the next batches on a background thread while the learner trains on the current one.
+    
+    Batches are converted to tensors (pinned when the device is CUDA) in the background; next() moves
+    the oldest one to the device, non-blocking for pinned memory. On CPU next() hands the tensors over as they are.
+    '''
+    
+    def __init__(self, replay_buffer, batch_size, device, depth = 2):
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.pin = self.device.type == 'cuda'
+        self.queue = Queue(depth)
+        self.stopped = False
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+    
+    def _run(self):
+        try:
+            while not self.stopped:
+                batch = self.replay_buffer.sample(self.batch_size)
+                batch = _map(torch.from_numpy, batch)
+                if self.pin:
+                    batch = _map(lambda tensor: tensor.pin_memory(), batch)
+                self.queue.put(batch)
+        except Exception as e:
+            self.queue.put(e)
+    
+    def next(self):
+        batch = self.queue.get()
+        if isinstance(batch, Exception): raise batch
+        return _map(lambda tensor: tensor.to(self.device, non_blocking = self.pin), batch)
+    
+    def close(self):
+        self.stopped = True
+        # unblock a pending put
+        while not self.queue.empty():
+            self.queue.get()
@@ -1,75 +1,112 @@
-from multiprocessing import Queue
-from collections import deque
+from multiprocessing.shared_memory import SharedMemory
 import numpy as np
-import random
 
-class ReplayBuffer:
+from feature import FeatureAgent
 
-    def __init__(self, capacity, episode):
-        self.queue = Queue(episode)
-        self.capacity = capacity
-        self.buffer = None
+class ReplayBuffer:
+    
+    '''
+    Samples live in preallocated shared memory arrays, split into one ring region per writer (actor).
+    Each writer only touches its own region and its own counter, so pushes need no lock and no pickling;
+    the learner samples with one fancy-index gather per array. Rows being overwritten while sampled
+    may be read half-written, which is tolerated as with any off-policy staleness.
+    '''
+    
+    FIELDS = {
+        'observation': ((FeatureAgent.OBS_SIZE, 4, 9), np.int8), # converted to float by the model
+        'legal': ((FeatureAgent.MAX_LEGAL, ), np.int16),
+        'action': ((), np.int64),
+        'log_prob': ((), np.float32),
+        'adv': ((), np.float32),
+        'target': ((), np.float32)
+    }
+    
+    def __init__(self, capacity, num_writers):
+        self.num_writers = num_writers
+        self.region = capacity // num_writers
+        self.capacity = self.region * num_writers
+        self.shapes = {key : ((self.capacity, ) + shape, dtype) for key, (shape, dtype) in self.FIELDS.items()}
+        # per writer: samples written, episodes written
+        self.shapes['counts'] = ((2, num_writers), np.int64)
+        self.memory = {key : SharedMemory(create = True, size = int(np.prod(shape)) * np.dtype(dtype).itemsize) for key, (shape, dtype) in self.shapes.items()}
+        self._attach()
+        self.arrays['counts'][:] = 0
     
-    def push(self, samples): # only called by actors
-        try:
-            self.queue.put(samples, timeout=1.0)  # 添加超时
-        except:
-            print("Warning: ReplayBuffer queue is full, dropping episode data")
+    def _attach(self):
+        self.arrays = {key : np.ndarray(shape, dtype = dtype, buffer = self.memory[key].buf) for key, (shape, dtype) in self.shapes.items()}
+        self.base = np.zeros(self.num_writers, dtype = np.int64)
+        self.stats = {'sample_in': 0, 'sample_out': 0, 'episode_in': 0}
     
-    def _flush(self):
-        if self.buffer is None: # called first time by learner
-            self.buffer = deque(maxlen = self.capacity)
-            self.stats = {'sample_in': 0, 'sample_out': 0, 'episode_in': 0}
-        while not self.queue.empty():
-            # data flushed from queue to buffer
-            episode_data = self.queue.get()
-            unpacked_data = self._unpack(episode_data)
-            self.buffer.extend(unpacked_data)
-            self.stats['sample_in'] += len(unpacked_data)
-            self.stats['episode_in'] += 1
+    def __getstate__(self):
+        # only shared memory handles are pickled, arrays are attached again by name
+        state = self.__dict__.copy()
+        del state['arrays']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+    
+    def push(self, samples, writer = 0): # only called by actors
+        n = len(samples['action'])
+        if n == 0: return
+        if n > self.region:
+            samples = {key : {k : v[-self.region :] for k, v in value.items()} if type(value) == dict else value[-self.region :] for key, value in samples.items()}
+            n = self.region
+        counts = self.arrays['counts']
+        index = writer * self.region + (counts[0, writer] + np.arange(n)) % self.region
+        self.arrays['observation'][index] = samples['state']['observation']
+        self.arrays['legal'][index] = samples['state']['legal']
+        self.arrays['action'][index] = samples['action']
+        self.arrays['log_prob'][index] = samples['log_prob']
+        self.arrays['adv'][index] = samples['adv']
+        self.arrays['target'][index] = samples['target']
+        # publish after the rows are written
+        counts[0, writer] += n
+        counts[1, writer] += 1
+    
+    def _valid(self):
+        counts = self.arrays['counts']
+        self.stats['sample_in'] = int(counts[0].sum())
+        self.stats['episode_in'] = int(counts[1].sum())
+        return np.minimum(counts[0] - self.base, self.region)
     
     def sample(self, batch_size): # only called by learner
-        self._flush()
-        assert len(self.buffer) > 0, "Empty buffer!"
-        self.stats['sample_out'] += batch_size
-        if batch_size >= len(self.buffer):
-            samples = self.buffer
+        valid = self._valid()
+        total = int(valid.sum())
+        assert total > 0, "Empty buffer!"
+        if batch_size >= total:
+            writer = np.repeat(np.arange(self.num_writers), valid)
+            rank = np.arange(total) - np.repeat(np.cumsum(valid) - valid, valid)
         else:
-            samples = random.sample(self.buffer, batch_size)
-        batch = self._pack(samples)
-        return batch
+            # uniform over valid rows without replacement: pick distinct global ranks, then map them to a writer and a rank in its region
+            rank = np.random.choice(total, batch_size, replace = False)
+            ends = np.cumsum(valid)
+            writer = np.searchsorted(ends, rank, side = 'right')
+            rank -= ends[writer] - valid[writer]
+        # valid rows of a region are the last ones written before its cursor
+        start = self.arrays['counts'][0, writer] - valid[writer]
+        index = writer * self.region + (start + rank) % self.region
+        self.stats['sample_out'] += len(index)
+        return {
+            'state': {
+                'observation': self.arrays['observation'][index],
+                'legal': self.arrays['legal'][index]
+            },
+            'action': self.arrays['action'][index],
+            'log_prob': self.arrays['log_prob'][index],
+            'adv': self.arrays['adv'][index],
+            'target': self.arrays['target'][index]
+        }
     
     def size(self): # only called by learner
-        self._flush()
-        return len(self.buffer)
+        return int(self._valid().sum())
     
     def clear(self): # only called by learner
-        self._flush()
-        self.buffer.clear()
+        self.base = self.arrays['counts'][0].copy()
     
-    def _unpack(self, data):
-        # convert dict (of dict...) of list of (num/ndarray/list) to list of dict (of dict...)
-        if type(data) == dict:
-            res = []
-            for key, value in data.items():
-                values = self._unpack(value)
-                if not res: res = [{} for i in range(len(values))]
-                for i, v in enumerate(values):
-                    res[i][key] = v
-            return res
-        else:
-            return list(data)
-            
-    def _pack(self, data):
-        # convert list of dict (of dict...) to dict (of dict...) of numpy array
-        if type(data[0]) == dict:
-            keys = data[0].keys()
-            res = {}
-            for key in keys:
-                values = [x[key] for x in data]
-                res[key] = self._pack(values)
-            return res
-        elif type(data[0]) == np.ndarray:
-            return np.stack(data)
-        else:
-            return np.array(data)
\ No newline at end of file
+    def close(self): # called by the creating process after all users exit
+        del self.arrays
+        for memory in self.memory.values():
+            memory.close()
+            memory.unlink()
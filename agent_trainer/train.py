@@ -1,40 +1,55 @@
 from replay_buffer import ReplayBuffer
 from actor import Actor
 from learner import Learner
+from inference_server import InferenceServer
 
 if __name__ == '__main__':
     config = {
         'replay_buffer_size': 50000,
-        'replay_buffer_episode': 400,
         'model_pool_size': 20,
         'model_pool_name': 'model-pool',
         'num_actors': 24,
         'episodes_per_actor': 1000,
+        'envs_per_actor': 8,
+        'use_inference_server': False,
+        'inference_max_batch': 1024,
+        'inference_max_latency': 0.005,
         'gamma': 0.98,
         'lambda': 0.95,
         'min_sample': 200,
-        'batch_size': 256,
-        'epochs': 5,
+        'rollout_size': 4096,
+        'minibatch_size': 256,
+        'ppo_epochs': 4,
+        'grad_accum_steps': 1,
         'clip': 0.2,
         'lr': 1e-4,
         'value_coeff': 1,
         'entropy_coeff': 0.01,
         'device': 'cuda',
         'ckpt_save_interval': 300,
-        'ckpt_save_path': 'model/'
+        'ckpt_save_path': 'model/',
+        'ckpt_keep': None, # keep all checkpoints
+        'ckpt_resume': False
     }
     
-    replay_buffer = ReplayBuffer(config['replay_buffer_size'], config['replay_buffer_episode'])
+    replay_buffer = ReplayBuffer(config['replay_buffer_size'], config['num_actors'])
+    inference_server = InferenceServer(config) if config['use_inference_server'] else None
     
     actors = []
     for i in range(config['num_actors']):
         config['name'] = 'Actor-%d' % i
-        actor = Actor(config, replay_buffer)
+        config['actor_id'] = i
+        actor = Actor(config, replay_buffer, inference_server.client(i) if inference_server else None)
         actors.append(actor)
     learner = Learner(config, replay_buffer)
     
     for actor in actors: actor.start()
     learner.start()
+    if inference_server: inference_server.start()
     
     for actor in actors: actor.join()
-    learner.terminate()
\ No newline at end of file
+    learner.terminate()
+    replay_buffer.close()
+    if inference_server:
+        inference_server.terminate()
+        inference_server.close()
\ No newline at end of file
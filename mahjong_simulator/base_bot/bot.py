@@ -0,0 +1,124 @@
+# Agent part
+from feature import FeatureAgent
+
+# Model part
+from model import CNNModel, MahjongModel, ResMahjongModel
+
+# Botzone interaction
+import numpy as np
+import torch
+
+def load_model(data_dir = './base_bot/model/model.pkl'):
+    # model = CNNModel()
+    # model = MahjongModel()
+    model = ResMahjongModel()
+    checkpoint = torch.load(data_dir, map_location = torch.device('cpu'), weights_only = True)
+    model.load_state_dict(checkpoint.get('state_dict', checkpoint)) # training checkpoint or bare state dict
+    return model
+
+class BotzoneBot:
+
+    '''
+    Botzone request handling of one seat, without the stdin/stdout loop.
+    handle() takes one request line and returns the response line, so the same bot runs
+    as the Botzone entry point (__main__.py) or inside the simulator process.
+    Several bots may share one model. A NEWGAME request resets the bot for the next game
+    and is answered with OK, so long-running bot processes can be reused.
+    '''
+
+    def __init__(self, model):
+        self.model = model
+        self.reset()
+
+    def reset(self):
+        self.agent = None
+        self.angang = None
+        self.zimo = False
+
+    def obs2response(self, obs):
+        with torch.no_grad():
+            logits = self.model({'is_training': False, 'obs': {'observation': torch.from_numpy(np.expand_dims(obs['observation'], 0)), 'action_mask': torch.from_numpy(np.expand_dims(obs['action_mask'], 0))}})
+        action = logits.numpy().flatten().argmax()
+        response = self.agent.action2response(action)
+        return response
+
+    def handle(self, request):
+        t = request.split()
+        if t[0] == 'NEWGAME':
+            self.reset()
+            return 'OK'
+        if t[0] == '0':
+            self.seatWind = int(t[1])
+            self.agent = FeatureAgent(self.seatWind)
+            self.agent.request2obs('Wind %s' % t[2])
+            return 'PASS'
+        agent = self.agent
+        seatWind = self.seatWind
+        if t[0] == '1':
+            agent.request2obs(' '.join(['Deal', *t[5:]]))
+            return 'PASS'
+        if t[0] == '2':
+            obs = agent.request2obs('Draw %s' % t[1])
+            response = self.obs2response(obs)
+            t = response.split()
+            if t[0] == 'Hu':
+                return 'HU'
+            elif t[0] == 'Play':
+                return 'PLAY %s' % t[1]
+            elif t[0] == 'Gang':
+                self.angang = t[1]
+                return 'GANG %s' % t[1]
+            elif t[0] == 'BuGang':
+                return 'BUGANG %s' % t[1]
+        elif t[0] == '3':
+            p = int(t[1])
+            if t[2] == 'HU':
+                # end of game notice, the next request is NEWGAME
+                return ''
+            elif t[2] == 'DRAW':
+                agent.request2obs('Player %d Draw' % p)
+                self.zimo = True
+                return 'PASS'
+            elif t[2] == 'GANG':
+                if p == seatWind and self.angang:
+                    agent.request2obs('Player %d AnGang %s' % (p, self.angang))
+                elif self.zimo:
+                    agent.request2obs('Player %d AnGang' % p)
+                else:
+                    agent.request2obs('Player %d Gang' % p)
+                return 'PASS'
+            elif t[2] == 'BUGANG':
+                obs = agent.request2obs('Player %d BuGang %s' % (p, t[3]))
+                if p == seatWind:
+                    return 'PASS'
+                else:
+                    response = self.obs2response(obs)
+                    if response == 'Hu':
+                        return 'HU'
+                    else:
+                        return 'PASS'
+            else:
+                self.zimo = False
+                if t[2] == 'CHI':
+                    agent.request2obs('Player %d Chi %s' % (p, t[3]))
+                elif t[2] == 'PENG':
+                    agent.request2obs('Player %d Peng' % p)
+                obs = agent.request2obs('Player %d Play %s' % (p, t[-1]))
+                if p == seatWind:
+                    return 'PASS'
+                else:
+                    response = self.obs2response(obs)
+                    t = response.split()
+                    if t[0] == 'Hu':
+                        return 'HU'
+                    elif t[0] == 'Pass':
+                        return 'PASS'
+                    elif t[0] == 'Gang':
+                        self.angang = None
+                        return 'GANG'
+                    elif t[0] in ('Peng', 'Chi'):
+                        obs = agent.request2obs('Player %d '% seatWind + response)
+                        response2 = self.obs2response(obs)
+                        agent.request2obs('Player %d Un' % seatWind + response)
+                        return ' '.join([t[0].upper(), *t[1:], response2.split()[-1]])
+        return ''
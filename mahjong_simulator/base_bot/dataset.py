@@ -1,12 +1,35 @@
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, default_collate
 import numpy as np
+from itertools import permutations
 from bisect import bisect_right
 import random
+import torch
+import os
 
 
 class MahjongGBDataset(Dataset):
     
+    '''
+    Samples of matches [begin, end) (as fractions of all matches).
+    
+    data/samples.npy and data/offsets.npy written by preprocess.py are opened with mmap_mode, lazily
+    in every DataLoader worker, so startup is O(1), workers share the page cache and a sample is
+    one direct index. Without them, the old per-match data/%d.npz files are loaded into memory.
+    '''
+    
     def __init__(self, begin = 0, end = 1, augment = False):
+        self.augment = augment
+        self.data = None
+        if os.path.exists('data/samples.npy'):
+            offsets = np.load('data/offsets.npy', mmap_mode = 'r')
+            self.total_matches = len(offsets) - 1
+            self.total_samples = int(offsets[-1])
+            self.begin = int(begin * self.total_matches)
+            self.end = int(end * self.total_matches)
+            self.matches = self.end - self.begin
+            self.start = int(offsets[self.begin])
+            self.samples = int(offsets[self.end]) - self.start
+            return
         import json
         with open('data/count.json') as f:
             self.match_samples = json.load(f)
@@ -17,7 +40,6 @@ class MahjongGBDataset(Dataset):
         self.match_samples = self.match_samples[self.begin : self.end]
         self.matches = len(self.match_samples)
         self.samples = sum(self.match_samples)
-        self.augment = augment
         t = 0
         for i in range(self.matches):
             a = self.match_samples[i]
@@ -30,20 +52,89 @@ class MahjongGBDataset(Dataset):
             for k in d:
                 self.cache[k].append(d[k])
     
+    def __getstate__(self):
+        # the memory map is opened again in every worker instead of being pickled
+        state = self.__dict__.copy()
+        state['data'] = None
+        return state
+    
     def __len__(self):
         return self.samples
     
     def __getitem__(self, index):
+        if hasattr(self, 'start'):
+            if self.data is None:
+                self.data = np.load('data/samples.npy', mmap_mode = 'r')[self.start : self.start + self.samples]
+            sample = self.data[index]
+            return np.array(sample['obs']), np.array(sample['mask']), sample['act']
         match_id = bisect_right(self.match_samples, index, 0, self.matches) - 1
         sample_id = index - self.match_samples[match_id]
         return self.cache['obs'][match_id][sample_id], self.cache['mask'][match_id][sample_id], self.cache['act'][match_id][sample_id]
 
 
+# Augmentations are permutations of the 36 tile columns of every observation plane and of the 235
+# actions, precomputed for every combination of suit order, number mirroring and wind rotation.
+SUIT_ORDERS = list(permutations(range(3)))
+
+def _tile_map(order, mirror, rotation):
+    # new column of every tile column
+    tiles = np.arange(36)
+    suit, num = tiles // 9, tiles % 9
+    new = tiles.copy()
+    numbered = suit < 3
+    new[numbered] = np.array(order)[suit[numbered]] * 9 + (8 - num[numbered] if mirror else num[numbered])
+    winds = (tiles >= 27) & (tiles < 31)
+    new[winds] = 27 + (tiles[winds] - 27 + rotation) % 4
+    return new
+
+def _action_map(order, mirror, rotation):
+    # new index of every action
+    tiles = _tile_map(order, mirror, rotation)
+    new = np.arange(235)
+    for base in [2, 99, 133, 167, 201]: # play, peng, gang, angang, bugang
+        new[base : base + 34] = base + tiles[: 34]
+    chi = np.arange(63)
+    suit, middle, offer = chi // 21, chi % 21 // 3, chi % 3
+    new[36 : 99] = 36 + np.array(order)[suit] * 21 + (6 - middle if mirror else middle) * 3 + offer
+    return new
+
+# augmentation id = (suit order * 2 + mirror) * 4 + rotation, 0 is the identity
+AUG_TILE_GATHER = np.stack([np.argsort(_tile_map(o, m, r)) for o in SUIT_ORDERS for m in range(2) for r in range(4)])
+AUG_ACTION_MAP = np.stack([_action_map(o, m, r) for o in SUIT_ORDERS for m in range(2) for r in range(4)])
+AUG_MASK_GATHER = np.argsort(AUG_ACTION_MAP, axis = 1)
+_aug_tables = {}
+
+def augment_batch(obs, mask, act, aug):
+    '''
+    Apply augmentations to a batch of tensors, on any device.
+    obs: (B, C, 4, 9), mask: (B, 235), act: (B, ), aug: (B, ) augmentation ids
+    '''
+    if obs.device not in _aug_tables:
+        _aug_tables[obs.device] = [torch.from_numpy(table).to(obs.device) for table in (AUG_TILE_GATHER, AUG_MASK_GATHER, AUG_ACTION_MAP)]
+    tile_gather, mask_gather, action_map = _aug_tables[obs.device]
+    aug = aug.to(obs.device).long()
+    B, C = obs.shape[: 2]
+    obs = obs.reshape(B, C, 36).gather(2, tile_gather[aug].unsqueeze(1).expand(B, C, 36)).view(B, C, 4, 9)
+    mask = mask.gather(1, mask_gather[aug])
+    act = action_map[aug, act.long()]
+    return obs, mask, act
+
+
 class AugmentedMahjongGBDataset(Dataset):
+    
+    '''
+    The original samples followed by augmentation_factor times as many augmented copies.
+    
+    __getitem__ only draws an augmentation id per sample (0 for original samples); pass collate as
+    collate_fn to the DataLoader to apply them to whole batches. Suits are always permuted and numbers
+    always mirrored, winds are rotated with probability 0.8.
+    '''
+    
     def __init__(self, original_dataset, augmentation_factor=1):
         self.original_dataset = original_dataset
         self.augmentation_factor = augmentation_factor
         self.total_samples = int(len(original_dataset) * (1 + augmentation_factor))
+        self.freq = {'swap_suits': 1, 'mirror_numbers': 1, 'rotate_winds': 0.8}
 
     def __len__(self):
         return self.total_samples
@@ -51,131 +142,19 @@ class AugmentedMahjongGBDataset(Dataset):
     def __getitem__(self, index):
         if index < len(self.original_dataset):
             # Return original sample
-            return self.original_dataset[index]
+            return (*self.original_dataset[index], 0)
         else:
             # Return augmented sample
             original_index = (index - len(self.original_dataset)) % len(self.original_dataset)
-            obs, mask, act = self.original_dataset[original_index]
-            return self._augment_data(obs, mask, act)
-
-
-    def _augment_data(self, obs, mask, act):
-        augmentation_funcs = [
-            self._swap_suits,
-            self._mirror_numbers,
-            self._shuffle_hand,
-            self._rotate_winds
-        ]
-        
-        freq = [1, 1, 0.8, 0.8]
-        for i, func in enumerate(augmentation_funcs):
-            if random.random() < freq[i]:
-                obs, mask, act = func(obs, mask, act)
-        
-        return obs, mask, act
-
-    def _swap_suits(self, obs, mask, act):
-        order = list(range(3))
-        random.shuffle(order)
-        
-        # Precompute indices for efficiency
-        obs_indices = [slice(i, i+1) for i in range(3)]
-        mask_indices = {
-            'play': [slice(2+i*9, 11+i*9) for i in range(3)],
-            'chi': [slice(36+i*21, 57+i*21) for i in range(3)],
-            'peng': [slice(99+i*9, 108+i*9) for i in range(3)],
-            'gang': [slice(133+i*9, 142+i*9) for i in range(3)],
-            'angang': [slice(167+i*9, 176+i*9) for i in range(3)],
-            'bugang': [slice(201+i*9, 210+i*9) for i in range(3)]
-        }
-        
-        # Reorder obs
-        new_obs = np.concatenate([obs[:, obs_indices[order.index(i)]] for i in range(3)] + [obs[:, 3:]], axis=1)
-        
-        # Reorder mask
-        new_mask = np.concatenate([
-            mask[:2],
-            *[mask[mask_indices['play'][order.index(i)]] for i in range(3)],
-            mask[29:36],
-            *[mask[mask_indices['chi'][order.index(i)]] for i in range(3)],
-            *[mask[mask_indices['peng'][order.index(i)]] for i in range(3)],
-            mask[126:133],
-            *[mask[mask_indices['gang'][order.index(i)]] for i in range(3)],
-            mask[160:167],
-            *[mask[mask_indices['angang'][order.index(i)]] for i in range(3)],
-            mask[194:201],
-            *[mask[mask_indices['bugang'][order.index(i)]] for i in range(3)],
-            mask[228:]
-        ])
-        
-        # Update act
-        if 2 <= act < 29:
-            act = 2 + order[(act - 2) // 9] * 9 + (act - 2) % 9
-        elif 36 <= act < 99:
-            act = 36 + order[(act - 36) // 21] * 21 + (act - 36) % 21
-        elif 99 <= act < 126 or 133 <= act < 160 or 167 <= act < 194 or 201 <= act < 228:
-            base = 99 if act < 126 else 133 if act < 160 else 167 if act < 194 else 201
-            act = base + order[(act - base) // 9] * 9 + (act - base) % 9
-        
-        return new_obs, new_mask, act
-
-    def _mirror_numbers(self, obs, mask, act):
-        # Mirror number tiles
-        for i in range(3):
-            obs[:, i] = obs[:, i][:, ::-1]
-        
-        # Update mask for number tiles
-        for start in [2, 99, 133, 167, 201]:
-            for i in range(3):
-                slice_start = start + i * 9
-                slice_end = slice_start + 9
-                mask[slice_start:slice_end] = mask[slice_start:slice_end][::-1]
-        mask_chi_W = [mask[36:39], mask[39:42], mask[42:45], mask[45:48], mask[48:51], mask[51:54], mask[54:57]]
-        mask_chi_T = [mask[57:60], mask[60:63], mask[63:66], mask[66:69], mask[69:72], mask[72:75], mask[75:78]]
-        mask_chi_B = [mask[78:81], mask[81:84], mask[84:87], mask[87:90], mask[90:93], mask[93:96], mask[96:99]]
-        mask[36:99] = np.concatenate(mask_chi_W[::-1]+mask_chi_T[::-1]+mask_chi_B[::-1])
-        
-        # Update act for number tiles
-        if 2 <= act < 29:
-            act = 2 + (act - 2) // 9 * 9 + (8 - (act - 2) % 9)
-        elif 36 <= act < 99:
-            index = ((act - 36) % 21) // 3
-            offset = [(6 - 2*i) * 3 for i in range(7)]
-            act = act + offset[index]
-        elif act in range(99, 126) or act in range(133, 160) or act in range(167, 194) or act in range(201, 228):
-            base = 99 if act < 126 else 133 if act < 160 else 167 if act < 194 else 201
-            act = base + (act - base) // 9 * 9 + (8 - (act - base) % 9)
-        
-        return obs, mask, act
+            return (*self.original_dataset[original_index], self._draw_augmentation())
 
-    def _shuffle_hand(self, obs, mask, act):
-        hand = obs[2:6]
-        non_zero = np.nonzero(hand)
-        values = hand[non_zero]
-        np.random.shuffle(values)
-        hand[non_zero] = values
-        obs[2:6] = hand
-        
-        # No need to update mask or act as shuffling the hand
-        # doesn't affect the available actions or the chosen action
-        return obs, mask, act
+    def _draw_augmentation(self):
+        order = random.randrange(6) if random.random() < self.freq['swap_suits'] else 0
+        mirror = int(random.random() < self.freq['mirror_numbers'])
+        rotation = random.randint(0, 3) if random.random() < self.freq['rotate_winds'] else 0
+        return (order * 2 + mirror) * 4 + rotation
 
-    def _rotate_winds(self, obs, mask, act):
-        wind_indices = [0, 1, 2, 3]
-        rotation = random.randint(0, 3)
-        rotated_winds = np.roll(obs[:, 3:4, wind_indices], rotation, axis=2)
-        obs[:, 3:4, wind_indices] = rotated_winds
-        
-        # Update mask for wind-related actions
-        wind_mask_indices = [[29, 30, 31, 32], [126, 127, 128, 129], [160, 161, 162, 163], [194, 195, 196, 197], [228, 229, 230, 231]]
-        for i in range(5):
-            mask[wind_mask_indices[i]] = mask[np.roll(wind_mask_indices[i], rotation)]
-        
-        # Update act for wind-related actions
-        wind_act_ranges = [(29, 33), (126, 130), (160, 164), (194, 198), (228, 232)]
-        for start, end in wind_act_ranges:
-            if start <= act < end:
-                act = start + (act - start + rotation) % 4
-                break
-        
-        return obs, mask, act
\ No newline at end of file
+    @staticmethod
+    def collate(batch):
+        obs, mask, act, aug = default_collate(batch)
+        return augment_batch(obs, mask, act, aug)
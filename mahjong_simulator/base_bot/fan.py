@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+try:
+    from MahjongGB import MahjongFanCalculator
+except:
+    print('MahjongGB library required! Please visit https://github.com/ailab-pku/PyMahjongGB for more information.')
+    raise
+
+ERROR_CODES = {
+    'ERROR_WRONG_TILES_COUNT' : -1,
+    'ERROR_TILE_COUNT_GREATER_THAN_4' : -2,
+    'ERROR_NOT_WIN' : -3
+}
+
+def fan_count(pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind):
+    # pack: ((packType, tile, offer), ...), hand: tiles as strs; returns negative for non-winning hands
+    try:
+        fans = MahjongFanCalculator(
+            pack = tuple(pack),
+            hand = tuple(hand),
+            winTile = winTile,
+            flowerCount = flowerCount,
+            isSelfDrawn = isSelfDrawn,
+            is4thTile = is4thTile,
+            isAboutKong = isAboutKong,
+            isWallLast = isWallLast,
+            seatWind = seatWind,
+            prevalentWind = prevalentWind
+        )
+    except TypeError as e:
+        if str(e) not in ERROR_CODES: raise
+        return ERROR_CODES[str(e)]
+    return sum(fanCnt for fanCnt, fanName in fans)
+
+class FanCache:
+    
+    '''
+    Bounded LRU cache of fan counts keyed by (sorted packs, sorted hand, winTile, flags).
+    Fan scoring is pure, so equal states can share one MahjongFanCalculator call.
+    '''
+    
+    def __init__(self, capacity = 65536):
+        self.capacity = capacity
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def fan_count(self, pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind):
+        # same arguments as fan_count
+        key = (tuple(sorted(pack)), ''.join(sorted(hand)), winTile, flowerCount, bool(isSelfDrawn), bool(is4thTile), bool(isAboutKong), bool(isWallLast), seatWind, prevalentWind)
+        fanCnt = self.cache.get(key)
+        if fanCnt is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return fanCnt
+        self.misses += 1
+        fanCnt = fan_count(pack, hand, winTile, flowerCount, isSelfDrawn, is4thTile, isAboutKong, isWallLast, seatWind, prevalentWind)
+        self.cache[key] = fanCnt
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last = False)
+        return fanCnt
+    
+    def info(self):
+        return {'hits' : self.hits, 'misses' : self.misses, 'size' : len(self.cache), 'capacity' : self.capacity}
+    
+    def clear(self):
+        self.cache.clear()
+        self.hits = self.misses = 0
+
+# shared by all agents in a process
+fan_cache = FanCache()
@@ -1,19 +1,14 @@
 from agent import MahjongGBAgent
+from fan import fan_cache
 from collections import defaultdict
 import numpy as np
 
-try:
-    from MahjongGB import MahjongFanCalculator
-except:
-    print('MahjongGB library required! Please visit https://github.com/ailab-pku/PyMahjongGB for more information.')
-    raise
-
 class FeatureAgent(MahjongGBAgent):
     
     '''
-    observation: 147*4*9
+    observation: 147*4*9 int8
         ...
-    action_mask: 235
+    action_mask: 235 bool
         pass1+hu1+discard34+chi63(3*7*3)+peng34+gang34+angang34+bugang34
     '''
     
@@ -48,6 +43,9 @@ class FeatureAgent(MahjongGBAgent):
     ]
     OFFSET_TILE = {c : i for i, c in enumerate(TILE_LIST)}
     
+    # check every incremental plane update against a full rebuild (slow, for debugging)
+    VALIDATE = False
+    
     def __init__(self, seatWind):
         self.seatWind = seatWind
         self.packs = [[] for i in range(4)]
@@ -55,9 +53,12 @@ class FeatureAgent(MahjongGBAgent):
         self.tileWall = [21] * 4
         self.shownTiles = defaultdict(int)
         self.remaining = []
+        self.remainingCount = [0] * 34
+        self.historyShown = [0] * 4 # history tiles of each player already in the planes
+        self.packsPending = [] # AnGang packs, embedded only at the next meld
         self.wallLast = False
         self.isAboutKong = False
-        self.obs = np.zeros((self.OBS_SIZE, 36))
+        self.obs = np.zeros((self.OBS_SIZE, 36), dtype = np.int8)
         self.obs[self.OFFSET_OBS['SEAT_WIND']][self.OFFSET_TILE['F%d' % (self.seatWind + 1)]] = 1
     
     '''
@@ -132,7 +133,7 @@ class FeatureAgent(MahjongGBAgent):
             self.shownTiles[self.curTile] += 1
             self.history[p].append(self.curTile)
             self.remaining.append(self.curTile)
-            self._remaining_embedding_update()
+            self._remaining_embedding_update(self.curTile, 1)
             if p == 0:
                 self.hand.remove(self.curTile)
                 self._hand_embedding_update()
@@ -170,9 +171,9 @@ class FeatureAgent(MahjongGBAgent):
             for i in range(-1, 2):
                 self.shownTiles[color + str(num + i)] += 1
             self.wallLast = self.tileWall[(p + 1) % 4] == 0
-            self._packs_embedding_update()
+            self._packs_embedding_update(p, tile)
             self.remaining.remove(self.curTile)
-            self._remaining_embedding_update()
+            self._remaining_embedding_update(self.curTile, -1)
             if p == 0:
                 # Available: Play
                 self.valid = []
@@ -191,9 +192,9 @@ class FeatureAgent(MahjongGBAgent):
             num = int(tile[1])
             self.packs[p].pop()
             self.shownTiles[self.curTile] += 1
-            self._packs_embedding_update()
+            self._packs_embedding_update(p, tile)
             self.remaining.append(self.curTile)
-            self._remaining_embedding_update()
+            self._remaining_embedding_update(self.curTile, 1)
             for i in range(-1, 2):
                 self.shownTiles[color + str(num + i)] -= 1
             if p == 0:
@@ -206,9 +207,9 @@ class FeatureAgent(MahjongGBAgent):
             self.packs[p].append(('PENG', self.curTile, (4 + p - self.tileFrom) % 4))
             self.shownTiles[self.curTile] += 2
             self.wallLast = self.tileWall[(p + 1) % 4] == 0
-            self._packs_embedding_update()
+            self._packs_embedding_update(p, self.curTile)
             self.remaining.remove(self.curTile)
-            self._remaining_embedding_update()
+            self._remaining_embedding_update(self.curTile, -1)
             if p == 0:
                 # Available: Play
                 self.valid = []
@@ -223,9 +224,9 @@ class FeatureAgent(MahjongGBAgent):
         if t[2] == 'UnPeng':
             self.packs[p].pop()
             self.shownTiles[self.curTile] -= 2
-            self._packs_embedding_update()
+            self._packs_embedding_update(p, self.curTile)
             self.remaining.append(self.curTile)
-            self._remaining_embedding_update()
+            self._remaining_embedding_update(self.curTile, 1)
             if p == 0:
                 for i in range(2):
                     self.hand.append(self.curTile)
@@ -234,9 +235,9 @@ class FeatureAgent(MahjongGBAgent):
         if t[2] == 'Gang':
             self.packs[p].append(('GANG', self.curTile, (4 + p - self.tileFrom) % 4))
             self.shownTiles[self.curTile] += 3
-            self._packs_embedding_update()
+            self._packs_embedding_update(p, self.curTile)
             self.remaining.remove(self.curTile)
-            self._remaining_embedding_update()
+            self._remaining_embedding_update(self.curTile, -1)
             if p == 0:
                 for i in range(3):
                     self.hand.remove(self.curTile)
@@ -246,6 +247,7 @@ class FeatureAgent(MahjongGBAgent):
         if t[2] == 'AnGang':
             tile = 'CONCEALED' if p else t[3]
             self.packs[p].append(('GANG', tile, 0))
+            self.packsPending.append((p, tile))
             if p == 0:
                 self.obs[self.OFFSET_OBS['ANGANG'], self.OFFSET_TILE[tile]] = 1
                 self.isAboutKong = True
@@ -262,7 +264,7 @@ class FeatureAgent(MahjongGBAgent):
                     self.packs[p][i] = ('GANG', tile, self.packs[p][i][2])
                     break
             self.shownTiles[tile] += 1
-            self._packs_embedding_update()
+            self._packs_embedding_update(p, tile)
             if p == 0:
                 self.hand.remove(tile)
                 self._hand_embedding_update()
@@ -328,15 +330,70 @@ class FeatureAgent(MahjongGBAgent):
         return self.OFFSET_ACT['Pass']
     
     def _obs(self):
-        mask = np.zeros(self.ACT_SIZE)
-        for a in self.valid:
-            mask[a] = 1
+        mask = np.zeros(self.ACT_SIZE, dtype = bool)
+        mask[self.valid] = True
         return {
             'observation': self.obs.reshape((self.OBS_SIZE, 4, 9)).copy(),
             'action_mask': mask
         }
     
-    def _packs_embedding_update(self):
+    def _packs_embedding_update(self, p, tile):
+        # a pack only touches the column of its tile, so rebuild that column of player p
+        # (and those of AnGang packs made since the last meld, which are not embedded until then)
+        self.packsPending.append((p, tile))
+        for p, tile in self.packsPending:
+            if tile == 'CONCEALED': continue
+            pack_start = self.OFFSET_OBS['PACKS'] + p * 6
+            column = self.OFFSET_TILE[tile]
+            self.obs[pack_start : pack_start + 6, column] = 0
+            for packType, packTile, offer in self.packs[p]:
+                if packTile != tile: continue
+                if packType == 'CHI':
+                    self.obs[pack_start : pack_start + 3, column] = 1
+                    self.obs[pack_start + 3, column] = offer
+                elif packType == 'PENG':
+                    self.obs[pack_start + 4, column] = 1
+                elif packType == 'GANG':
+                    self.obs[pack_start + 5, column] = 1
+        self.packsPending = []
+        if self.VALIDATE: self._validate(self._packs_embedding_rebuild, 'PACKS', 'ANGANG')
+    
+    def _history_embedding_update(self):
+        # 更新弃牌历史特征, only discards made since the last update are written
+        for p in range(4):
+            hist_start = self.OFFSET_OBS['HISTORY'] + p * 28
+            n = len(self.history[p])
+            if n > 28:
+                # the window of the last 28 discards shifted, rewrite this player
+                self.obs[hist_start : hist_start + 28] = 0
+                for i, tile in enumerate(self.history[p][-28:]):
+                    self.obs[hist_start + i, self.OFFSET_TILE[tile]] = 1
+            else:
+                for i in range(self.historyShown[p], n):
+                    self.obs[hist_start + i, self.OFFSET_TILE[self.history[p][i]]] = 1
+            self.historyShown[p] = n
+        if self.VALIDATE: self._validate(self._history_embedding_rebuild, 'HISTORY', 'REMAINING')
+    
+    def _hand_embedding_update(self):
+        self.obs[self.OFFSET_OBS['HAND'] : self.OFFSET_OBS['PACKS']] = 0
+        d = defaultdict(int)
+        for tile in self.hand:
+            d[tile] += 1
+        for tile in d:
+            self.obs[self.OFFSET_OBS['HAND'] : self.OFFSET_OBS['HAND'] + d[tile], self.OFFSET_TILE[tile]] = 1
+            
+    def _remaining_embedding_update(self, tile, delta):
+        # one tile was added to (delta 1) or removed from (delta -1) remaining, flip one cell
+        i = self.OFFSET_TILE[tile]
+        count = self.remainingCount[i] + max(delta, 0)
+        if count <= 4:
+            self.obs[self.OFFSET_OBS['REMAINING'] + count - 1, i] = max(delta, 0)
+        self.remainingCount[i] += delta
+        if self.VALIDATE: self._validate(self._remaining_embedding_rebuild, 'REMAINING', None)
+    
+    # full rebuilds, used to validate the incremental updates
+    
+    def _packs_embedding_rebuild(self):
         self.obs[self.OFFSET_OBS['PACKS'] : self.OFFSET_OBS['ANGANG']] = 0
         for p in range(4):
             pack_start = self.OFFSET_OBS['PACKS'] + p * 6
@@ -344,29 +401,20 @@ class FeatureAgent(MahjongGBAgent):
                 if packType == 'CHI':
                     self.obs[pack_start : pack_start + 3, self.OFFSET_TILE[tile]] = 1
                     self.obs[pack_start + 3, self.OFFSET_TILE[tile]] = offer
-                elif packType == 'PENG': 
-                    self.obs[pack_start + 4, self.OFFSET_TILE[tile]] = 1  
+                elif packType == 'PENG':
+                    self.obs[pack_start + 4, self.OFFSET_TILE[tile]] = 1
                 elif packType == 'GANG':
                     if tile != 'CONCEALED':
                         self.obs[pack_start + 5, self.OFFSET_TILE[tile]] = 1
-                    
-    def _history_embedding_update(self):
-        # 更新弃牌历史特征
+    
+    def _history_embedding_rebuild(self):
         self.obs[self.OFFSET_OBS['HISTORY'] : self.OFFSET_OBS['REMAINING']] = 0
         for p in range(4):
             hist_start = self.OFFSET_OBS['HISTORY'] + p * 28
             for i, tile in enumerate(self.history[p][-28:]):
                 self.obs[hist_start + i, self.OFFSET_TILE[tile]] = 1
     
-    def _hand_embedding_update(self):
-        self.obs[self.OFFSET_OBS['HAND'] : self.OFFSET_OBS['PACKS']] = 0
-        d = defaultdict(int)
-        for tile in self.hand:
-            d[tile] += 1
-        for tile in d:
-            self.obs[self.OFFSET_OBS['HAND'] : self.OFFSET_OBS['HAND'] + d[tile], self.OFFSET_TILE[tile]] = 1
-            
-    def _remaining_embedding_update(self):
+    def _remaining_embedding_rebuild(self):
         self.obs[self.OFFSET_OBS['REMAINING'] : ] = 0
         d = defaultdict(int)
         for tile in self.remaining:
@@ -374,11 +422,17 @@ class FeatureAgent(MahjongGBAgent):
         for tile in d:
             self.obs[self.OFFSET_OBS['REMAINING'] : self.OFFSET_OBS['REMAINING'] + d[tile], self.OFFSET_TILE[tile]] = 1
     
+    def _validate(self, rebuild, start, end):
+        region = slice(self.OFFSET_OBS[start], self.OFFSET_OBS[end] if end else None)
+        planes = self.obs[region].copy()
+        rebuild()
+        assert np.array_equal(planes, self.obs[region]), 'Incremental %s planes differ from full rebuild!' % start
+    
     def _check_mahjong(self, winTile, isSelfDrawn = False, isAboutKong = False):
         try:
-            fans = MahjongFanCalculator(
-                pack = tuple(self.packs[0]),
-                hand = tuple(self.hand),
+            fanCnt = fan_cache.fan_count(
+                pack = self.packs[0],
+                hand = self.hand,
                 winTile = winTile,
                 flowerCount = 0,
                 isSelfDrawn = isSelfDrawn,
@@ -386,12 +440,8 @@ class FeatureAgent(MahjongGBAgent):
                 isAboutKong = isAboutKong,
                 isWallLast = self.wallLast,
                 seatWind = self.seatWind,
-                prevalentWind = self.prevalentWind,
-                verbose = True
+                prevalentWind = self.prevalentWind
             )
-            fanCnt = 0
-            for fanPoint, cnt, fanName, fanNameEn in fans:
-                fanCnt += fanPoint * cnt
             if fanCnt < 8: raise Exception('Not Enough Fans')
         except:
             return False
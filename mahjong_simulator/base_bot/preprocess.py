@@ -1,49 +1,40 @@
 from feature import FeatureAgent
+from multiprocessing import Pool
 import numpy as np
+import argparse
 import json
+import os
 
-obs = [[] for i in range(4)]
-actions = [[] for i in range(4)]
-matchid = -1
+'''
+Replays the match log data/data.txt into training samples.
 
-l = []
+The log is split at Match lines and the matches are replayed by a pool of workers, shard_size
+matches per task. Each shard is written to data/shard_%d.npz: obs/mask/act of its matches
+concatenated, and counts, the number of samples of every match. Shards are written to a temp
+file and renamed, so a rerun after an interruption skips the shards already done.
 
-def filterData():
-    global obs
-    global actions
-    newobs = [[] for i in range(4)]
-    newactions = [[] for i in range(4)]
-    for i in range(4):
-        for j, o in enumerate(obs[i]):
-            if o['action_mask'].sum() > 1: # ignore states with single valid action (Pass)
-                newobs[i].append(o)
-                newactions[i].append(actions[i][j])
-    obs = newobs
-    actions = newactions
+When all shards are done they are merged into data/samples.npy, one SAMPLE_DTYPE record per
+sample, and data/offsets.npy, where match i owns samples offsets[i] : offsets[i + 1]. Both are
+opened with mmap_mode by MahjongGBDataset. data/count.json (samples per match) and data/index.json
+are written last, shards are deleted unless --keep_shards.
+'''
 
-def saveData():
-    assert [len(x) for x in obs] == [len(x) for x in actions], 'obs actions not matching!'
-    l.append(sum([len(x) for x in obs]))
-    np.savez('data/%d.npz'%matchid
-        , obs = np.stack([x['observation'] for i in range(4) for x in obs[i]]).astype(np.int8)
-        , mask = np.stack([x['action_mask'] for i in range(4) for x in obs[i]]).astype(np.int8)
-        , act = np.array([x for i in range(4) for x in actions[i]])
-    )
-    for x in obs: x.clear()
-    for x in actions: x.clear()
+SAMPLE_DTYPE = np.dtype([
+    ('obs', np.int8, (FeatureAgent.OBS_SIZE, 4, 9)),
+    ('mask', np.bool_, (FeatureAgent.ACT_SIZE, )),
+    ('act', np.int64)
+])
 
-with open('data/data.txt', encoding='UTF-8') as f:
-    line = f.readline()
-    while line:
+def replay_match(lines):
+    # lines of one match -> (obs, mask, act) arrays of its samples
+    obs = [[] for i in range(4)]
+    actions = [[] for i in range(4)]
+    for line in lines:
         t = line.split()
         if len(t) == 0:
-            line = f.readline()
             continue
         if t[0] == 'Match':
             agents = [FeatureAgent(i) for i in range(4)]
-            matchid += 1
-            if matchid % 128 == 0:
-                print('Processing match %d %s...' % (matchid, t[1]))
         elif t[0] == 'Wind':
             for agent in agents:
                 agent.request2obs(line)
@@ -129,9 +120,113 @@ with open('data/data.txt', encoding='UTF-8') as f:
                             actions[p].pop()
                             actions[p].append(agents[p].response2action('Hu'))
                     else: break
-        elif t[0] == 'Score':
-            filterData()
-            saveData()
-        line = f.readline()
-with open('data/count.json', 'w') as f:
-    json.dump(l, f)
\ No newline at end of file
+    assert [len(x) for x in obs] == [len(x) for x in actions], 'obs actions not matching!'
+    # ignore states with single valid action (Pass)
+    samples = [(o, a) for i in range(4) for o, a in zip(obs[i], actions[i]) if o['action_mask'].sum() > 1]
+    if not samples:
+        return np.zeros((0, FeatureAgent.OBS_SIZE, 4, 9), dtype = np.int8), np.zeros((0, FeatureAgent.ACT_SIZE), dtype = bool), np.zeros(0, dtype = np.int64)
+    return (
+        np.stack([o['observation'] for o, a in samples]),
+        np.stack([o['action_mask'] for o, a in samples]),
+        np.array([a for o, a in samples], dtype = np.int64)
+    )
+
+def read_matches(path):
+    # yields the lines of one match at a time, starting with its Match line
+    match = None
+    with open(path, encoding = 'UTF-8') as f:
+        for line in f:
+            if line.startswith('Match'):
+                if match: yield match
+                match = []
+            if match is not None:
+                match.append(line)
+    if match: yield match
+
+def shard_path(output, shard_id):
+    return os.path.join(output, 'shard_%d.npz' % shard_id)
+
+def shard_done(path, matches):
+    if not os.path.exists(path): return False
+    with np.load(path) as d:
+        return len(d['counts']) == matches
+
+def process_shard(shard_id, matches, output):
+    samples = [replay_match(match) for match in matches]
+    path = shard_path(output, shard_id)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f
+            , obs = np.concatenate([obs for obs, mask, act in samples])
+            , mask = np.concatenate([mask for obs, mask, act in samples])
+            , act = np.concatenate([act for obs, mask, act in samples])
+            , counts = np.array([len(act) for obs, mask, act in samples], dtype = np.int64)
+        )
+    os.replace(path + '.tmp', path)
+    return shard_id
+
+def merge_shards(output, shards):
+    # shards -> samples.npy + offsets.npy, returns samples per match
+    counts = []
+    for shard_id in range(shards):
+        with np.load(shard_path(output, shard_id)) as d:
+            counts.extend(d['counts'].tolist())
+    offsets = np.concatenate([[0], np.cumsum(counts, dtype = np.int64)])
+    path = os.path.join(output, 'samples.npy')
+    samples = np.lib.format.open_memmap(path + '.tmp', mode = 'w+', dtype = SAMPLE_DTYPE, shape = (int(offsets[-1]), ))
+    start = 0
+    for shard_id in range(shards):
+        with np.load(shard_path(output, shard_id)) as d:
+            end = start + len(d['act'])
+            for k in ('obs', 'mask', 'act'):
+                samples[k][start : end] = d[k]
+        start = end
+    samples.flush()
+    del samples
+    os.replace(path + '.tmp', path)
+    path = os.path.join(output, 'offsets.npy')
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, offsets)
+    os.replace(path + '.tmp', path)
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Preprocess Mahjong match log')
+    parser.add_argument('--input', type=str, default='data/data.txt', help='match log')
+    parser.add_argument('--output', type=str, default='data/', help='directory for shards and index')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--shard_size', type=int, default=1024, help='matches per shard')
+    parser.add_argument('--keep_shards', action='store_true', help='keep shard files after merging')
+    args = parser.parse_args()
+    os.makedirs(args.output, exist_ok=True)
+
+    shard_matches = []
+    with Pool(args.workers) as pool:
+        pending = []
+        shard = []
+        def submit(shard):
+            shard_id = len(shard_matches)
+            shard_matches.append(len(shard))
+            if shard_done(shard_path(args.output, shard_id), len(shard)):
+                print('Shard %d done, skipped' % shard_id)
+                return
+            pending.append(pool.apply_async(process_shard, (shard_id, shard, args.output)))
+            # bound the matches held in memory
+            while len(pending) > 2 * args.workers:
+                print('Shard %d written' % pending.pop(0).get())
+        for match in read_matches(args.input):
+            shard.append(match)
+            if len(shard) == args.shard_size:
+                submit(shard)
+                shard = []
+        if shard: submit(shard)
+        for result in pending:
+            print('Shard %d written' % result.get())
+
+    counts = merge_shards(args.output, len(shard_matches))
+    with open(os.path.join(args.output, 'index.json'), 'w') as f:
+        json.dump({'samples': 'samples.npy', 'offsets': 'offsets.npy', 'matches': len(counts), 'total': sum(counts)}, f)
+    with open(os.path.join(args.output, 'count.json'), 'w') as f:
+        json.dump(counts, f)
+    if not args.keep_shards:
+        for shard_id in range(len(shard_matches)):
+            os.remove(shard_path(args.output, shard_id))
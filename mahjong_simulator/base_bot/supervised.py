@@ -8,6 +8,7 @@ from custom_losses import FocalLoss, LabelSmoothingLoss
 from torch.optim.lr_scheduler import _LRScheduler
 import math
 import argparse
+from checkpoint import CheckpointWriter
 
 class WarmupCosineScheduler(_LRScheduler):
     def __init__(self, optimizer, warmup_epochs, max_epochs, warmup_start_lr=1e-8, eta_min=1e-8, last_epoch=-1):
@@ -28,13 +29,15 @@ class WarmupCosineScheduler(_LRScheduler):
 
 
 if __name__ == '__main__':
-    # parser = argparse.ArgumentParser(description='Train Mahjong model')
-    # parser.add_argument('--resume', type=str, help='path to checkpoint to resume from')
-    # parser.add_argument('--start_epoch', type=int, default=0, help='epoch to start training from')
-    # args = parser.parse_args()
+    parser = argparse.ArgumentParser(description='Train Mahjong model')
+    parser.add_argument('--resume', type=str, help='path to checkpoint to resume from, or "latest"')
+    parser.add_argument('--start_epoch', type=int, default=0, help='epoch to start training from')
+    parser.add_argument('--keep', type=int, default=None, help='number of checkpoints to keep (default all)')
+    args = parser.parse_args()
 
     logdir = 'model/'
-    os.makedirs(logdir + 'checkpoint', exist_ok=True)
+    # checkpoints are saved in the background while the next epoch trains
+    ckpt_writer = CheckpointWriter(logdir + 'checkpoint/%d.pkl', args.keep)
     
     # Load dataset
     splitRatio = 0.9
@@ -42,7 +45,7 @@ if __name__ == '__main__':
     originalDataset = MahjongGBDataset(0, splitRatio, True)
     trainDataset = AugmentedMahjongGBDataset(originalDataset, augmentation_factor=1)
     validateDataset = MahjongGBDataset(splitRatio, 1, False)
-    loader = DataLoader(dataset = trainDataset, batch_size = batchSize, shuffle = True)
+    loader = DataLoader(dataset = trainDataset, batch_size = batchSize, shuffle = True, collate_fn = trainDataset.collate) # augments whole batches
     vloader = DataLoader(dataset = validateDataset, batch_size = batchSize, shuffle = False)
     
     # Load model
@@ -57,22 +60,24 @@ if __name__ == '__main__':
     # loss_fn = LabelSmoothingLoss(235)
     
     # Load checkpoint if resuming
-    # if args.resume:
-    #     if os.path.isfile(args.resume):
-    #         print(f"Loading checkpoint '{args.resume}'")
-    #         checkpoint = torch.load(args.resume)
-    #         args.start_epoch = checkpoint['epoch']
-    #         model.load_state_dict(checkpoint['state_dict'])
-    #         optimizer.load_state_dict(checkpoint['optimizer'])
-    #         scheduler.load_state_dict(checkpoint['scheduler'])
-    #         print(f"Loaded checkpoint '{args.resume}' (epoch {checkpoint['epoch']})")
-    #     else:
-    #         print(f"No checkpoint found at '{args.resume}'")
+    if args.resume == 'latest':
+        args.resume = ckpt_writer.latest()
+    if args.resume:
+        if os.path.isfile(args.resume):
+            print(f"Loading checkpoint '{args.resume}'")
+            checkpoint = torch.load(args.resume, weights_only=False)
+            args.start_epoch = checkpoint['epoch']
+            model.load_state_dict(checkpoint['state_dict'])
+            optimizer.load_state_dict(checkpoint['optimizer'])
+            scheduler.load_state_dict(checkpoint['scheduler'])
+            print(f"Loaded checkpoint '{args.resume}' (epoch {checkpoint['epoch']})")
+        else:
+            print(f"No checkpoint found at '{args.resume}'")
     
     # Train and validate
-    for e in range(96):
+    for e in range(args.start_epoch, 96):
         print('Epoch', e)
-        torch.save(model.state_dict(), logdir + 'checkpoint/%d.pkl' % e)
+        ckpt_writer.save(e, {'epoch': e, 'state_dict': model.state_dict(), 'optimizer': optimizer.state_dict(), 'scheduler': scheduler.state_dict()})
         _correct = 0
         for i, d in enumerate(loader):
             input_dict = {'is_training': True, 'obs': {'observation': d[0].cuda(), 'action_mask': d[1].cuda()}}
@@ -98,4 +103,5 @@ if __name__ == '__main__':
         print('Epoch', e + 1, 'Validate acc:', acc)
         scheduler.step()
         with open('val_acc.txt', 'a') as f:
-            f.write(f'Epoch {e+1}, Validate acc: {acc}\n')
\ No newline at end of file
+            f.write(f'Epoch {e+1}, Validate acc: {acc}\n')
+    ckpt_writer.close()
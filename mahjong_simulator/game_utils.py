@@ -1,8 +1,13 @@
 import subprocess
+import asyncio
+import logging
 import os
+import sys
 import random
 from typing import List, Tuple, Optional, Dict, Any
 from MahjongGB import MahjongFanCalculator
+from base_bot.fan import fan_cache
+from sim_log import log, event
 
 # Tile Constants
 WAN = "W"; TONG = "B"; TIAO = "T"; FENG = "F"; JIAN = "J"
@@ -13,48 +18,48 @@ for i in range(1, 5): ALL_TILES.extend([f"{FENG}{i}"] * 4) # Winds E S W N
 for i in range(1, 4): ALL_TILES.extend([f"{JIAN}{i}"] * 4) # Dragons R G Wh
 
 class Agent:
-    def __init__(self, agent_id: int):
+    def __init__(self, agent_id: int, model_path: Optional[str] = None):
         self.agent_id = agent_id
-        agent_command = ["python", "base_bot/__main__.py"]
+        agent_command = ["python", "base_bot/__main__.py"] + ([os.path.abspath(model_path)] if model_path else [])
         cwd = os.path.dirname(os.path.abspath(__file__))
         self.process = subprocess.Popen(
             agent_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, # Merge stderr to stdout
             universal_newlines=True, bufsize=1, cwd=cwd
         )
     def send_request(self, request_str: str):
-        # print(f"Agent {self.agent_id} sending request: {request_str}") # DEBUG
+        event("request", logging.DEBUG, agent=self.agent_id, line=request_str)
         if self.process.stdin: self.process.stdin.write(request_str + "\n"); self.process.stdin.flush()
     def receive_response(self) -> str:
-        print(f"Sim: Agent {self.agent_id} ENTERING receive_response", flush=True) # NEW
+        log.debug("Sim: Agent %s ENTERING receive_response", self.agent_id) # NEW
         if not self.process.stdout:
-            print(f"Sim: Agent {self.agent_id} stdout is None, cannot receive response.", flush=True)
-            print(f"Sim: Agent {self.agent_id} EXITING receive_response with \"\" (type: {type('')})", flush=True) # MODIFIED
+            log.warning("Sim: Agent %s stdout is None, cannot receive response.", self.agent_id)
+            log.debug('Sim: Agent %s EXITING receive_response with "" (type: %s)', self.agent_id, type('')) # MODIFIED
             return ""
 
-        print(f"Sim: Agent {self.agent_id} waiting for response...", flush=True)
+        log.debug("Sim: Agent %s waiting for response...", self.agent_id)
         actual_response = "" # Initialize actual_response
         log_buffer = [] # Buffer for initial lines
 
         while True:
             line_read = self.process.stdout.readline().strip()
-            print(f"Sim: Agent {self.agent_id} raw read: '{line_read}'", flush=True)
+            log.debug("Sim: Agent %s raw read: '%s'", self.agent_id, line_read)
             log_buffer.append(line_read) # Keep a log of raw lines
 
             if not line_read: # Handle immediate EOF
-                print(f"Sim: Agent {self.agent_id} stdout.readline() returned empty. Possible EOF or agent crash.", flush=True)
+                log.warning("Sim: Agent %s stdout.readline() returned empty. Possible EOF or agent crash.", self.agent_id)
                 # Try to use the last non-empty line read as actual_response if any
                 # Iterate backwards through log_buffer to find the last meaningful line
                 # Start from len(log_buffer) - 2 because the last one (len(log_buffer) - 1) is the current empty line_read.
                 for i in range(len(log_buffer) - 2, -1, -1):
                     if log_buffer[i] and not log_buffer[i].startswith("AGENT"):
                         actual_response = log_buffer[i]
-                        print(f"Sim: Agent {self.agent_id} using last non-empty, non-debug line as response: '{actual_response}' due to EOF.", flush=True)
+                        log.warning("Sim: Agent %s using last non-empty, non-debug line as response: '%s' due to EOF.", self.agent_id, actual_response)
                         break
                 # If loop completes without break, actual_response remains "" (e.g. if only AGENT lines or all empty lines were read prior to EOF)
                 break # Exit while loop, as readline returned empty
 
             if line_read.startswith("AGENT"):
-                print(f"A{self.agent_id} DEBUG: {line_read}", flush=True) # Print AGENT debug line to simulator's console
+                log.debug("A%s DEBUG: %s", self.agent_id, line_read) # Print AGENT debug line to simulator's console
                 # actual_response remains unchanged from a previous non-AGENT line, or empty.
                 # We are skipping this debug line for the 'final' response determination for THIS iteration.
                 continue # Read next line
@@ -69,19 +74,19 @@ class Agent:
             # So, if actual_response is empty here, it means it was set by a previous (non-AGENT) line that was empty, which is unlikely to be an error marker itself.
             # The primary check here is for error keywords.
             if "Traceback" in actual_response or "Error" in actual_response or "Exception" in actual_response:
-                print(f"Sim: Agent {self.agent_id} detected error markers in response: '{actual_response}'. Collecting details.", flush=True)
+                log.warning("Sim: Agent %s detected error markers in response: '%s'. Collecting details.", self.agent_id, actual_response)
                 # Potentially an error or crash, try to read more for diagnostics
                 error_output = [actual_response] # Start with the line that has error markers
                 try:
                     for _ in range(10): # Read up to 10 more lines for the error
                         if self.process.stdout.closed:
-                            print(f"Sim: Agent {self.agent_id} stdout closed while collecting error context.", flush=True)
+                            log.warning("Sim: Agent %s stdout closed while collecting error context.", self.agent_id)
                             break
                         next_line = self.process.stdout.readline().strip()
-                        print(f"Sim: Agent {self.agent_id} raw read (error context): '{next_line}'", flush=True) # Log this attempt too
+                        log.debug("Sim: Agent %s raw read (error context): '%s'", self.agent_id, next_line) # Log this attempt too
                         if next_line:
                             if next_line.startswith("AGENT"): # Also print AGENT lines found during error gathering
-                                print(f"A{self.agent_id} DEBUG: {next_line}", flush=True)
+                                log.debug("A%s DEBUG: %s", self.agent_id, next_line)
                                 error_output.append(next_line) # Add to error_output to show context
                             else:
                                 error_output.append(next_line)
@@ -97,22 +102,22 @@ class Agent:
 
 
                     if any(line for line in error_output if line): # Only print if there's something to print
-                        print(f"--- Agent {self.agent_id} Diagnostic Output (from error markers) ---", flush=True)
+                        log.warning("--- Agent %s Diagnostic Output (from error markers) ---", self.agent_id)
                         for err_line in error_output:
                             # Avoid double printing "AGENT DEBUG:" lines if already handled above for individual AGENT lines
                             if not err_line.startswith(f"A{self.agent_id} DEBUG:") and not err_line.startswith("AGENT"): # Check both forms
-                                print(f"A{self.agent_id} CAPTURED: {err_line}", flush=True)
+                                log.warning("A%s CAPTURED: %s", self.agent_id, err_line)
                             elif err_line.startswith("AGENT") and not err_line.startswith(f"A{self.agent_id} DEBUG:"): # Original AGENT line
-                                print(f"A{self.agent_id} CAPTURED: {err_line}", flush=True)
+                                log.warning("A%s CAPTURED: %s", self.agent_id, err_line)
 
-                        print(f"--- End Agent {self.agent_id} Diagnostic ---", flush=True)
+                        log.warning("--- End Agent %s Diagnostic ---", self.agent_id)
 
                     # actual_response already holds the first line that contained the error string.
                     # This is what will be returned.
                     break # Exit while loop, error has been processed.
 
                 except Exception as e:
-                    print(f"Sim: Error while trying to read extended output from agent {self.agent_id} (error context): {e}", flush=True)
+                    log.error("Sim: Error while trying to read extended output from agent %s (error context): %s", self.agent_id, e)
                     # actual_response still holds the line that initiated error checking.
                     break # Exit while loop
 
@@ -121,11 +126,12 @@ class Agent:
 
         # Final logging for what is being returned.
         if not actual_response:
-            print(f"Sim: Agent {self.agent_id} receive_response is returning empty. Full log buffer for this attempt: {log_buffer}", flush=True)
+            log.warning("Sim: Agent %s receive_response is returning empty. Full log buffer for this attempt: %s", self.agent_id, log_buffer)
         else:
-            print(f"Sim: Agent {self.agent_id} receive_response determined actual response: '{actual_response}'", flush=True)
+            log.debug("Sim: Agent %s receive_response determined actual response: '%s'", self.agent_id, actual_response)
 
-        print(f"Sim: Agent {self.agent_id} EXITING receive_response with '{actual_response}' (type: {type(actual_response)})", flush=True) # NEW
+        log.debug("Sim: Agent %s EXITING receive_response with '%s' (type: %s)", self.agent_id, actual_response, type(actual_response)) # NEW
+        event("response", logging.DEBUG, agent=self.agent_id, line=actual_response)
         return actual_response
 
     def close(self):
@@ -135,6 +141,189 @@ class Agent:
             if self.process.stderr: self.process.stderr.close()
             self.process.terminate(); self.process.wait()
 
+BASE_BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "base_bot")
+
+class InProcessAgent:
+    """Runs base_bot's request handling inside the simulator process, with the same
+    Botzone request/response lines as Agent but no subprocess and no pipes. Models are
+    loaded once per path and shared by all seats. Agent stays for black-box bots."""
+    models: Dict[str, Any] = {}
+    def __init__(self, agent_id: int, model_path: Optional[str] = None):
+        self.agent_id = agent_id
+        model_path = os.path.abspath(model_path) if model_path else os.path.join(BASE_BOT_DIR, "model", "model.pkl")
+        if BASE_BOT_DIR not in sys.path: sys.path.insert(0, BASE_BOT_DIR) # base_bot uses flat imports
+        from bot import BotzoneBot, load_model
+        if model_path not in InProcessAgent.models: InProcessAgent.models[model_path] = load_model(model_path)
+        self.bot = BotzoneBot(InProcessAgent.models[model_path])
+        self.responses: List[str] = []
+    def send_request(self, request_str: str):
+        if not request_str.strip(): return # the bot skips empty lines
+        event("request", logging.DEBUG, agent=self.agent_id, line=request_str)
+        try:
+            response = self.bot.handle(request_str)
+            if response: self.responses.append(response) # the bot prints nothing for an empty response
+        except Exception as e:
+            # like a crashed subprocess bot, the simulator gets no response
+            log.warning("Sim: Agent %s failed on '%s': %r", self.agent_id, request_str, e)
+            self.responses.append("")
+    def receive_response(self) -> str:
+        response = self.responses.pop(0) if self.responses else ""
+        event("response", logging.DEBUG, agent=self.agent_id, line=response)
+        return response
+    def close(self):
+        self.responses.clear()
+
+class AwaitableAgent:
+    """Agent or InProcessAgent for the async game loop. receive_response still blocks,
+    so a game of these agents holds the event loop until its bots answer."""
+    def __init__(self, agent):
+        self.agent = agent
+        self.agent_id = agent.agent_id
+    def send_request(self, request_str: str):
+        self.agent.send_request(request_str)
+    async def receive_response(self) -> str:
+        return self.agent.receive_response()
+
+class AsyncAgent:
+    """base_bot/__main__.py on an asyncio subprocess, so many games share one event loop.
+    send_request only buffers the line, receive_response awaits the next response line (AGENT
+    debug lines skipped) for at most timeout seconds. After a timeout, EOF or an error message the
+    agent is failed and answers "" for the rest of the game, a late line would be taken for the
+    next response."""
+    def __init__(self, agent_id: int, model_path: Optional[str] = None, timeout: Optional[float] = None):
+        self.agent_id = agent_id
+        self.model_path = model_path
+        self.timeout = timeout
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.failed = False
+    async def start(self) -> "AsyncAgent":
+        agent_command = ["python", "base_bot/__main__.py"] + ([os.path.abspath(self.model_path)] if self.model_path else [])
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        self.process = await asyncio.create_subprocess_exec(
+            *agent_command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, cwd=cwd
+        )
+        return self
+    def alive(self) -> bool:
+        return not self.failed and self.process is not None and self.process.returncode is None
+    def send_request(self, request_str: str):
+        event("request", logging.DEBUG, agent=self.agent_id, line=request_str)
+        if self.failed or self.process.stdin.is_closing(): return
+        self.process.stdin.write((request_str + "\n").encode())
+    async def _read_response(self) -> Optional[str]:
+        while True:
+            line = await self.process.stdout.readline()
+            if not line: return None # EOF
+            line = line.decode().strip()
+            if not line: continue
+            if line.startswith("AGENT"):
+                log.debug("A%s DEBUG: %s", self.agent_id, line)
+                continue
+            return line
+    async def receive_response(self, timeout: Optional[float] = None) -> str:
+        # timeout: overrides the agent's timeout for this response
+        timeout = timeout or self.timeout
+        response = ""
+        if not self.failed:
+            try:
+                line = await asyncio.wait_for(self._read_response(), timeout)
+                if line is None: log.warning("Sim: Agent %s stdout closed. Possible agent crash.", self.agent_id)
+            except asyncio.TimeoutError:
+                log.warning("Sim: Agent %s timed out after %ss", self.agent_id, timeout)
+                line = None
+            if line is None: self.failed = True
+            elif "Traceback" in line or "Error" in line or "Exception" in line:
+                # the rest of the error would be taken for the next responses, read up to 10 more lines for the log
+                self.failed = True
+                error_output = [line]
+                try:
+                    for _ in range(10):
+                        line = await asyncio.wait_for(self._read_response(), 1.0)
+                        if line is None: break
+                        error_output.append(line)
+                except asyncio.TimeoutError: pass
+                log.warning("Sim: Agent %s detected error markers in response:\n%s", self.agent_id, "\n".join(error_output))
+            else: response = line
+        event("response", logging.DEBUG, agent=self.agent_id, line=response)
+        return response
+    async def close(self):
+        if self.process is None or self.process.returncode is not None: return
+        self.process.stdin.close()
+        try: self.process.terminate()
+        except ProcessLookupError: pass
+        await self.process.wait()
+
+async def broadcast(agents: List[Any], request_str: str) -> List[str]:
+    # one request to several agents, their responses awaited together
+    for agent in agents: agent.send_request(request_str)
+    return list(await asyncio.gather(*(agent.receive_response() for agent in agents)))
+
+class AgentPool:
+    """Keeps the agents of four seats alive across games. acquire() resets every agent with a
+    NEWGAME request before a game; agents that exited or do not answer OK are closed and started
+    again. Bots that do not know NEWGAME are started again for every game (reset_message=None).
+    model_paths gives the model of each agent, None for base_bot's default model."""
+    def __init__(self, agent_mode: str = "process", reset_message: Optional[str] = "NEWGAME", model_paths: Optional[List[Optional[str]]] = None):
+        self.agent_mode = agent_mode
+        self.reset_message = reset_message
+        self.model_paths = model_paths or [None] * 4
+        self.agents: List[Any] = [None] * 4
+        self.restarts = 0
+    def _start(self, agent_id: int):
+        model_path = self.model_paths[agent_id]
+        agent = InProcessAgent(agent_id, model_path) if self.agent_mode == "inprocess" else Agent(agent_id, model_path)
+        agent.send_request("") # the bot reads one line before its main loop
+        return agent
+    def _alive(self, agent) -> bool:
+        return not isinstance(agent, Agent) or agent.process.poll() is None
+    def acquire(self) -> List[Any]:
+        for i, agent in enumerate(self.agents):
+            if agent is not None and self.reset_message and self._alive(agent):
+                agent.send_request(self.reset_message)
+                if agent.receive_response() == "OK": continue
+            if agent is not None:
+                log.warning("Sim: restarting agent %s", i)
+                self.restarts += 1
+                try: agent.close()
+                except Exception: pass
+            self.agents[i] = self._start(i)
+        return self.agents
+    def close(self):
+        for agent in self.agents:
+            if agent is not None: agent.close()
+        self.agents = [None] * 4
+
+class AsyncAgentPool(AgentPool):
+    """AgentPool of AsyncAgents, acquire() and close() are coroutines and reset the four agents
+    concurrently. timeout is the response timeout of every agent, a started agent first answers
+    the reset message within startup_timeout, the time to load its model."""
+    def __init__(self, reset_message: Optional[str] = "NEWGAME", model_paths: Optional[List[Optional[str]]] = None,
+                 timeout: Optional[float] = None, startup_timeout: float = 120.0):
+        super().__init__("async", reset_message, model_paths)
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+    async def _restart(self, agent_id: int):
+        agent = self.agents[agent_id]
+        if agent is not None and self.reset_message and agent.alive():
+            agent.send_request(self.reset_message)
+            if await agent.receive_response() == "OK": return
+        if agent is not None:
+            log.warning("Sim: restarting agent %s", agent_id)
+            self.restarts += 1
+            await agent.close()
+        agent = await AsyncAgent(agent_id, self.model_paths[agent_id], self.timeout).start()
+        agent.send_request("") # the bot reads one line before its main loop
+        if self.reset_message:
+            agent.send_request(self.reset_message)
+            response = await agent.receive_response(self.startup_timeout)
+            if response != "OK": log.warning("Sim: agent %s answered '%s' to %s after start", agent_id, response, self.reset_message)
+        self.agents[agent_id] = agent
+    async def acquire(self) -> List[Any]:
+        await asyncio.gather(*(self._restart(i) for i in range(4)))
+        return self.agents
+    async def close(self):
+        await asyncio.gather(*(agent.close() for agent in self.agents if agent is not None))
+        self.agents = [None] * 4
+
 class Player:
     def __init__(self, player_id: int, agent_process: Agent, seat_wind: int):
         self.player_id: int = player_id
@@ -146,8 +335,10 @@ class Player:
         self.score: int = 0
 
 class GameState:
-    def __init__(self, agents: List[Agent]):
-        self.tile_wall: List[str] = list(ALL_TILES); random.shuffle(self.tile_wall)
+    def __init__(self, agents: List[Agent], tile_wall: Optional[List[str]] = None):
+        # tile_wall: a fixed wall for duplicate games, dealt and drawn from the end without shuffling
+        self.tile_wall: List[str] = list(tile_wall) if tile_wall is not None else list(ALL_TILES)
+        if tile_wall is None: random.shuffle(self.tile_wall)
         self.players: List[Player] = [Player(i, agents[i], i) for i in range(4)]
         self.dealer_player_index: int = 0
         self.current_player_index: int = self.dealer_player_index
@@ -173,10 +364,14 @@ class GameState:
         self.drew_kong_replacement_this_action: bool = False
         self.pending_qiangganghu_check: bool = False # New attribute
 
-        self.shuffle_and_deal()
+        if tile_wall is None: self.shuffle_and_deal()
+        else: self.deal()
 
     def shuffle_and_deal(self):
         random.shuffle(self.tile_wall)
+        self.deal()
+
+    def deal(self):
         for player in self.players: player.hand = [self.tile_wall.pop() for _ in range(13)]
 
     def draw_tile(self, player_index: int) -> Optional[str]:
@@ -208,7 +403,7 @@ class GameState:
 
         if is_draw or error_message:
             msg = f"ERROR: {error_message}" if error_message else "DRAW."
-            print(f"GAME ENDED ({msg})", flush=True)
+            log.info("GAME ENDED (%s)", msg)
             self.final_scores = {p.player_id: p.score for p in self.players}
             return
 
@@ -308,12 +503,12 @@ class GameState:
                             f_en = "Unknown Fan"
                     else:
                         # Unexpected format, skip or log error
-                        print(f"WARNING: Unexpected fan item format from PyMahjongGB: {fan_item}", flush=True)
+                        log.warning("WARNING: Unexpected fan item format from PyMahjongGB: %s", fan_item)
                         continue
                     self.win_details.append((fp, cnt, f_zh, f_en)); fan_cnt_total += fp * cnt
 
                 if fan_cnt_total < 8:
-                    print(f"Player {winner_index} HU claim has insufficient fans ({fan_cnt_total} < 8). Treating as Chombo.", flush=True)
+                    log.warning("Player %s HU claim has insufficient fans (%s < 8). Treating as Chombo.", winner_index, fan_cnt_total)
                     self.error_message = f"P{winner_index} Chombo - insufficient fans ({fan_cnt_total})."
                     chombo_penalty_winner = -8 * 3
                     self.players[winner_index].score += chombo_penalty_winner
@@ -333,7 +528,7 @@ class GameState:
 
                     if payer_idx is None:
                         self.error_message = "Payer index not determined for non-self-drawn win."
-                        print(f"GAME ENDED (ERROR): {self.error_message}", flush=True)
+                        log.warning("GAME ENDED (ERROR): %s", self.error_message)
                         self.final_scores = {p.player_id: p.score for p in self.players}; return
 
                     if is_robbing_kong:
@@ -350,11 +545,10 @@ class GameState:
 
                 self.final_scores = {p.player_id: p.score for p in self.players}
                 win_type_str = "ROBBING KONG" if is_robbing_kong else ("SELF-DRAWN (After Kong)" if was_kong_replacement_draw and is_self_drawn else ("SELF-DRAWN" if is_self_drawn else "DISCARD"))
-                print(f"GAME ENDED (WIN): Player {winner_index} wins with {fan_cnt_total} Fan (+{base_score} Base). Type: {win_type_str}.", flush=True)
-                if self.win_details: print(f"  Fan Details: {self.win_details}", flush=True)
+                log.info("GAME ENDED (WIN): Player %s wins with %s Fan (+%s Base). Type: %s.", winner_index, fan_cnt_total, base_score, win_type_str)
+                if self.win_details: log.info("  Fan Details: %s", self.win_details)
             except Exception as e:
-                print(f"Error during MahjongFanCalculator for P{winner_index}: {e}", flush=True)
-                import traceback; traceback.print_exc()
+                log.exception("Error during MahjongFanCalculator for P%s: %s", winner_index, e)
                 self.error_message = f"P{winner_index} score calculation error: {e}"
                 self.final_scores = {p.player_id: p.score for p in self.players}
         else:
@@ -362,7 +556,6 @@ class GameState:
 
     def can_player_hu_discard(self, player_idx: int, discarded_tile: str, num_wall_tiles_left: int, is_potential_robbing_kong: bool = False) -> bool:
         player = self.players[player_idx]
-        temp_hand = list(player.hand); temp_hand.append(discarded_tile); temp_hand.sort()
         calculator_melds = []
         for meld_tuple in player.melds:
             meld_type = meld_tuple[0].upper(); tile1 = meld_tuple[1]; data = meld_tuple[2]
@@ -370,17 +563,17 @@ class GameState:
             if meld_type == "CHI": offer_relative = self._get_relative_offer(meld_tuple[3], player_idx)
             elif meld_type in ["PENG", "GANG", "ANGANG", "BUGANG"]:
                 offer_relative = self._get_relative_offer(data, player_idx)
-                if meld_type == "BUGANG": actual_calc_meld_type = "GANG"
-                if meld_type == "ANGANG": actual_calc_meld_type = "KONG"
+                if meld_type in ["BUGANG", "ANGANG"]: actual_calc_meld_type = "GANG"
             calculator_melds.append((actual_calc_meld_type, tile1, offer_relative))
+        # The calculator expects the hand without the winning tile; results are cached across calls
         try:
-            fan_total = MahjongFanCalculator(
-                pack=tuple(calculator_melds), hand=tuple(temp_hand), winTile=discarded_tile, flowerCount=0,
+            fan_total = fan_cache.fan_count(
+                pack=calculator_melds, hand=player.hand, winTile=discarded_tile, flowerCount=0,
                 isSelfDrawn=False, is4thTile=False,
                 isAboutKong=is_potential_robbing_kong, # Correctly using the passed flag
                 isWallLast=(num_wall_tiles_left == 0),
                 seatWind=player.seat_wind, prevalentWind=self.prevalent_wind
-            ).calculate_fan()
+            )
             return fan_total >= 8
         except Exception: return False
 
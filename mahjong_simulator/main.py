@@ -1,80 +1,113 @@
-from game_utils import Agent, GameState
-import sys # For flushing stdout
-from typing import Optional # Ensure Optional is imported
-
-def run_game():
-    print("Starting game...")
+from game_utils import Agent, InProcessAgent, AgentPool, AsyncAgentPool, AwaitableAgent, GameState, broadcast
+from sim_log import log, event
+import sim_log
+import argparse
+import logging
+import asyncio
+from typing import Optional, List, Tuple, Any # Ensure Optional is imported
+
+def run_game(agent_mode: str = "process", pool: Optional[AgentPool] = None,
+             tile_wall: Optional[List[str]] = None, seats: Optional[List[int]] = None) -> Optional[GameState]:
+    # agent_mode: "process" runs base_bot/__main__.py per seat, "inprocess" runs the bot in this process
+    # pool: reuse the agents of an AgentPool instead of starting (and closing) new ones
+    # tile_wall: play this wall instead of a random one, seats: agent index seated at each seat
+    # returns the finished GameState, None if the game could not be set up
+    log.info("Starting game...")
     agents = []
+    gs = None
     try:
-        # 1. Initialize four Agent objects
-        print("Initializing agents...")
-        for i in range(4):
-            agents.append(Agent(agent_id=i))
-        print("Agents initialized.")
-
-        # 2. Crucial: Send initial newline to each agent
-        print("Sending initial newline to agents...")
-        for i, agent_proc in enumerate(agents):
-            # The agent_trainer/__main__.py has an input() call before its main loop.
-            # Sending an empty string + newline via send_request.
-            agent_proc.send_request("")
-            print(f"Sent initial newline to agent {i}.")
-        print("Initial newlines sent.")
-
-        # 3. Create GameState instance
-        print("Creating GameState...")
-        gs = GameState(agents)
-        print("GameState created.")
-        print(f"Prevalent wind (Quan): {gs.prevalent_wind}")
+        if pool is not None:
+            log.debug("Resetting pooled agents...")
+            agents = pool.acquire()
+        else:
+            # 1. Initialize four Agent objects
+            log.debug("Initializing agents...")
+            for i in range(4):
+                agents.append(InProcessAgent(agent_id=i) if agent_mode == "inprocess" else Agent(agent_id=i))
+            log.debug("Agents initialized.")
+
+            # 2. Crucial: Send initial newline to each agent
+            log.debug("Sending initial newline to agents...")
+            for i, agent_proc in enumerate(agents):
+                # The agent_trainer/__main__.py has an input() call before its main loop.
+                # Sending an empty string + newline via send_request.
+                agent_proc.send_request("")
+                log.debug("Sent initial newline to agent %s.", i)
+            log.debug("Initial newlines sent.")
+
+        # 3. Play the game, the blocking agents are wrapped for the async game loop
+        seated = agents if seats is None else [agents[i] for i in seats]
+        gs = asyncio.run(play_game([AwaitableAgent(agent) for agent in seated], tile_wall))
+
+    except Exception as e:
+        log.exception("An error occurred during the game: %s", e)
+    finally:
+        # 5. Agent Cleanup, pooled agents stay alive for the next game
+        if pool is None:
+            log.debug("Closing agent processes...")
+            for i, agent_proc in enumerate(agents):
+                if agent_proc: # Check if agent was successfully created
+                    log.debug("Closing agent %s...", i)
+                    agent_proc.close()
+                    log.debug("Agent %s closed.", i)
+            log.debug("All agent processes closed.")
+    return gs
+
+async def play_game(agents: List[Any], tile_wall: Optional[List[str]] = None) -> GameState:
+    # agents: the agent of each seat, with a coroutine receive_response (AwaitableAgent or AsyncAgent)
+    # requests to several seats are sent together and their responses awaited concurrently
+    log.debug("Creating GameState...")
+    gs = GameState(agents, tile_wall)
+    try:
+        log.debug("GameState created.")
+        log.debug("Prevalent wind (Quan): %s", gs.prevalent_wind)
         for i, player in enumerate(gs.players):
-            print(f"Player {i} initial hand: {player.hand}")
-        sys.stdout.flush()
+            log.debug("Player %s initial hand: %s", i, player.hand)
+        event("game_start", logging.DEBUG, prevalent_wind=gs.prevalent_wind, agents=[p.agent.agent_id for p in gs.players], hands=[list(p.hand) for p in gs.players])
 
 
-        # 4. Initial Agent Communication Loop
+        # 4. Initial Agent Communication, each request goes to all four agents before any response is awaited
         for p_idx in range(4):
             player = gs.players[p_idx]
             agent = player.agent # This is agents[p_idx]
 
-            print(f"\nCommunicating with Player {p_idx} (Agent ID: {agent.agent_id}, Seat Wind: {player.seat_wind})...")
-            sys.stdout.flush()
+            log.debug("Communicating with Player %s (Agent ID: %s, Seat Wind: %s)...", p_idx, agent.agent_id, player.seat_wind)
 
             # Request 0: Position and Round Wind
             # Format: "0 <player_id> <prevalent_wind>"
             # player.player_id is their seat, 0-3. gs.prevalent_wind is 0-3.
             req0 = f"0 {player.player_id} {gs.prevalent_wind}"
-            print(f"P{p_idx} Sending Req0: '{req0}'")
-            sys.stdout.flush()
+            log.debug("P%s Sending Req0: '%s'", p_idx, req0)
             agent.send_request(req0)
 
-            resp0 = agent.receive_response()
-            print(f"P{p_idx} Received Resp0: '{resp0}'")
-            sys.stdout.flush()
+        resps0 = await asyncio.gather(*(player.agent.receive_response() for player in gs.players))
+        for p_idx, resp0 in enumerate(resps0):
+            log.debug("P%s Received Resp0: '%s'", p_idx, resp0)
             if resp0 != "PASS":
-                print(f"Error: P{p_idx} Req0 expected PASS, got {resp0}")
+                log.warning("Error: P%s Req0 expected PASS, got %s", p_idx, resp0)
                 # Potentially raise an error or handle more gracefully
 
+        for p_idx in range(4):
+            player = gs.players[p_idx]
             # Request 1: Initial Hand
             # Format: "1 0 0 0 0 <hand_tiles_space_separated>" (no flower tiles)
             # Player's hand is already dealt by GameState constructor
             hand_str = " ".join(player.hand)
             req1 = f"1 0 0 0 0 {hand_str}"
-            print(f"P{p_idx} Sending Req1: '{req1}'")
-            sys.stdout.flush()
-            agent.send_request(req1)
+            log.debug("P%s Sending Req1: '%s'", p_idx, req1)
+            player.agent.send_request(req1)
 
-            resp1 = agent.receive_response()
-            print(f"P{p_idx} Received Resp1: '{resp1}'")
-            sys.stdout.flush()
+        resps1 = await asyncio.gather(*(player.agent.receive_response() for player in gs.players))
+        for p_idx, resp1 in enumerate(resps1):
+            log.debug("P%s Received Resp1: '%s'", p_idx, resp1)
             if resp1 != "PASS":
-                print(f"Error: P{p_idx} Req1 expected PASS, got {resp1}")
+                log.warning("Error: P%s Req1 expected PASS, got %s", p_idx, resp1)
                 # Potentially raise an error or handle more gracefully
 
-        print("\nInitial communication sequence finished for all players.")
-        sys.stdout.flush()
+        log.debug("Initial communication sequence finished for all players.")
 
         # --- Main Game Loop ---
-        print("\n--- Starting Main Game Loop ---", flush=True)
+        log.debug("--- Starting Main Game Loop ---")
         while not gs.game_over:
             current_player_index = gs.current_player_index
             current_player = gs.players[current_player_index]
@@ -85,7 +118,7 @@ def run_game():
             response_from_agent: Optional[str] = None
 
             if gs.pending_qiangganghu_check:
-                print(f"--- Evaluating QiangGangHu for P{gs.last_discarding_player_index}'s BUGANG of {gs.about_to_BUGANG_tile} ---", flush=True)
+                log.debug("--- Evaluating QiangGangHu for P%s's BUGANG of %s ---", gs.last_discarding_player_index, gs.about_to_BUGANG_tile)
                 gs.pending_qiangganghu_check = False # Consume the flag
 
                 bugang_tile_being_robbed = gs.about_to_BUGANG_tile
@@ -97,13 +130,13 @@ def run_game():
                         # Validate if this player can actually HU on this tile (as a robbing kong)
                         if gs.can_player_hu_discard(p_idx, bugang_tile_being_robbed, len(gs.tile_wall), is_potential_robbing_kong=True):
                             potential_robbers.append(p_idx)
-                            print(f"  Player {p_idx} can QiangGangHu on {bugang_tile_being_robbed}.", flush=True)
+                            log.debug("  Player %s can QiangGangHu on %s.", p_idx, bugang_tile_being_robbed)
                         else:
-                            print(f"  Player {p_idx} claimed HU on BUGANG {bugang_tile_being_robbed} but validation failed.", flush=True)
+                            log.warning("  Player %s claimed HU on BUGANG %s but validation failed.", p_idx, bugang_tile_being_robbed)
 
                 if potential_robbers:
                     robbing_player_idx = min(potential_robbers) # Simplistic choice: lowest index player
-                    print(f"Player {robbing_player_idx} WINS by ROBBING THE KONG (QiangGangHu) of {bugang_tile_being_robbed} from P{bugang_player_idx}!", flush=True)
+                    log.info("Player %s WINS by ROBBING THE KONG (QiangGangHu) of %s from P%s!", robbing_player_idx, bugang_tile_being_robbed, bugang_player_idx)
 
                     robbed_player = gs.players[bugang_player_idx]
                     # Revert the BuGang meld for the robbed player
@@ -114,7 +147,7 @@ def run_game():
                             robbed_player.melds[i] = ('PENG', meld_tuple[1], meld_tuple[2], None) # Revert to PENG
                             robbed_player.hand.append(bugang_tile_being_robbed) # Give tile back
                             robbed_player.hand.sort()
-                            print(f"  P{bugang_player_idx}'s BUGANG of {bugang_tile_being_robbed} reverted. Hand: {robbed_player.hand}, Melds: {robbed_player.melds}", flush=True)
+                            log.debug("  P%s's BUGANG of %s reverted. Hand: %s, Melds: %s", bugang_player_idx, bugang_tile_being_robbed, robbed_player.hand, robbed_player.melds)
                             break
 
                     gs.end_game(winner_index=robbing_player_idx, winning_tile=bugang_tile_being_robbed,
@@ -129,18 +162,18 @@ def run_game():
                     # gs.about_to_BUGANG_tile holds the tile that was BuGanged.
                     success_bugang_tile = gs.about_to_BUGANG_tile # Store for clarity before gs.about_to_BUGANG_tile is cleared
 
-                    print(f"No QiangGangHu. P{bugang_player_idx}'s BUGANG of {success_bugang_tile} is successful.", flush=True)
+                    log.debug("No QiangGangHu. P%s's BUGANG of %s is successful.", bugang_player_idx, success_bugang_tile)
 
                     # --- Self-notify agent of successful BuGang before drawing replacement tile ---
                     if success_bugang_tile: # Ensure tile is valid
                         bugang_self_req_str = f"3 {bugang_player_idx} BUGANG {success_bugang_tile}"
                         bugang_agent = gs.players[bugang_player_idx].agent
-                        print(f"Sim: Notifying P{bugang_player_idx} (Self) of successful BUGANG: '{bugang_self_req_str}'", flush=True)
+                        log.debug("Sim: Notifying P%s (Self) of successful BUGANG: '%s'", bugang_player_idx, bugang_self_req_str)
                         bugang_agent.send_request(bugang_self_req_str)
-                        resp_self_bugang = bugang_agent.receive_response()
-                        print(f"  P{bugang_player_idx} (Self) response to successful BUGANG notification of {success_bugang_tile}: '{resp_self_bugang}'", flush=True)
+                        resp_self_bugang = await bugang_agent.receive_response()
+                        log.debug("  P%s (Self) response to successful BUGANG notification of %s: '%s'", bugang_player_idx, success_bugang_tile, resp_self_bugang)
                         if resp_self_bugang.upper() != "PASS":
-                            print(f"WARNING: P{bugang_player_idx} (Self) did not PASS after successful BUGANG self-notification. Got: {resp_self_bugang}", flush=True)
+                            log.warning("WARNING: P%s (Self) did not PASS after successful BUGANG self-notification. Got: %s", bugang_player_idx, resp_self_bugang)
                     # --- End Self-notification for BuGang ---
 
                     gs.current_player_index = bugang_player_idx # Ensure current player is still the BuGanger
@@ -154,8 +187,8 @@ def run_game():
             elif gs.just_declared_kong:
                 # This player just declared a KONG (AnGang, successful BuGang, or Ming Kong from discard)
                 # and needs to draw a replacement tile.
-                print(f"--- Turn {gs.turn_number} (Player {current_player_index} KONG REPLACEMENT) ---", flush=True)
-                print(f"Player {current_player_index} hand before KONG replacement: {current_player.hand}", flush=True)
+                log.debug("--- Turn %s (Player %s KONG REPLACEMENT) ---", gs.turn_number, current_player_index)
+                log.debug("Player %s hand before KONG replacement: %s", current_player_index, current_player.hand)
 
                 # Reset Kong flags before drawing replacement.
                 # Note: gs.about_to_BUGANG_tile is reset in draw_tile if it was a BuGang that didn't get robbed.
@@ -167,31 +200,31 @@ def run_game():
 
                 action_context_tile = gs.draw_tile(current_player_index) # This resets relevant flags like just_declared_kong
                 if action_context_tile is None:
-                    print("Wall is empty during KONG replacement draw. Game is a draw.", flush=True)
+                    log.info("Wall is empty during KONG replacement draw. Game is a draw.")
                     gs.end_game(is_draw=True, error_message="Wall empty on kong replacement", was_kong_replacement_draw=True) # Pass flag
                     break
 
-                print(f"Player {current_player_index} draws KONG replacement tile: {action_context_tile}", flush=True)
+                log.debug("Player %s draws KONG replacement tile: %s", current_player_index, action_context_tile)
                 current_player.hand.append(action_context_tile)
                 current_player.hand.sort()
-                print(f"Player {current_player_index} hand after KONG replacement (before decision): {current_player.hand}", flush=True)
+                log.debug("Player %s hand after KONG replacement (before decision): %s", current_player_index, current_player.hand)
 
                 # Agent needs to act on this new tile (e.g., PLAY, another GANG, HU)
-                print(f"SIM_DEBUG: P{current_player_index} hand before agent decision (after KONG replacement draw {action_context_tile}): {current_player.hand}", flush=True) # ADD THIS
+                log.debug("SIM_DEBUG: P%s hand before agent decision (after KONG replacement draw %s): %s", current_player_index, action_context_tile, current_player.hand) # ADD THIS
                 request_str = f"2 {action_context_tile}" # Same as normal draw for agent's perspective
                 # print(f"Player {current_player_index} hand: {current_player.hand}") # DEBUG
-                print(f"SIM_DEBUG: P{current_player_index} sending KONG replacement request: '{request_str}'", flush=True) # ADD THIS
+                log.debug("SIM_DEBUG: P%s sending KONG replacement request: '%s'", current_player_index, request_str) # ADD THIS
                 current_agent.send_request(request_str)
-                response_from_agent = current_agent.receive_response()
-                print(f"SIM_DEBUG: P{current_player_index} agent KONG replacement response: '{response_from_agent}'", flush=True) # ADD THIS
+                response_from_agent = await current_agent.receive_response()
+                log.debug("SIM_DEBUG: P%s agent KONG replacement response: '%s'", current_player_index, response_from_agent) # ADD THIS
                 # print(f"Player {current_player_index} response: {response_from_agent}") # DEBUG
-                print(f"Player {current_player_index} KONG replacement draw req: '{request_str}', Agent response: '{response_from_agent}'", flush=True)
+                log.debug("Player %s KONG replacement draw req: '%s', Agent response: '%s'", current_player_index, request_str, response_from_agent)
 
             elif gs.just_discarded:
                 # A player has discarded, and we need to process other players' reactions (PENG, CHI, GANG, HU or PASS)
                 # This part of the loop is for determining who acts next, or if play passes to next player.
-                print(f"--- Evaluating Discard from P{gs.last_discarding_player_index} (Tile: {gs.last_discarded_tile}) ---", flush=True)
-                print(f"  Responses from other players: {gs.current_action_responses}", flush=True)
+                log.debug("--- Evaluating Discard from P%s (Tile: %s) ---", gs.last_discarding_player_index, gs.last_discarded_tile)
+                log.debug("  Responses from other players: %s", gs.current_action_responses)
 
                 # TODO: Implement logic to prioritize HU > PENG/GANG > CHI from gs.current_action_responses
                 # This includes:
@@ -222,13 +255,13 @@ def run_game():
                         is_robbing_kong_context = (gs.about_to_BUGANG_tile == gs.last_discarded_tile)
                         if gs.can_player_hu_discard(p_idx, gs.last_discarded_tile, num_wall_tiles, is_potential_robbing_kong=is_robbing_kong_context):
                             potential_actions.append({'type': 'HU', 'player_idx': p_idx, 'tile': gs.last_discarded_tile, 'is_robbing': is_robbing_kong_context})
-                            print(f"  Player {p_idx} validated HU on {gs.last_discarded_tile} (Robbing context: {is_robbing_kong_context}).", flush=True)
+                            log.debug("  Player %s validated HU on %s (Robbing context: %s).", p_idx, gs.last_discarded_tile, is_robbing_kong_context)
                         else:
-                            print(f"  Player {p_idx} claimed HU on {gs.last_discarded_tile} but validation FAILED. Hand: {player_to_check.hand}, Melds: {player_to_check.melds}", flush=True)
+                            log.warning("  Player %s claimed HU on %s but validation FAILED. Hand: %s, Melds: %s", p_idx, gs.last_discarded_tile, player_to_check.hand, player_to_check.melds)
                     elif action == "PENG":
                         if gs.can_player_peng(p_idx, gs.last_discarded_tile):
                             if len(response_parts) < 2:
-                                print(f"  Player {p_idx} PENG response invalid (missing tile to play): '{response_str}'", flush=True)
+                                log.warning("  Player %s PENG response invalid (missing tile to play): '%s'", p_idx, response_str)
                                 continue
                             tile_to_play_after_peng = response_parts[1]
                             potential_actions.append({
@@ -236,19 +269,19 @@ def run_game():
                                 'tile': gs.last_discarded_tile,
                                 'play_after': tile_to_play_after_peng
                             })
-                            print(f"  Player {p_idx} validated PENG on {gs.last_discarded_tile}.", flush=True)
+                            log.debug("  Player %s validated PENG on %s.", p_idx, gs.last_discarded_tile)
                         else:
-                            print(f"  Player {p_idx} claimed PENG on {gs.last_discarded_tile} but validation FAILED (Hand: {player_to_check.hand}).", flush=True)
+                            log.warning("  Player %s claimed PENG on %s but validation FAILED (Hand: %s).", p_idx, gs.last_discarded_tile, player_to_check.hand)
                     elif action == "GANG": # Ming Kong from discard
                         if gs.can_player_ming_kong_from_discard(p_idx, gs.last_discarded_tile):
                             potential_actions.append({'type': 'KONG', 'player_idx': p_idx, 'tile': gs.last_discarded_tile})
-                            print(f"  Player {p_idx} validated KONG on {gs.last_discarded_tile}.", flush=True)
+                            log.debug("  Player %s validated KONG on %s.", p_idx, gs.last_discarded_tile)
                         else:
-                            print(f"  Player {p_idx} claimed KONG on {gs.last_discarded_tile} but validation FAILED (Hand: {player_to_check.hand}).", flush=True)
+                            log.warning("  Player %s claimed KONG on %s but validation FAILED (Hand: %s).", p_idx, gs.last_discarded_tile, player_to_check.hand)
                     elif action == "CHI":
                         if p_idx == (gs.last_discarding_player_index + 1) % 4: # CHI only for next player
                             if len(response_parts) < 3: # "CHI <middle_tile> <tile_to_play>"
-                                print(f"  Player {p_idx} CHI response invalid (missing middle tile or tile to play): '{response_str}'", flush=True)
+                                log.warning("  Player %s CHI response invalid (missing middle tile or tile to play): '%s'", p_idx, response_str)
                                 continue
                             chi_middle_tile = response_parts[1]
                             tile_to_play_after_chi = response_parts[2]
@@ -262,11 +295,11 @@ def run_game():
                                     'play_after': tile_to_play_after_chi,
                                     'hand_tiles_for_chi': required_hand_tiles_for_chi # Store for removal
                                 })
-                                print(f"  Player {p_idx} validated CHI on {gs.last_discarded_tile} with middle {chi_middle_tile}.", flush=True)
+                                log.debug("  Player %s validated CHI on %s with middle %s.", p_idx, gs.last_discarded_tile, chi_middle_tile)
                             else:
-                                print(f"  Player {p_idx} claimed CHI on {gs.last_discarded_tile} with middle {chi_middle_tile} but validation FAILED (Hand: {player_to_check.hand}).", flush=True)
+                                log.warning("  Player %s claimed CHI on %s with middle %s but validation FAILED (Hand: %s).", p_idx, gs.last_discarded_tile, chi_middle_tile, player_to_check.hand)
                         else:
-                             print(f"  Player {p_idx} attempted CHI out of turn for {gs.last_discarded_tile}.", flush=True)
+                             log.warning("  Player %s attempted CHI out of turn for %s.", p_idx, gs.last_discarded_tile)
 
                 # Priority: HU > KONG > PENG > CHI
                 hu_action = None
@@ -274,13 +307,13 @@ def run_game():
                 if all_hu_actions:
                     hu_action = min(all_hu_actions, key=lambda x: x['player_idx']) # Simplistic choice
                     if len(all_hu_actions) > 1:
-                         print(f"  Multiple valid HU claims. Player {hu_action['player_idx']} selected.", flush=True)
+                         log.debug("  Multiple valid HU claims. Player %s selected.", hu_action['player_idx'])
 
                 if hu_action:
                     acting_player_idx = hu_action['player_idx']
                     winning_tile = hu_action['tile']
                     is_robbing = hu_action.get('is_robbing', False) # Get robbing status from action
-                    print(f"Player {acting_player_idx} WINS by HU on discard {winning_tile} from P{gs.last_discarding_player_index}! (Robbing: {is_robbing})", flush=True)
+                    log.info("Player %s WINS by HU on discard %s from P%s! (Robbing: %s)", acting_player_idx, winning_tile, gs.last_discarding_player_index, is_robbing)
                     gs.end_game(winner_index=acting_player_idx, winning_tile=winning_tile, is_self_drawn=False, is_robbing_kong=is_robbing)
                     for i in range(4): gs.players[i].agent.send_request(f"3 {acting_player_idx} HU")
                     processed_player_action_on_discard = True
@@ -293,7 +326,7 @@ def run_game():
                         acting_player_idx = kong_action['player_idx']
                         acted_tile = kong_action['tile']
                         acting_player = gs.players[acting_player_idx]
-                        print(f"Player {acting_player_idx} KONGs (Ming) {acted_tile} from P{gs.last_discarding_player_index}.", flush=True)
+                        log.debug("Player %s KONGs (Ming) %s from P%s.", acting_player_idx, acted_tile, gs.last_discarding_player_index)
 
                         for _ in range(3): # Remove 3 for Ming Kong
                             if acted_tile in acting_player.hand: acting_player.hand.remove(acted_tile)
@@ -303,13 +336,10 @@ def run_game():
 
                         acting_player.melds.append(('GANG', acted_tile, gs.last_discarding_player_index))
                         acting_player.hand.sort()
-                        print(f"  P{acting_player_idx} hand after KONG: {acting_player.hand}, Melds: {acting_player.melds}", flush=True)
+                        log.debug("  P%s hand after KONG: %s, Melds: %s", acting_player_idx, acting_player.hand, acting_player.melds)
 
                         kong_broadcast_msg = f"3 {acting_player_idx} GANG" # No tile after GANG for BotIO for Ming Kong on discard
-                        for i in range(4):
-                            if i == acting_player_idx: continue
-                            gs.players[i].agent.send_request(kong_broadcast_msg)
-                            gs.players[i].agent.receive_response() # Expect PASS
+                        await broadcast([gs.players[i].agent for i in range(4) if i != acting_player_idx], kong_broadcast_msg) # Expect PASS
 
                         gs.current_player_index = acting_player_idx
                         gs.just_declared_kong = True # Player will draw replacement
@@ -327,7 +357,7 @@ def run_game():
                             acted_tile = peng_action['tile']
                             tile_to_play_after_peng = peng_action['play_after']
                             acting_player = gs.players[acting_player_idx]
-                            print(f"Player {acting_player_idx} PENGs {acted_tile} from P{gs.last_discarding_player_index}.", flush=True)
+                            log.debug("Player %s PENGs %s from P%s.", acting_player_idx, acted_tile, gs.last_discarding_player_index)
 
                             for _ in range(2):
                                 if acted_tile in acting_player.hand: acting_player.hand.remove(acted_tile)
@@ -336,26 +366,24 @@ def run_game():
 
                             acting_player.melds.append(('PENG', acted_tile, gs.last_discarding_player_index))
                             acting_player.hand.sort()
-                            print(f"  P{acting_player_idx} hand after PENG: {acting_player.hand}, Melds: {acting_player.melds}", flush=True)
+                            log.debug("  P%s hand after PENG: %s, Melds: %s", acting_player_idx, acting_player.hand, acting_player.melds)
 
-                            print(f"SIM_DEBUG: P{acting_player_idx} hand before PENG discard decision ('{tile_to_play_after_peng}'): {acting_player.hand}", flush=True) # ADD THIS
+                            log.debug("SIM_DEBUG: P%s hand before PENG discard decision ('%s'): %s", acting_player_idx, tile_to_play_after_peng, acting_player.hand) # ADD THIS
                             if tile_to_play_after_peng not in acting_player.hand:
                                 gs.end_game(error_message=f"P{acting_player_idx} PENG invalid discard {tile_to_play_after_peng}. Hand: {acting_player.hand}")
                                 processed_player_action_on_discard = True # Game ends
                             else:
-                                print(f"SIM_DEBUG: P{acting_player_idx} PENG discard is valid.", flush=True) # ADD THIS
+                                log.debug("SIM_DEBUG: P%s PENG discard is valid.", acting_player_idx) # ADD THIS
                                 acting_player.hand.remove(tile_to_play_after_peng)
                                 acting_player.hand.sort()
                                 acting_player.discarded_tiles.append(tile_to_play_after_peng)
-                                print(f"  P{acting_player_idx} then discards {tile_to_play_after_peng}. Hand: {acting_player.hand}", flush=True)
+                                log.debug("  P%s then discards %s. Hand: %s", acting_player_idx, tile_to_play_after_peng, acting_player.hand)
 
                                 peng_broadcast_msg = f"3 {acting_player_idx} PENG {tile_to_play_after_peng}"
-                                new_responses = {}
-                                for i in range(4):
-                                    if i == acting_player_idx: continue
-                                    gs.players[i].agent.send_request(peng_broadcast_msg)
-                                    new_responses[i] = gs.players[i].agent.receive_response()
-                                    print(f"    P{i} (Agent {gs.players[i].agent.agent_id}) response to PENG broadcast (P{acting_player_idx} played {tile_to_play_after_peng}): '{new_responses[i]}'", flush=True)
+                                others = [i for i in range(4) if i != acting_player_idx]
+                                new_responses = dict(zip(others, await broadcast([gs.players[i].agent for i in others], peng_broadcast_msg)))
+                                for i in others:
+                                    log.debug("    P%s (Agent %s) response to PENG broadcast (P%s played %s): '%s'", i, gs.players[i].agent.agent_id, acting_player_idx, tile_to_play_after_peng, new_responses[i])
 
                                 gs.last_discarded_tile = tile_to_play_after_peng
                                 gs.last_discarding_player_index = acting_player_idx
@@ -367,12 +395,12 @@ def run_game():
 
                                 # Notify the acting agent (self) about its own PENG and PLAY
                                 acting_agent_for_peng = gs.players[acting_player_idx].agent
-                                print(f"Sim: Notifying P{acting_player_idx} (self) of PENG and PLAY: '{peng_broadcast_msg}'", flush=True)
+                                log.debug("Sim: Notifying P%s (self) of PENG and PLAY: '%s'", acting_player_idx, peng_broadcast_msg)
                                 acting_agent_for_peng.send_request(peng_broadcast_msg)
-                                self_response_peng = acting_agent_for_peng.receive_response()
-                                print(f"Sim: P{acting_player_idx} (self) response to PENG-PLAY notification: '{self_response_peng}'", flush=True)
+                                self_response_peng = await acting_agent_for_peng.receive_response()
+                                log.debug("Sim: P%s (self) response to PENG-PLAY notification: '%s'", acting_player_idx, self_response_peng)
                                 if self_response_peng.upper() != "PASS":
-                                    print(f"WARNING: P{acting_player_idx} (self) did not PASS after PENG-PLAY notification. Got: {self_response_peng}", flush=True)
+                                    log.warning("WARNING: P%s (self) did not PASS after PENG-PLAY notification. Got: %s", acting_player_idx, self_response_peng)
 
                         else: # No PENG, check CHI
                             chi_action = next((act for act in potential_actions if act['type'] == 'CHI'), None)
@@ -384,7 +412,7 @@ def run_game():
                                 hand_tiles_for_chi = chi_action['hand_tiles_for_chi'] # Already validated by get_chi_hand_tiles_to_remove
                                 acting_player = gs.players[acting_player_idx]
 
-                                print(f"Player {acting_player_idx} CHIs {discarded_chi_tile} (using middle {middle_tile}, needs {hand_tiles_for_chi}) from P{gs.last_discarding_player_index}.", flush=True)
+                                log.debug("Player %s CHIs %s (using middle %s, needs %s) from P%s.", acting_player_idx, discarded_chi_tile, middle_tile, hand_tiles_for_chi, gs.last_discarding_player_index)
 
                                 for tile_to_remove in hand_tiles_for_chi:
                                     if tile_to_remove in acting_player.hand: acting_player.hand.remove(tile_to_remove)
@@ -397,26 +425,24 @@ def run_game():
                                 full_sequence_str = f"{suit}{mid_num-1}{suit}{mid_num}{suit}{mid_num+1}"
                                 acting_player.melds.append(('CHI', middle_tile, full_sequence_str, gs.last_discarding_player_index))
                                 acting_player.hand.sort()
-                                print(f"  P{acting_player_idx} hand after CHI: {acting_player.hand}, Melds: {acting_player.melds}", flush=True)
+                                log.debug("  P%s hand after CHI: %s, Melds: %s", acting_player_idx, acting_player.hand, acting_player.melds)
 
-                                print(f"SIM_DEBUG: P{acting_player_idx} hand before CHI discard decision ('{tile_to_play_after_chi}'): {acting_player.hand}", flush=True) # ADD THIS
+                                log.debug("SIM_DEBUG: P%s hand before CHI discard decision ('%s'): %s", acting_player_idx, tile_to_play_after_chi, acting_player.hand) # ADD THIS
                                 if tile_to_play_after_chi not in acting_player.hand:
                                     gs.end_game(error_message=f"P{acting_player_idx} CHI invalid discard {tile_to_play_after_chi}. Hand: {acting_player.hand}")
                                     processed_player_action_on_discard = True # Game ends
                                 else:
-                                    print(f"SIM_DEBUG: P{acting_player_idx} CHI discard is valid.", flush=True) # ADD THIS
+                                    log.debug("SIM_DEBUG: P%s CHI discard is valid.", acting_player_idx) # ADD THIS
                                     acting_player.hand.remove(tile_to_play_after_chi)
                                     acting_player.hand.sort()
                                     acting_player.discarded_tiles.append(tile_to_play_after_chi)
-                                    print(f"  P{acting_player_idx} then discards {tile_to_play_after_chi}. Hand: {acting_player.hand}", flush=True)
+                                    log.debug("  P%s then discards %s. Hand: %s", acting_player_idx, tile_to_play_after_chi, acting_player.hand)
 
                                     chi_broadcast_msg = f"3 {acting_player_idx} CHI {middle_tile} {tile_to_play_after_chi}" # BotIO: CHI middle_tile tile_discarded_after
-                                    new_responses = {}
-                                    for i in range(4):
-                                        if i == acting_player_idx: continue
-                                        gs.players[i].agent.send_request(chi_broadcast_msg)
-                                        new_responses[i] = gs.players[i].agent.receive_response()
-                                        print(f"    P{i} (Agent {gs.players[i].agent.agent_id}) response to CHI broadcast (P{acting_player_idx} played {tile_to_play_after_chi}): '{new_responses[i]}'", flush=True)
+                                    others = [i for i in range(4) if i != acting_player_idx]
+                                    new_responses = dict(zip(others, await broadcast([gs.players[i].agent for i in others], chi_broadcast_msg)))
+                                    for i in others:
+                                        log.debug("    P%s (Agent %s) response to CHI broadcast (P%s played %s): '%s'", i, gs.players[i].agent.agent_id, acting_player_idx, tile_to_play_after_chi, new_responses[i])
 
                                     gs.last_discarded_tile = tile_to_play_after_chi
                                     gs.last_discarding_player_index = acting_player_idx
@@ -428,15 +454,15 @@ def run_game():
 
                                 # Notify the acting agent (self) about its own CHI and PLAY
                                 acting_agent_for_chi = gs.players[acting_player_idx].agent
-                                print(f"Sim: Notifying P{acting_player_idx} (self) of CHI and PLAY: '{chi_broadcast_msg}'", flush=True)
+                                log.debug("Sim: Notifying P%s (self) of CHI and PLAY: '%s'", acting_player_idx, chi_broadcast_msg)
                                 acting_agent_for_chi.send_request(chi_broadcast_msg)
-                                self_response_chi = acting_agent_for_chi.receive_response()
-                                print(f"Sim: P{acting_player_idx} (self) response to CHI-PLAY notification: '{self_response_chi}'", flush=True)
+                                self_response_chi = await acting_agent_for_chi.receive_response()
+                                log.debug("Sim: P%s (self) response to CHI-PLAY notification: '%s'", acting_player_idx, self_response_chi)
                                 if self_response_chi.upper() != "PASS":
-                                    print(f"WARNING: P{acting_player_idx} (self) did not PASS after CHI-PLAY notification. Got: {self_response_chi}", flush=True)
+                                    log.warning("WARNING: P%s (self) did not PASS after CHI-PLAY notification. Got: %s", acting_player_idx, self_response_chi)
 
                 if not processed_player_action_on_discard and not gs.game_over: # No HU, KONG, PENG, or CHI was processed
-                    print(f"  All other players PASS on discarded tile {gs.last_discarded_tile} from P{gs.last_discarding_player_index}.", flush=True)
+                    log.debug("  All other players PASS on discarded tile %s from P%s.", gs.last_discarded_tile, gs.last_discarding_player_index)
                     gs.current_player_index = (gs.last_discarding_player_index + 1) % 4
                     gs.just_discarded = False
                     gs.last_discarded_tile = None # Clear only if no one acted.
@@ -462,7 +488,7 @@ def run_game():
                 # (gs.game_over already checked above)
                 if not processed_player_action_on_discard: # Should always be true if we reach here due to KONG/HU/PENG/CHI logic structure
                     # This implies everyone passed on the discard from gs.last_discarding_player_index
-                    print(f"  All other players PASS on discarded tile {gs.last_discarded_tile} from P{gs.last_discarding_player_index} (final check).", flush=True)
+                    log.debug("  All other players PASS on discarded tile %s from P%s (final check).", gs.last_discarded_tile, gs.last_discarding_player_index)
                     gs.current_player_index = (gs.last_discarding_player_index + 1) % 4
                     gs.just_discarded = False
                     gs.last_discarded_tile = None
@@ -473,29 +499,29 @@ def run_game():
 
             else: # Normal player turn: Draw a tile
                 gs.turn_number += 1
-                print(f"\n--- Turn {gs.turn_number}: Player {current_player_index} (Seat: {current_player.seat_wind}, AgentID: {current_agent.agent_id}) ---", flush=True)
-                print(f"Player {current_player_index} hand before normal draw: {current_player.hand}", flush=True)
+                log.debug("--- Turn %s: Player %s (Seat: %s, AgentID: %s) ---", gs.turn_number, current_player_index, current_player.seat_wind, current_agent.agent_id)
+                log.debug("Player %s hand before normal draw: %s", current_player_index, current_player.hand)
 
                 action_context_tile = gs.draw_tile(current_player_index) # This resets relevant flags
                 if action_context_tile is None:
-                    print("Wall is empty during normal draw. Game is a draw.", flush=True)
+                    log.info("Wall is empty during normal draw. Game is a draw.")
                     gs.end_game(is_draw=True, error_message="Wall empty on normal draw")
                     break
 
-                print(f"Player {current_player_index} draws normal tile: {action_context_tile}", flush=True)
+                log.debug("Player %s draws normal tile: %s", current_player_index, action_context_tile)
                 current_player.hand.append(action_context_tile)
                 current_player.hand.sort()
-                print(f"Player {current_player_index} hand after normal draw (before decision): {current_player.hand}", flush=True)
+                log.debug("Player %s hand after normal draw (before decision): %s", current_player_index, current_player.hand)
 
-                print(f"SIM_DEBUG: P{current_player_index} hand before agent decision (after draw {action_context_tile}): {current_player.hand}", flush=True) # ADD THIS
+                log.debug("SIM_DEBUG: P%s hand before agent decision (after draw %s): %s", current_player_index, action_context_tile, current_player.hand) # ADD THIS
                 request_str = f"2 {action_context_tile}"
                 # print(f"Player {current_player_index} hand: {current_player.hand}") # DEBUG
-                print(f"SIM_DEBUG: P{current_player_index} sending draw request: '{request_str}'", flush=True) # ADD THIS
+                log.debug("SIM_DEBUG: P%s sending draw request: '%s'", current_player_index, request_str) # ADD THIS
                 current_agent.send_request(request_str)
-                response_from_agent = current_agent.receive_response()
-                print(f"SIM_DEBUG: P{current_player_index} agent draw response: '{response_from_agent}'", flush=True) # ADD THIS
+                response_from_agent = await current_agent.receive_response()
+                log.debug("SIM_DEBUG: P%s agent draw response: '%s'", current_player_index, response_from_agent) # ADD THIS
                 # print(f"Player {current_player_index} response: {response_from_agent}") # DEBUG
-                print(f"Player {current_player_index} normal draw req: '{request_str}', Agent response: '{response_from_agent}'", flush=True)
+                log.debug("Player %s normal draw req: '%s', Agent response: '%s'", current_player_index, request_str, response_from_agent)
 
             # -------- COMMON RESPONSE PROCESSING BLOCK --------
             # This block processes responses from HU, PLAY, GANG, BUGANG that came from either a normal draw or a kong replacement draw
@@ -504,24 +530,24 @@ def run_game():
                 break
 
             # NEW DETAILED DEBUG FOR response_from_agent
-            print(f"DEBUG: P{current_player_index} - In COMMON RESPONSE PROCESSING BLOCK.", flush=True)
-            print(f"DEBUG: P{current_player_index} - response_from_agent = '{response_from_agent}' (type: {type(response_from_agent)})", flush=True)
+            log.debug("DEBUG: P%s - In COMMON RESPONSE PROCESSING BLOCK.", current_player_index)
+            log.debug("DEBUG: P%s - response_from_agent = '%s' (type: %s)", current_player_index, response_from_agent, type(response_from_agent))
             if response_from_agent is None:
                 # This should not happen if the logic for KONG/DISCARD/NORMAL states is correct and leads to a response
                 err_msg = f"P{current_player_index} missing agent response unexpectedly (not a discard evaluation cycle)."
-                print(f"CRITICAL LOGIC ERROR: {err_msg}. response_from_agent was None.", flush=True) # Added detail
+                log.error("CRITICAL LOGIC ERROR: %s. response_from_agent was None.", err_msg) # Added detail
                 gs.end_game(error_message=err_msg)
                 break
 
             current_player.hand.sort() # Ensure hand is sorted before printing or validation
-            print(f"Player {current_player_index} processing response: '{response_from_agent}' for action tile '{action_context_tile}'. Hand: {current_player.hand}", flush=True)
+            log.debug("Player %s processing response: '%s' for action tile '%s'. Hand: %s", current_player_index, response_from_agent, action_context_tile, current_player.hand)
 
             action_parts = response_from_agent.split()
             action_type = action_parts[0] if action_parts else "NO_ACTION"
 
             if action_type == "HU":
                 # Handles HU from drawn tile (normal or kong replacement)
-                print(f"Player {current_player_index} declares SELF-DRAWN HU with {action_context_tile}!", flush=True)
+                log.debug("Player %s declares SELF-DRAWN HU with %s!", current_player_index, action_context_tile)
                 gs.end_game(
                     winner_index=current_player_index,
                     winning_tile=action_context_tile,
@@ -533,7 +559,7 @@ def run_game():
             elif action_type == "PLAY":
                 if len(action_parts) < 2:
                     err_msg = f"P{current_player_index} PLAY action missing tile. Response: '{response_from_agent}'"
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg)
                     break
                 tile_played = action_parts[1]
@@ -541,7 +567,7 @@ def run_game():
                 # print(f"Player {current_player_index} played {tile_played}, hand: {current_player.hand}") # DEBUG
                 if tile_played not in current_player.hand:
                     err_msg = f"P{current_player_index} tried to play {tile_played} which is NOT in hand {current_player.hand} (action tile was: {action_context_tile})."
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg)
                     break
 
@@ -552,30 +578,19 @@ def run_game():
                 gs.last_discarding_player_index = current_player_index
                 gs.just_discarded = True # IMPORTANT: Set this flag for the next loop iteration
 
-                print(f"Player {current_player_index} plays tile: {tile_played}. Hand: {current_player.hand}", flush=True)
-
-                # Broadcast discard to other players
-                gs.current_action_responses = {}
-                for p_idx in range(4):
-                    if p_idx == current_player_index:
-                        continue
-                    other_player = gs.players[p_idx]
-                    other_agent = other_player.agent
-                    request_play_broadcast = f"3 {current_player_index} PLAY {tile_played}"
-                    other_agent.send_request(request_play_broadcast)
-                    response_broadcast = other_agent.receive_response()
-                    gs.current_action_responses[p_idx] = response_broadcast
-                    print(f"  P{p_idx} (Agent {other_agent.agent_id}) saw P{current_player_index} play {tile_played}. Agent response: '{response_broadcast}'", flush=True)
-
-                # Notify the acting agent about its own play so it can update its internal state
-                self_play_notification_req = f"3 {current_player_index} PLAY {tile_played}"
-                # print(f"Player {current_player_index} (acting agent) Sending self-notification of PLAY: '{self_play_notification_req}'", flush=True) # DEBUG
-                # The current_agent is already defined in this scope
-                current_agent.send_request(self_play_notification_req)
-                self_play_notification_resp = current_agent.receive_response()
-                # print(f"Player {current_player_index} (acting agent) Received response to self-notification: '{self_play_notification_resp}'", flush=True) # DEBUG
+                log.debug("Player %s plays tile: %s. Hand: %s", current_player_index, tile_played, current_player.hand)
+
+                # Broadcast discard to other players, and notify the acting agent about its own play
+                # so it can update its internal state. The four responses are awaited together.
+                request_play_broadcast = f"3 {current_player_index} PLAY {tile_played}"
+                others = [p_idx for p_idx in range(4) if p_idx != current_player_index]
+                responses = await broadcast([gs.players[p_idx].agent for p_idx in others] + [current_agent], request_play_broadcast)
+                gs.current_action_responses = dict(zip(others, responses))
+                for p_idx in others:
+                    log.debug("  P%s (Agent %s) saw P%s play %s. Agent response: '%s'", p_idx, gs.players[p_idx].agent.agent_id, current_player_index, tile_played, gs.current_action_responses[p_idx])
+                self_play_notification_resp = responses[-1]
                 if self_play_notification_resp.upper() != "PASS":
-                    print(f"WARNING: Player {current_player_index} (acting agent) did not respond with PASS to self-play notification. Got: {self_play_notification_resp}", flush=True)
+                    log.warning("WARNING: Player %s (acting agent) did not respond with PASS to self-play notification. Got: %s", current_player_index, self_play_notification_resp)
                     # Decide if this should be a critical error or just a warning.
                     # For now, a warning, as the agent's __main__.py should handle this by printing PASS.
                 # The next iteration of the main while loop will handle gs.just_discarded = True
@@ -583,14 +598,14 @@ def run_game():
             elif action_type == "GANG": # AnGang from drawn tile (normal or kong replacement)
                 if len(action_parts) < 2:
                     err_msg = f"P{current_player_index} GANG action missing tile. Response: '{response_from_agent}'"
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg)
                     break
                 tile_kong = action_parts[1]
 
                 if current_player.hand.count(tile_kong) != 4: # Action_context_tile was already added
                     err_msg = f"P{current_player_index} declared GANG {tile_kong} but hand count is {current_player.hand.count(tile_kong)} (requires 4). Hand: {current_player.hand} (action tile was: {action_context_tile})"
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg)
                     break
 
@@ -598,20 +613,19 @@ def run_game():
                     current_player.hand.remove(tile_kong)
                 current_player.hand.sort()
                 current_player.melds.append(('ANGANG', tile_kong, current_player_index))
-                print(f"Player {current_player_index} declares ANGANG with {tile_kong}. Hand: {current_player.hand}. Melds: {current_player.melds}", flush=True)
+                log.debug("Player %s declares ANGANG with %s. Hand: %s. Melds: %s", current_player_index, tile_kong, current_player.hand, current_player.melds)
 
                 # --- Broadcast AnGang to all players (including self) ---
                 an_gang_req_str = f"3 {current_player_index} GANG {tile_kong}" # BotIO: GANG <tile> for AnGang
-                print(f"Sim: Broadcasting AnGang notification: '{an_gang_req_str}'", flush=True)
-                for notify_p_idx in range(4):
+                log.debug("Sim: Broadcasting AnGang notification: '%s'", an_gang_req_str)
+                an_gang_resps = await broadcast([player.agent for player in gs.players], an_gang_req_str)
+                for notify_p_idx, resp in enumerate(an_gang_resps):
                     notified_agent = gs.players[notify_p_idx].agent
-                    notified_agent.send_request(an_gang_req_str)
-                    resp = notified_agent.receive_response()
-                    print(f"  P{notify_p_idx} (Agent {notified_agent.agent_id}) response to AnGang broadcast from P{current_player_index} of {tile_kong}: '{resp}'", flush=True)
+                    log.debug("  P%s (Agent %s) response to AnGang broadcast from P%s of %s: '%s'", notify_p_idx, notified_agent.agent_id, current_player_index, tile_kong, resp)
                     if notify_p_idx == current_player_index and resp.upper() != "PASS":
-                        print(f"WARNING: P{current_player_index} (self) did not PASS after AnGang self-notification. Got: {resp}", flush=True)
+                        log.warning("WARNING: P%s (self) did not PASS after AnGang self-notification. Got: %s", current_player_index, resp)
                     elif notify_p_idx != current_player_index and resp.upper() != "PASS":
-                         print(f"WARNING: P{notify_p_idx} did not PASS after AnGang notification for P{current_player_index}. Got: {resp}", flush=True)
+                         log.warning("WARNING: P%s did not PASS after AnGang notification for P%s. Got: %s", notify_p_idx, current_player_index, resp)
                 # --- End AnGang Broadcast ---
 
                 gs.just_declared_kong = True # Player will draw replacement in next iteration
@@ -620,13 +634,13 @@ def run_game():
             elif action_type == "BUGANG":
                 if len(action_parts) < 2:
                     err_msg = f"P{current_player_index} BUGANG action missing tile. Response: '{response_from_agent}'"
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg); break
                 tile_kong = action_parts[1]
 
                 if tile_kong != action_context_tile: # BuGang must use the drawn tile (or tile just added to hand)
                     err_msg = f"P{current_player_index} BUGANG tile {tile_kong} must be the action context tile {action_context_tile}."
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg); break
 
                 # Find the PENG meld to upgrade
@@ -643,7 +657,7 @@ def run_game():
 
                 if not peng_meld_to_upgrade:
                     err_msg = f"P{current_player_index} declared BUGANG {tile_kong} but no corresponding PENG found. Melds: {current_player.melds}"
-                    print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                    log.error("CRITICAL ERROR: %s", err_msg)
                     gs.end_game(error_message=err_msg); break
 
                 # Temporarily update meld to BUGANG for broadcast and QGH check
@@ -651,19 +665,17 @@ def run_game():
                 current_player.melds[peng_meld_idx] = ('BUGANG', tile_kong, original_peng_from_idx, None)
                 current_player.hand.remove(tile_kong) # Tile is now part of the meld
                 current_player.hand.sort()
-                print(f"Player {current_player_index} declares BUGANG with {tile_kong}. Hand: {current_player.hand}, Melds: {current_player.melds}", flush=True)
+                log.debug("Player %s declares BUGANG with %s. Hand: %s, Melds: %s", current_player_index, tile_kong, current_player.hand, current_player.melds)
 
                 gs.about_to_BUGANG_tile = tile_kong
                 gs.last_discarding_player_index = current_player_index # Player attempting BuGang
                 gs.current_action_responses.clear()
 
                 bugang_broadcast_msg = f"3 {current_player_index} BUGANG {tile_kong}"
-                for p_idx in range(4):
-                    if p_idx == current_player_index: continue
-                    gs.players[p_idx].agent.send_request(bugang_broadcast_msg)
-                    response_qgh = gs.players[p_idx].agent.receive_response()
+                others = [p_idx for p_idx in range(4) if p_idx != current_player_index]
+                for p_idx, response_qgh in zip(others, await broadcast([gs.players[p_idx].agent for p_idx in others], bugang_broadcast_msg)):
                     gs.current_action_responses[p_idx] = response_qgh
-                    print(f"  P{p_idx} response to P{current_player_index}'s BUGANG of {tile_kong}: '{response_qgh}'", flush=True)
+                    log.debug("  P%s response to P%s's BUGANG of %s: '%s'", p_idx, current_player_index, tile_kong, response_qgh)
 
                 gs.pending_qiangganghu_check = True
                 # current_player_index remains current_player_index to see if QGH happens or if they get to draw replacement.
@@ -672,7 +684,7 @@ def run_game():
 
             else: # Unexpected action
                 err_msg = f"P{current_player_index} responded with unexpected action '{response_from_agent}' after action on tile '{action_context_tile}'. Expected PLAY, GANG, BUGANG, or HU."
-                print(f"CRITICAL ERROR: {err_msg}", flush=True)
+                log.error("CRITICAL ERROR: %s", err_msg)
                 gs.end_game(error_message=err_msg)
                 # Loop will terminate as gs.game_over is True
 
@@ -681,19 +693,19 @@ def run_game():
 
             # Turn limit condition
             if gs.turn_number >= 80 and not gs.game_over:
-                print("Turn limit (80) reached.", flush=True)
+                log.info("Turn limit (80) reached.")
                 gs.end_game(is_draw=True, error_message="Turn limit reached")
                 # Loop will terminate due to gs.game_over
 
-        print("\n--- Main Game Loop Ended ---", flush=True)
+        log.debug("--- Main Game Loop Ended ---")
 
         # --- Print Game Over Information ---
-        print("\n--- Game Over ---", flush=True)
+        log.debug("--- Game Over ---")
         if gs.error_message:
-            print(f"Game ended due to an error: {gs.error_message}", flush=True)
+            log.warning("Game ended due to an error: %s", gs.error_message)
         elif gs.winner_index is not None:
-            print(f"Player {gs.winner_index} is the winner!", flush=True)
-            if gs.winning_tile: print(f"Winning Tile: {gs.winning_tile}", flush=True)
+            log.info("Player %s is the winner!", gs.winner_index)
+            if gs.winning_tile: log.info("Winning Tile: %s", gs.winning_tile)
 
             win_type_str = "UNKNOWN"
             if gs.is_self_drawn_win:
@@ -706,42 +718,78 @@ def run_game():
                 win_type_str = "Robbing the Kong (Qiang Gang Hu)"
             elif gs.last_discarding_player_index is not None: # Check if it's a discard win
                 win_type_str = f"Win by Discard from Player {gs.last_discarding_player_index}"
-            print(f"Type: {win_type_str}", flush=True)
+            log.info("Type: %s", win_type_str)
 
             if gs.win_details:
-                print("Fan Breakdown:", flush=True)
+                log.info("Fan Breakdown:")
                 total_fan_calc = 0
                 for points, count, name_zh, name_en in gs.win_details:
-                    print(f"  - {name_zh} ({name_en}): {points} Fan x {count}", flush=True)
+                    log.info("  - %s (%s): %s Fan x %s", name_zh, name_en, points, count)
                     total_fan_calc += points * count
-                print(f"Total Fan Points (from calculator): {total_fan_calc}", flush=True)
+                log.info("Total Fan Points (from calculator): %s", total_fan_calc)
         else: # No winner_index and no error_message means a draw
-            print("Game ended in a draw (e.g., wall empty or turn limit).", flush=True)
+            log.info("Game ended in a draw (e.g., wall empty or turn limit).")
 
-        print("\nFinal Scores:", flush=True)
+        log.info("Final Scores:")
         for i in range(4):
             # Use final_scores if populated by end_game, otherwise current player scores (e.g. if error before scoring)
             player_score = gs.final_scores.get(i, gs.players[i].score)
-            print(f"  Player {i}: {player_score} points", flush=True)
+            log.info("  Player %s: %s points", i, player_score)
+        event("game_end", winner=gs.winner_index, winning_tile=gs.winning_tile, self_drawn=gs.is_self_drawn_win, error=gs.error_message,
+              scores=[gs.final_scores.get(i, gs.players[i].score) for i in range(4)], fans=[[name_en, points, count] for points, count, name_zh, name_en in gs.win_details or []])
         # --- End of Game Over Information ---
 
     except Exception as e:
-        print(f"An error occurred during the game: {e}", flush=True)
-        # Print traceback for more details
-        import traceback
-        traceback.print_exc()
+        log.exception("An error occurred during the game: %s", e)
+    return gs
+
+async def run_game_async(pool: AsyncAgentPool, tile_wall: Optional[List[str]] = None, seats: Optional[List[int]] = None) -> Optional[GameState]:
+    # one game on the AsyncAgents of pool, same arguments and result as run_game
+    try:
+        agents = await pool.acquire()
+        return await play_game(agents if seats is None else [agents[i] for i in seats], tile_wall)
+    except Exception as e:
+        log.exception("An error occurred during the game: %s", e)
+        return None
+
+async def run_games_async(pools: List[AsyncAgentPool], games: List[Tuple[Optional[List[str]], Optional[List[int]]]]) -> List[Optional[GameState]]:
+    # plays the (tile_wall, seats) games in one event loop, every pool runs one game at a time
+    results: List[Optional[GameState]] = [None] * len(games)
+    next_game = iter(range(len(games)))
+    async def play(pool):
+        for i in next_game:
+            results[i] = await run_game_async(pool, *games[i])
+    await asyncio.gather(*(play(pool) for pool in pools))
+    return results
+
+async def main_async(games: int, concurrency: int, timeout: Optional[float]):
+    pools = [AsyncAgentPool(timeout=timeout) for _ in range(min(concurrency, games))]
+    try:
+        await run_games_async(pools, [(None, None)] * games)
     finally:
-        # 5. Agent Cleanup
-        print("\nClosing agent processes...")
-        sys.stdout.flush()
-        for i, agent_proc in enumerate(agents):
-            if agent_proc: # Check if agent was successfully created
-                print(f"Closing agent {i}...")
-                sys.stdout.flush()
-                agent_proc.close()
-                print(f"Agent {i} closed.")
-                sys.stdout.flush()
-        print("All agent processes closed.")
+        await asyncio.gather(*(pool.close() for pool in pools))
 
 if __name__ == "__main__":
-    run_game()
+    parser = argparse.ArgumentParser(description="Mahjong simulator")
+    parser.add_argument("agent_mode", nargs="?", default="process", choices=["process", "inprocess", "async"], help="bots as subprocesses, in this process or as asyncio subprocesses")
+    parser.add_argument("games", nargs="?", type=int, default=1, help="number of games, agents are reused across games")
+    parser.add_argument("--concurrency", type=int, default=4, help="async mode: games played at the same time in one event loop")
+    parser.add_argument("--timeout", type=float, default=10.0, help="async mode: seconds an agent may take for a response")
+    parser.add_argument("--log_level", type=str, default=None, help="DEBUG (full trace), INFO (results), WARNING or OFF; default DEBUG for one game, OFF for batch runs")
+    parser.add_argument("--quiet", action="store_true", help="no console output")
+    parser.add_argument("--log_jsonl", type=str, default=None, help="append log records and game events to this JSONL file")
+    args = parser.parse_args()
+    # batch runs are silent unless a level is asked for
+    log_level = args.log_level or ("DEBUG" if args.games == 1 and args.agent_mode != "async" else "OFF")
+    sim_log.configure(log_level, console=not args.quiet, jsonl=args.log_jsonl)
+    if args.agent_mode == "async":
+        asyncio.run(main_async(args.games, args.concurrency, args.timeout))
+    elif args.games == 1:
+        run_game(args.agent_mode)
+    else:
+        pool = AgentPool(args.agent_mode)
+        try:
+            for game in range(args.games):
+                run_game(args.agent_mode, pool)
+        finally:
+            pool.close()
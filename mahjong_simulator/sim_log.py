@@ -0,0 +1,96 @@
+import logging
+import logging.handlers
+import atexit
+import queue
+import json
+import sys
+from typing import Optional
+
+'''
+Logging of the simulator. Modules log through `log` with lazy %-style arguments, so disabled
+levels cost one level check. Nothing is written until configure() is called (batch runs stay
+silent), then the calling thread only puts records on a queue and a QueueListener thread writes
+them to the console and/or a JSONL file. The JSONL file is written with a large buffer and only
+flushed on close, one object per record: time, level, message and, for records logged with
+event(), the event name and its fields.
+'''
+
+log = logging.getLogger('mahjong_simulator')
+log.addHandler(logging.NullHandler())
+log.propagate = False
+log.setLevel(logging.WARNING)
+
+OFF = logging.CRITICAL + 1
+listener: Optional[logging.handlers.QueueListener] = None
+
+class JsonlHandler(logging.Handler):
+
+    def __init__(self, path: str, buffering: int = 1 << 20):
+        super().__init__()
+        self.file = open(path, 'a', encoding = 'UTF-8', buffering = buffering)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            entry = {'time': record.created, 'level': record.levelname, 'msg': record.getMessage()}
+            if hasattr(record, 'event'):
+                entry['event'] = record.event
+                entry.update(record.fields)
+            self.file.write(json.dumps(entry, ensure_ascii = False, default = str) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+def event(name: str, level: int = logging.INFO, **fields):
+    # structured record: the console gets 'name key=value ...', the JSONL sink the fields themselves
+    if log.isEnabledFor(level):
+        msg = ' '.join([name] + ['%s=%s' % (k, v) for k, v in fields.items()])
+        log.log(level, msg, extra = {'event': name, 'fields': fields})
+
+def flush():
+    # drain the queue and flush the sinks, for processes that do not run atexit (pool workers)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers: handler.flush()
+        listener.start()
+
+def stop():
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers: handler.close()
+        listener = None
+    for handler in log.handlers[:]:
+        if not isinstance(handler, logging.NullHandler):
+            log.removeHandler(handler)
+
+def configure(level: Optional[str] = 'INFO', console: bool = True, jsonl: Optional[str] = None):
+    '''
+    level: logging level name, None or 'OFF' for silent
+    console: write messages to stdout
+    jsonl: path of the JSONL event file, appended to
+    '''
+    stop()
+    if level is None or level.upper() == 'OFF' or not (console or jsonl):
+        log.setLevel(OFF)
+        return
+    log.setLevel(level.upper())
+    handlers = []
+    if console:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handlers.append(handler)
+    if jsonl:
+        handlers.append(JsonlHandler(jsonl))
+    records = queue.SimpleQueue()
+    global listener
+    listener = logging.handlers.QueueListener(records, *handlers)
+    log.addHandler(logging.handlers.QueueHandler(records))
+    listener.start()
+
+atexit.register(stop)
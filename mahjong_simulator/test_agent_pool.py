@@ -0,0 +1,87 @@
+from game_utils import AgentPool, AsyncAgentPool, BASE_BOT_DIR
+import pytest
+import asyncio
+import sys
+import os
+
+# A pool must keep its agents across a game ending in a HU notice: the bots answer the next
+# NEWGAME with OK and nothing is restarted. An agent that died is restarted, and only that one.
+# Uses a freshly initialized model.
+
+sys.path.insert(0, BASE_BOT_DIR)
+from model import ResMahjongModel
+import torch
+
+HAND = "W1 W1 W1 W2 W2 W2 W3 W3 W3 W4 W4 W4 W5"
+REQUESTS = [["0 %d 0" % i, "1 0 0 0 0 " + HAND] for i in range(4)]
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("model") / "model.pkl")
+    torch.save(ResMahjongModel().state_dict(), path)
+    return path
+
+def play_until_hu(agents):
+    for agent, requests in zip(agents, REQUESTS):
+        for request in requests:
+            agent.send_request(request)
+            assert agent.receive_response() == "PASS"
+    for agent in agents: agent.send_request("3 1 HU")
+
+async def play_until_hu_async(agents):
+    for agent, requests in zip(agents, REQUESTS):
+        for request in requests:
+            agent.send_request(request)
+            assert await agent.receive_response() == "PASS"
+    for agent in agents: agent.send_request("3 1 HU")
+
+@pytest.mark.parametrize("mode", ["inprocess", "process"])
+def test_pool_keeps_agents_after_hu(model_path, mode):
+    pool = AgentPool(mode, model_paths=[model_path] * 4)
+    try:
+        for game in range(2):
+            play_until_hu(pool.acquire())
+        pool.acquire()
+        assert pool.restarts == 0
+    finally:
+        pool.close()
+
+def test_pool_restarts_killed_agent(model_path):
+    pool = AgentPool("process", model_paths=[model_path] * 4)
+    try:
+        agents = list(pool.acquire())
+        agents[2].process.kill()
+        agents[2].process.wait()
+        new_agents = pool.acquire()
+        assert pool.restarts == 1
+        assert [a is b for a, b in zip(agents, new_agents)] == [True, True, False, True]
+        play_until_hu(new_agents)
+    finally:
+        pool.close()
+
+def test_async_pool_keeps_agents_after_hu(model_path):
+    async def run():
+        pool = AsyncAgentPool(model_paths=[model_path] * 4, timeout=30)
+        try:
+            for game in range(2):
+                await play_until_hu_async(await pool.acquire())
+            await pool.acquire()
+            return pool.restarts
+        finally:
+            await pool.close()
+    assert asyncio.run(run()) == 0
+
+def test_async_pool_restarts_killed_agent(model_path):
+    async def run():
+        pool = AsyncAgentPool(model_paths=[model_path] * 4, timeout=30)
+        try:
+            agents = list(await pool.acquire())
+            agents[2].process.kill()
+            await agents[2].process.wait()
+            new_agents = await pool.acquire()
+            assert pool.restarts == 1
+            assert [a is b for a, b in zip(agents, new_agents)] == [True, True, False, True]
+            await play_until_hu_async(new_agents)
+        finally:
+            await pool.close()
+    asyncio.run(run())
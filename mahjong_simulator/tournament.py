@@ -0,0 +1,183 @@
+from game_utils import AgentPool, AsyncAgentPool, ALL_TILES
+from main import run_game, run_games_async
+from multiprocessing import Pool
+from typing import Optional, List, Dict, Any
+import sim_log
+import argparse
+import asyncio
+import random
+import json
+import math
+import os
+
+'''
+Plays many independent games in a process pool and aggregates the results.
+
+The four entrants are the models given by --models (cycled to four, so two models sit
+a b a b). Every wall is a shuffle seeded by (--seed, wall number) and is played --rotations
+times: rotation r seats entrant (seat + wall + r) % 4 at each seat, so with --rotations 4 every
+entrant plays every seat of the same wall (duplicate games) and with --rotations 1 seats still
+rotate from wall to wall. Games are sent to the workers --games_per_worker at a time, every
+worker keeps one AgentPool for all of its games. With --agent_mode async a worker instead keeps
+--concurrency AsyncAgentPools on its own event loop and plays that many games at the same time.
+Every worker, or every bot it starts, runs torch with --threads_per_worker threads.
+
+The results file holds per-entrant score statistics (mean, standard error, wins, self-drawn
+wins, deal-ins), the paired score difference of every two entrants, outcome counts, fan statistics
+of the winning hands and one record per game. The games of a wall are not independent (duplicate
+walls, an entrant holding two seats of a zero-sum game), so the wall is the sample: an entrant's
+score on a wall is its mean score per seat over all games of the wall, and means, standard errors
+and differences are taken over walls.
+'''
+
+worker_pool: Optional[AgentPool] = None
+worker_async_pools: List[AsyncAgentPool] = []
+worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def init_worker(agent_mode: str, model_paths: List[str], log_level: str, log_jsonl: Optional[str], concurrency: int, timeout: float, threads: int):
+    global worker_pool, worker_async_pools, worker_loop
+    # workers already use every core, torch's default of one thread per core would oversubscribe them
+    os.environ['OMP_NUM_THREADS'] = str(threads) # bots started by this worker
+    if agent_mode == 'inprocess':
+        import torch
+        torch.set_num_threads(threads)
+    # every worker appends to its own JSONL file
+    sim_log.configure(log_level, console = False, jsonl = log_jsonl and '%s.%d' % (log_jsonl, os.getpid()))
+    if agent_mode == 'async':
+        # the agents' subprocess transports belong to this loop, it is kept for all tasks
+        worker_loop = asyncio.new_event_loop()
+        worker_async_pools = [AsyncAgentPool(model_paths = model_paths, timeout = timeout) for i in range(concurrency)]
+    else:
+        worker_pool = AgentPool(agent_mode, model_paths = model_paths)
+
+def make_wall(seed: int, wall: int) -> List[str]:
+    tile_wall = list(ALL_TILES)
+    random.Random('%d-%d' % (seed, wall)).shuffle(tile_wall)
+    return tile_wall
+
+def outcome(gs) -> str:
+    if gs is None: return 'error'
+    if gs.error_message is None: return 'win' if gs.winner_index is not None else 'draw'
+    if 'Chombo' in gs.error_message: return 'chombo'
+    if gs.error_message.startswith('Wall empty') or gs.error_message == 'Turn limit reached': return 'draw'
+    return 'error'
+
+def play_games(games: List[tuple]) -> List[Dict[str, Any]]:
+    # games: (wall, rotation, seed, agent_mode) tuples -> one record per game
+    seatings = [[(seat + wall + rotation) % 4 for seat in range(4)] for wall, rotation, seed, agent_mode in games]
+    if worker_loop is not None:
+        results = worker_loop.run_until_complete(run_games_async(worker_async_pools, [(make_wall(seed, wall), seats) for (wall, rotation, seed, agent_mode), seats in zip(games, seatings)]))
+    else:
+        results = [run_game(agent_mode, worker_pool, make_wall(seed, wall), seats) for (wall, rotation, seed, agent_mode), seats in zip(games, seatings)]
+    records = []
+    for (wall, rotation, seed, agent_mode), seats, gs in zip(games, seatings, results):
+        record = {'wall': wall, 'rotation': rotation, 'seats': seats, 'outcome': outcome(gs)}
+        if gs is not None:
+            record['scores'] = [gs.final_scores.get(i, gs.players[i].score) for i in range(4)]
+            record['winner'] = gs.winner_index
+            record['error'] = gs.error_message
+            if record['outcome'] == 'win':
+                record['self_drawn'] = gs.is_self_drawn_win
+                record['payer'] = None if gs.is_self_drawn_win else gs.last_discarding_player_index
+                record['fans'] = [[name_en, points, count] for points, count, name_zh, name_en in gs.win_details or []]
+        records.append(record)
+    sim_log.flush()
+    return records
+
+def mean_stderr(xs: List[float]):
+    n = len(xs)
+    mean = sum(xs) / n if n else 0.0
+    var = sum((x - mean) ** 2 for x in xs) / (n - 1) if n > 1 else 0.0
+    return mean, math.sqrt(var / n) if n else 0.0
+
+def aggregate(records: List[Dict[str, Any]], entrants: List[str]) -> Dict[str, Any]:
+    # entrants: model of each agent, agents sharing a model are counted together
+    stats = {name : {'seats': 0, 'score': 0, 'wins': 0, 'self_drawn': 0, 'deal_ins': 0, 'chombos': 0} for name in entrants}
+    walls = {} # wall -> name -> [score, seats]
+    outcomes = {}
+    fans = {}
+    fan_totals = []
+    for record in records:
+        outcomes[record['outcome']] = outcomes.get(record['outcome'], 0) + 1
+        if 'scores' not in record: continue
+        wall = walls.setdefault(record['wall'], {})
+        for seat, agent in enumerate(record['seats']):
+            s = stats[entrants[agent]]
+            s['seats'] += 1
+            s['score'] += record['scores'][seat]
+            w = wall.setdefault(entrants[agent], [0, 0])
+            w[0] += record['scores'][seat]
+            w[1] += 1
+        if record['outcome'] == 'chombo':
+            stats[entrants[record['seats'][record['winner']]]]['chombos'] += 1
+        if record['outcome'] == 'win':
+            s = stats[entrants[record['seats'][record['winner']]]]
+            s['wins'] += 1
+            if record['self_drawn']: s['self_drawn'] += 1
+            elif record['payer'] is not None: stats[entrants[record['seats'][record['payer']]]]['deal_ins'] += 1
+            fan_totals.append(sum(points * count for name, points, count in record['fans']))
+            for name, points, count in record['fans']:
+                fans[name] = fans.get(name, 0) + count
+    # per-wall mean score per seat of every entrant
+    wall_scores = {name : {k : w[name][0] / w[name][1] for k, w in walls.items() if name in w} for name in stats}
+    for name, s in stats.items():
+        s['walls'] = len(wall_scores[name])
+        s['mean'], s['stderr'] = mean_stderr(list(wall_scores[name].values()))
+        s['win_rate'] = s['wins'] / s['seats'] if s['seats'] else 0.0
+    # paired difference on the walls both entrants played
+    names = list(stats)
+    pairs = {}
+    for i, a in enumerate(names):
+        for b in names[i + 1 :]:
+            diffs = [wall_scores[a][k] - wall_scores[b][k] for k in wall_scores[a] if k in wall_scores[b]]
+            mean, stderr = mean_stderr(diffs)
+            pairs['%s - %s' % (a, b)] = {'a': a, 'b': b, 'walls': len(diffs), 'mean': mean, 'stderr': stderr}
+    return {
+        'games': len(records),
+        'entrants': stats,
+        'pairs': pairs,
+        'outcomes': outcomes,
+        'fan_mean': sum(fan_totals) / len(fan_totals) if fan_totals else 0.0,
+        'fan_totals': {str(k) : fan_totals.count(k) for k in sorted(set(fan_totals))},
+        'fans': dict(sorted(fans.items(), key = lambda x: -x[1]))
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mahjong simulator tournament')
+    parser.add_argument('--models', type=str, nargs='+', default=[os.path.join('base_bot', 'model', 'model.pkl')], help='model of each entrant, cycled to four seats')
+    parser.add_argument('--walls', type=int, default=100, help='number of tile walls')
+    parser.add_argument('--rotations', type=int, default=4, choices=[1, 2, 3, 4], help='seat rotations played on every wall')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the walls')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--threads_per_worker', type=int, default=1, help='torch threads of every worker or bot')
+    parser.add_argument('--games_per_worker', type=int, default=16, help='games sent to a worker at a time')
+    parser.add_argument('--agent_mode', type=str, default='inprocess', choices=['process', 'inprocess', 'async'], help='bots as subprocesses, in the worker or as asyncio subprocesses')
+    parser.add_argument('--concurrency', type=int, default=4, help='async mode: games in flight per worker')
+    parser.add_argument('--timeout', type=float, default=10.0, help='async mode: seconds an agent may take for a response')
+    parser.add_argument('--output', type=str, default='tournament.json', help='results file')
+    parser.add_argument('--log_level', type=str, default='OFF', help='log level of the workers, OFF for none')
+    parser.add_argument('--log_jsonl', type=str, default=None, help='worker logs go to this path + .<pid> as JSONL')
+    args = parser.parse_args()
+
+    entrants = [os.path.abspath(args.models[i % len(args.models)]) for i in range(4)]
+    games = [(wall, rotation, args.seed, args.agent_mode) for wall in range(args.walls) for rotation in range(args.rotations)]
+    tasks = [games[i : i + args.games_per_worker] for i in range(0, len(games), args.games_per_worker)]
+
+    records = []
+    with Pool(args.workers, initializer = init_worker, initargs = (args.agent_mode, entrants, args.log_level, args.log_jsonl, args.concurrency, args.timeout, args.threads_per_worker)) as pool:
+        for result in pool.imap_unordered(play_games, tasks):
+            records.extend(result)
+            print('%d / %d games' % (len(records), len(games)), flush = True)
+    records.sort(key = lambda r: (r['wall'], r['rotation']))
+
+    results = aggregate(records, entrants)
+    results['config'] = vars(args)
+    results['records'] = records
+    with open(args.output + '.tmp', 'w') as f:
+        json.dump(results, f)
+    os.replace(args.output + '.tmp', args.output)
+    for name, s in results['entrants'].items():
+        print('%s: mean %.2f +- %.2f per seat over %d walls, win rate %.3f, deal-ins %d' % (name, s['mean'], 1.96 * s['stderr'], s['walls'], s['win_rate'], s['deal_ins']))
+    for pair in results['pairs'].values():
+        print('%s - %s: %.2f +- %.2f per seat over %d paired walls' % (pair['a'], pair['b'], pair['mean'], 1.96 * pair['stderr'], pair['walls']))
+    print('Outcomes %s, mean fan %.1f' % (results['outcomes'], results['fan_mean']))